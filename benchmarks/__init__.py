@@ -0,0 +1,5 @@
+import os
+import sys
+
+HERE: str = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src', 'py9'))
@@ -0,0 +1,73 @@
+from benchmarks import bench_codec, bench_exportfs, bench_loopback
+from benchmarks.runner import Results, compare
+
+import argparse
+import json
+import sys
+
+
+SUITES: dict = {
+    'codec': bench_codec.run,
+    'loopback': bench_loopback.run,
+    'exportfs': bench_exportfs.run,
+}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description='Py9 codec, loopback and exportfs benchmarks')
+    parser.add_argument(
+        'suites', nargs='*', metavar='suite',
+        help=f'one of {", ".join(SUITES)} (default: all)')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--baseline', help='compare against saved results')
+    parser.add_argument(
+        '--threshold', type=float, default=0.10,
+        help='relative slowdown reported as a regression')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument(
+        '--min-time', type=float, default=0.05,
+        help='seconds per timed run of a microbenchmark')
+    parser.add_argument(
+        '--payload', type=int, default=8192,
+        help='bytes in Rread/Twrite samples')
+    parser.add_argument(
+        '--entries', type=int, default=1000,
+        help='entries in the sample directory listing')
+    parser.add_argument(
+        '--msizes', type=lambda s: [int(x) for x in s.split(',')],
+        default=[65536, 1 << 20, 8 << 20])
+    parser.add_argument('--size', type=int, default=64, help='MiB')
+    parser.add_argument('--window', type=int, default=8)
+    parser.add_argument('--files', type=int, default=1000)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument(
+        '--duration', type=float, default=3.0,
+        help='seconds per timed loopback run')
+    args = parser.parse_args()
+    for name in args.suites:
+        if name not in SUITES:
+            parser.error(f'unknown suite {name}')
+
+    results = Results()
+    for name in args.suites or SUITES:
+        SUITES[name](results, args)
+
+    current: dict = results.to_json()
+    if args.json:
+        results.save(args.json)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline: dict = json.load(f)
+        regressions: list[str] = compare(current, baseline, args.threshold)
+        if regressions:
+            print(f'\n{len(regressions)} regression(s) beyond '
+                  f'{args.threshold:.0%}')
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+from benchmarks.runner import Results, per_call
+
+from codec import HEADER_LEN, MESSAGES
+from columnar import decode_listing
+from qid import Qid
+from stat9 import DirEntry, Stat
+
+import argparse
+
+
+STRINGS: dict[str, str] = {
+    'version': '9P2000',
+    'ename': 'file not found',
+    'name': 'README.md',
+}
+
+
+def sample_stat(index: int = 0) -> Stat:
+    return Stat(
+        0,
+        0,
+        0,
+        Qid(0, 1, index),
+        0o644,
+        1700000000,
+        1700000000,
+        4096,
+        f'file{index:06}.txt',
+        'glenda',
+        'sys',
+        'glenda',
+    )
+
+
+def sample(name: str, kind: str, payload: bytes):
+    match kind:
+        case 'B':
+            return 0
+        case 'H' | 'I':
+            return 1
+        case 'Q':
+            return 1 << 20
+        case 's':
+            return STRINGS.get(name, 'glenda')
+        case 'qid':
+            return Qid(0, 1, 2)
+        case 'strs':
+            return ['usr', 'glenda', 'lib', 'profile']
+        case 'qids':
+            return [Qid(0x80, 1, 2), Qid(0x80, 1, 3), Qid(0, 1, 4)]
+        case 'data':
+            return payload
+        case 'stat':
+            return sample_stat()
+
+    raise Exception(f'No sample for field kind {kind}')
+
+
+def run(results: Results, args: argparse.Namespace) -> None:
+    timing: dict = {'repeat': args.repeat, 'min_time': args.min_time}
+    payload: bytes = bytes(args.payload)
+
+    for _type, message in MESSAGES.items():
+        values: list = [
+            sample(name, kind, payload) for name, kind in message.fields
+        ]
+        encode = message.encode
+        decode = message.decode
+        body: memoryview = memoryview(encode(1, *values))[HEADER_LEN:]
+
+        results.add(
+            f'codec.encode.{_type.name}',
+            per_call(lambda: encode(1, *values), **timing),
+            'ns',
+            False,
+        )
+        results.add(
+            f'codec.decode.{_type.name}',
+            per_call(lambda: decode(body), **timing),
+            'ns',
+            False,
+        )
+
+    qid: Qid = Qid(0, 1, 2)
+    raw_qid: bytes = qid.to_bytes()
+    results.add('qid.to_bytes', per_call(qid.to_bytes, **timing), 'ns', False)
+    results.add(
+        'qid.from_bytes',
+        per_call(lambda: Qid.from_bytes(raw_qid), **timing),
+        'ns',
+        False,
+    )
+
+    stat: Stat = sample_stat()
+    raw_stat: bytes = stat.to_bytes()
+    results.add(
+        'stat.to_bytes',
+        per_call(stat.to_bytes, **timing),
+        'ns',
+        False,
+    )
+    results.add(
+        'stat.from_bytes',
+        per_call(lambda: Stat.from_bytes(raw_stat), **timing),
+        'ns',
+        False,
+    )
+
+    # Directory decoders are reported per entry of a listing.
+    count: int = args.entries
+    listing: bytes = b''.join(
+        sample_stat(i).to_bytes() for i in range(count)
+    )
+    for name, fn in (
+            ('stat.decode_many', lambda: Stat.decode_many(listing)),
+            ('direntry.iter_bytes', lambda: [
+                entry.name for entry in DirEntry.iter_bytes(listing)
+            ]),
+            ('columnar.decode_listing', lambda: decode_listing(listing)),
+    ):
+        results.add(
+            f'{name}.per_entry',
+            per_call(fn, **timing) / count,
+            'ns',
+            False,
+        )
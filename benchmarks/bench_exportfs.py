@@ -0,0 +1,112 @@
+from benchmarks.runner import Results
+
+from exportfs import Py9ExportServer
+from py9client import Py9Client
+from utils import OREAD
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+
+def serve(root: str, msize: int, ready) -> None:
+    server = Py9ExportServer('127.0.0.1', 0, root, msize=msize)
+    ready.send(server.socket.getsockname()[1])
+    while True:
+        server.serve()
+
+
+def connect(port: int, msize: int) -> Py9Client:
+    client = Py9Client('127.0.0.1', port, msize=msize)
+    client.connect()
+    client._check(client.attach())
+
+    return client
+
+
+def populate(root: str, size: int, files: int) -> None:
+    with open(os.path.join(root, 'big'), 'wb') as f:
+        f.write(os.urandom(size))
+    os.mkdir(os.path.join(root, 'small'))
+    for i in range(files):
+        with open(os.path.join(root, 'small', f'{i:06}'), 'wb') as f:
+            f.write(b'x' * 512)
+
+
+def bench_throughput(
+        results: Results,
+        port: int,
+        args: argparse.Namespace,
+) -> None:
+    size: int = args.size * 1024 * 1024
+    payload: bytes = os.urandom(size)
+    mib: float = size / (1024 * 1024)
+
+    for msize in args.msizes:
+        client: Py9Client = connect(port, msize)
+        label: str = f'{msize // 1024}k'
+
+        start: float = time.perf_counter()
+        client.read_file('big', window=args.window)
+        elapsed: float = time.perf_counter() - start
+        results.add(f'exportfs.read.{label}', mib / elapsed, 'MiB/s')
+
+        start = time.perf_counter()
+        client.write_file('out', payload, window=args.window)
+        elapsed = time.perf_counter() - start
+        results.add(f'exportfs.write.{label}', mib / elapsed, 'MiB/s')
+
+        client.close()
+
+
+def bench_small(
+        results: Results,
+        port: int,
+        args: argparse.Namespace,
+) -> None:
+    client: Py9Client = connect(port, 65536)
+
+    start: float = time.perf_counter()
+    for i in range(args.files):
+        client.read_file(f'small/{i:06}')
+    elapsed: float = time.perf_counter() - start
+    results.add('exportfs.small_read', args.files / elapsed, 'files/s')
+
+    start = time.perf_counter()
+    fid: int = client.walk_path('small')
+    client._check(client.open(fid, OREAD))
+    for entry in client.iter_dir(fid):
+        entry.name
+    client.clunk(fid)
+    client.release_fid(fid)
+    elapsed = time.perf_counter() - start
+    results.add('exportfs.iter_dir', args.files / elapsed, 'entries/s')
+
+    client.close()
+
+
+def run(results: Results, args: argparse.Namespace) -> None:
+    root: str = tempfile.mkdtemp(prefix='py9-bench-')
+    try:
+        populate(root, args.size * 1024 * 1024, args.files)
+
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        server = multiprocessing.Process(
+            target=serve,
+            args=(root, max(args.msizes), sender),
+            daemon=True,
+        )
+        server.start()
+        port: int = receiver.recv()
+
+        try:
+            bench_throughput(results, port, args)
+            bench_small(results, port, args)
+        finally:
+            server.terminate()
+            server.join()
+    finally:
+        shutil.rmtree(root)
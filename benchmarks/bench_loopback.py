@@ -0,0 +1,158 @@
+from benchmarks.runner import Results, percentile
+
+from py9client import Py9Client
+from ramfs import Py9RamServer
+
+import argparse
+import multiprocessing
+import os
+import threading
+import time
+
+
+def serve(msize: int, size: int, files: int, ready) -> None:
+    server = Py9RamServer('127.0.0.1', 0, msize=msize)
+    server.add_file('big', os.urandom(size))
+    server.mkdir('small')
+    for i in range(files):
+        server.add_file(f'small/{i:06}', b'x' * 512)
+
+    ready.send(server.socket.getsockname()[1])
+    while True:
+        server.serve()
+
+
+def connect(port: int, msize: int) -> Py9Client:
+    client = Py9Client('127.0.0.1', port, msize=msize)
+    client.connect()
+    client._check(client.attach())
+
+    return client
+
+
+def bench_metadata(
+        results: Results,
+        port: int,
+        args: argparse.Namespace,
+) -> None:
+    client: Py9Client = connect(port, 65536)
+    spent: dict[str, float] = {'walk': 0.0, 'stat': 0.0, 'clunk': 0.0}
+    count: int = 0
+    clock = time.perf_counter
+    deadline: float = clock() + args.duration
+
+    while clock() < deadline:
+        fid: int = client.get_fid()
+        names: list[str] = ['small', f'{count % args.files:06}']
+        start: float = clock()
+        client._check(client.walk(client.root_fid, fid, names))
+        walked: float = clock()
+        client._check(client.stat(fid))
+        statted: float = clock()
+        client._check(client.clunk(fid))
+        clunked: float = clock()
+        client.release_fid(fid)
+
+        spent['walk'] += walked - start
+        spent['stat'] += statted - walked
+        spent['clunk'] += clunked - statted
+        count += 1
+
+    client.close()
+    for name, elapsed in spent.items():
+        results.add(f'loopback.{name}', count / elapsed, 'ops/s')
+
+
+def bench_throughput(
+        results: Results,
+        port: int,
+        args: argparse.Namespace,
+) -> None:
+    size: int = args.size * 1024 * 1024
+    payload: bytes = os.urandom(size)
+    mib: float = size / (1024 * 1024)
+
+    for msize in args.msizes:
+        client: Py9Client = connect(port, msize)
+        label: str = f'{msize // 1024}k'
+
+        start: float = time.perf_counter()
+        client.read_file('big', window=args.window)
+        elapsed: float = time.perf_counter() - start
+        results.add(f'loopback.read.{label}', mib / elapsed, 'MiB/s')
+
+        start = time.perf_counter()
+        client.write_file('out', payload, window=args.window)
+        elapsed = time.perf_counter() - start
+        results.add(f'loopback.write.{label}', mib / elapsed, 'MiB/s')
+
+        client.close()
+
+
+def bench_latency(
+        results: Results,
+        port: int,
+        args: argparse.Namespace,
+) -> None:
+    clients: list[Py9Client] = [
+        connect(port, 65536) for _ in range(args.clients)
+    ]
+    latencies: list[list[float]] = [[] for _ in clients]
+    barrier = threading.Barrier(len(clients))
+
+    def worker(client: Py9Client, samples: list[float]) -> None:
+        clock = time.perf_counter
+        barrier.wait()
+        deadline: float = clock() + args.duration
+        while True:
+            start: float = clock()
+            if start >= deadline:
+                break
+            client._check(client.stat(client.root_fid))
+            samples.append(clock() - start)
+
+    threads: list[threading.Thread] = [
+        threading.Thread(target=worker, args=(client, samples))
+        for client, samples in zip(clients, latencies)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for client in clients:
+        client.close()
+
+    merged: list[float] = [value for part in latencies for value in part]
+    prefix: str = f'loopback.stat.c{args.clients}'
+    results.add(f'{prefix}.ops', len(merged) / args.duration, 'ops/s')
+    for name, fraction in (('p50', 0.5), ('p99', 0.99)):
+        results.add(
+            f'{prefix}.{name}',
+            percentile(merged, fraction) * 1e6,
+            'us',
+            False,
+        )
+
+
+def run(results: Results, args: argparse.Namespace) -> None:
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    server = multiprocessing.Process(
+        target=serve,
+        args=(
+            max(args.msizes),
+            args.size * 1024 * 1024,
+            args.files,
+            sender,
+        ),
+        daemon=True,
+    )
+    server.start()
+    port: int = receiver.recv()
+
+    try:
+        bench_metadata(results, port, args)
+        bench_throughput(results, port, args)
+        bench_latency(results, port, args)
+    finally:
+        server.terminate()
+        server.join()
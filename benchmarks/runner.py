@@ -0,0 +1,102 @@
+import json
+import platform
+import time
+
+
+class Results:
+    def __init__(self) -> None:
+        self.results: dict[str, dict] = {}
+
+    def add(
+            self,
+            name: str,
+            value: float,
+            unit: str,
+            higher_is_better: bool = True,
+    ) -> None:
+        self.results[name] = {
+            'value': value,
+            'unit': unit,
+            'higher_is_better': higher_is_better,
+        }
+        print(f'{name:<44} {value:14.1f} {unit}', flush=True)
+
+    def to_json(self) -> dict:
+        return {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'time': time.time(),
+            'results': self.results,
+        }
+
+    def save(self, path: str) -> None:
+        with open(path, 'w') as f:
+            json.dump(self.to_json(), f, indent=2, sort_keys=True)
+            f.write('\n')
+
+
+def per_call(fn, repeat: int = 5, min_time: float = 0.05) -> float:
+    # Calibrate the loop count so one run takes at least min_time, then
+    # keep the best of repeat runs, which is the least disturbed one.
+    number: int = 1
+    while True:
+        elapsed: float = _run(fn, number)
+        if elapsed >= min_time:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+
+    best: float = elapsed
+    for _ in range(repeat - 1):
+        best = min(best, _run(fn, number))
+
+    return best / number * 1e9
+
+
+def _run(fn, number: int) -> float:
+    loop = range(number)
+    start: float = time.perf_counter()
+    for _ in loop:
+        fn()
+
+    return time.perf_counter() - start
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+
+    ordered: list[float] = sorted(values)
+    index: int = min(len(ordered) - 1, int(fraction * len(ordered)))
+
+    return ordered[index]
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    regressions: list[str] = []
+    old: dict = baseline['results']
+    new: dict = current['results']
+
+    print()
+    print(f'{"benchmark":<44} {"baseline":>14} {"current":>14} {"change":>8}')
+    for name in sorted(new):
+        if name not in old or not old[name]['value']:
+            continue
+        before: float = old[name]['value']
+        after: float = new[name]['value']
+        change: float = after / before - 1
+        if not new[name]['higher_is_better']:
+            change = -change
+
+        mark: str = ''
+        if change < -threshold:
+            mark = '  REGRESSION'
+            regressions.append(name)
+        elif change > threshold:
+            mark = '  improved'
+        print(
+            f'{name:<44} {before:14.1f} {after:14.1f} '
+            f'{change:+7.1%}{mark}'
+        )
+
+    return regressions
@@ -1,7 +1,19 @@
 from .py9 import Py9
 from .py9client import Py9Client
-from .py9server import Py9Server
+from .py9asyncclient import AsyncPy9Client
+from .py9server import Py9Server, blocking
+from .py9asyncserver import AsyncPy9Server
+from .pool import Py9ClientPool
+from .prefork import PreforkServer
+from .fileserver import Py9FileServer
+from .exportfs import Py9ExportServer
+from .ramfs import InodeTable, Py9RamServer
+from .cache import BlockCache, StatCache, WalkCache
+from .columnar import Listing, decode_listing
+from .metrics import Histogram, Metrics
+from .capture import Capture, read_capture
+from .replay import Replay
 from .errors import Errors
-from .stat9 import Stat
+from .stat9 import DirEntry, Stat
 from .qid import Qid
 from .trs import TRs
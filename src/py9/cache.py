@@ -0,0 +1,274 @@
+from qid import Qid
+from stat9 import Stat
+
+from collections import OrderedDict
+
+import time
+
+
+class BlockCache:
+    def __init__(
+            self,
+            capacity: int = 64 * 1024 * 1024,
+            block_size: int = 16384,
+    ) -> None:
+        self.capacity: int = capacity
+        self.block_size: int = block_size
+        self.size: int = 0
+        self.blocks: OrderedDict[tuple[int, int], tuple[int, bytes]] = \
+            OrderedDict()
+        self.paths: dict[int, set[int]] = {}
+
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def spawn(self) -> 'BlockCache':
+        return BlockCache(self.capacity, self.block_size)
+
+    def get(self, path: int, version: int, index: int) -> bytes | None:
+        key: tuple[int, int] = (path, index)
+        entry = self.blocks.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[0] != version:
+            self._drop(key)
+            self.misses += 1
+            return None
+
+        self.blocks.move_to_end(key)
+        self.hits += 1
+
+        return entry[1]
+
+    def put(self, path: int, version: int, index: int, data: bytes) -> None:
+        if len(data) > self.capacity:
+            return
+
+        key: tuple[int, int] = (path, index)
+        if key in self.blocks:
+            self._drop(key)
+
+        self.blocks[key] = (version, data)
+        self.paths.setdefault(path, set()).add(index)
+        self.size += len(data)
+
+        while self.size > self.capacity:
+            self._drop(next(iter(self.blocks)))
+            self.evictions += 1
+
+    def invalidate(self, path: int) -> None:
+        for index in list(self.paths.get(path, ())):
+            self._drop((path, index))
+
+    def clear(self) -> None:
+        self.blocks.clear()
+        self.paths.clear()
+        self.size = 0
+
+    def _drop(self, key: tuple[int, int]) -> None:
+        _, data = self.blocks.pop(key)
+        self.size -= len(data)
+
+        indexes: set[int] = self.paths[key[0]]
+        indexes.discard(key[1])
+        if not indexes:
+            del self.paths[key[0]]
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'blocks': len(self.blocks),
+            'bytes': self.size,
+        }
+
+
+class WalkCache:
+    def __init__(
+            self,
+            capacity: int = 1024,
+            ttl: float = 5.0,
+    ) -> None:
+        self.capacity: int = capacity
+        self.ttl: float = ttl
+        self.entries: OrderedDict[tuple[str, ...], list] = OrderedDict()
+        self.stale: list[int] = []
+
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def spawn(self) -> 'WalkCache':
+        return WalkCache(self.capacity, self.ttl)
+
+    def _entry(self, names: tuple[str, ...]) -> list | None:
+        entry: list | None = self.entries.get(names)
+        if entry is None:
+            return None
+        if entry[2] < time.monotonic():
+            self._drop(names)
+            return None
+
+        self.entries.move_to_end(names)
+
+        return entry
+
+    def lookup(
+            self,
+            names: tuple[str, ...],
+    ) -> tuple[int, int | None, tuple[Qid, ...]]:
+        for depth in range(len(names), 0, -1):
+            entry: list | None = self._entry(names[:depth])
+            if entry is not None:
+                self.hits += 1
+                return depth, entry[1], entry[0]
+
+        self.misses += 1
+
+        return 0, None, ()
+
+    def put(
+            self,
+            names: tuple[str, ...],
+            qids: tuple[Qid, ...],
+            fid: int,
+    ) -> None:
+        # Each entry keeps the qids of every name on its path, so that
+        # invalidating a directory reaches the fids walked below it.
+        entry: list | None = self.entries.get(names)
+        if entry is not None and entry[1] != fid:
+            self.stale.append(entry[1])
+
+        self.entries[names] = [qids, fid, time.monotonic() + self.ttl]
+        self.entries.move_to_end(names)
+
+        while len(self.entries) > self.capacity:
+            self._drop(next(iter(self.entries)))
+            self.evictions += 1
+
+    def invalidate(self, path: int) -> None:
+        below: list[tuple[str, ...]] = [
+            names for names, entry in self.entries.items()
+            if any(qid.path == path for qid in entry[0])
+        ]
+        for names in below:
+            self._drop(names)
+
+    def evict(self, prefix: tuple[str, ...]) -> None:
+        for names in list(self.entries):
+            if names[:len(prefix)] == prefix:
+                self._drop(names)
+
+    def clear(self) -> None:
+        for names in list(self.entries):
+            self._drop(names)
+
+    def take_stale(self) -> list[int]:
+        stale, self.stale = self.stale, []
+        return stale
+
+    def _drop(self, names: tuple[str, ...]) -> None:
+        _, fid, _ = self.entries.pop(names)
+        self.stale.append(fid)
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self.entries),
+        }
+
+
+class StatCache:
+    def __init__(
+            self,
+            capacity: int = 65536,
+            ttl: float = 5.0,
+    ) -> None:
+        self.capacity: int = capacity
+        self.ttl: float = ttl
+        self.entries: OrderedDict[int, list] = OrderedDict()
+        self.names: dict[tuple[str, ...], int] = {}
+
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def spawn(self) -> 'StatCache':
+        return StatCache(self.capacity, self.ttl)
+
+    def get(self, path: int) -> Stat | None:
+        entry: list | None = self.entries.get(path)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[1] < time.monotonic():
+            self._drop(path)
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(path)
+        self.hits += 1
+
+        return entry[0]
+
+    def get_path(self, names: tuple[str, ...]) -> Stat | None:
+        path: int | None = self.names.get(names)
+        if path is None:
+            self.misses += 1
+            return None
+
+        return self.get(path)
+
+    def put(self, stat: Stat, names: tuple[str, ...] | None = None) -> None:
+        path: int = stat.qid.path
+        entry: list | None = self.entries.get(path)
+        if entry is None:
+            entry = [stat, 0.0, set()]
+            self.entries[path] = entry
+        else:
+            entry[0] = stat
+            self.entries.move_to_end(path)
+        entry[1] = time.monotonic() + self.ttl
+
+        if names is not None:
+            previous: int | None = self.names.get(names)
+            if previous is not None and previous != path:
+                self.entries[previous][2].discard(names)
+            self.names[names] = path
+            entry[2].add(names)
+
+        while len(self.entries) > self.capacity:
+            self._drop(next(iter(self.entries)))
+            self.evictions += 1
+
+    def check(self, qid: Qid) -> None:
+        entry: list | None = self.entries.get(qid.path)
+        if entry is not None and entry[0].qid.version != qid.version:
+            self._drop(qid.path)
+
+    def invalidate(self, path: int) -> None:
+        if path in self.entries:
+            self._drop(path)
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.names.clear()
+
+    def _drop(self, path: int) -> None:
+        _, _, names = self.entries.pop(path)
+        for key in names:
+            if self.names.get(key) == path:
+                del self.names[key]
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self.entries),
+        }
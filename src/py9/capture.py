@@ -0,0 +1,81 @@
+import os
+import struct
+import threading
+import time
+
+
+# A capture file is MAGIC followed by records. Each record is RECORD
+# (wall clock time, connection id, direction) followed by one raw frame,
+# whose own size field says how long it is.
+MAGIC: bytes = b'PY9CAP01'
+RECORD = struct.Struct('<dIB')
+
+RECEIVED: int = 0
+SENT: int = 1
+
+
+class Capture:
+    def __init__(self, target) -> None:
+        self.owned: bool = isinstance(target, (str, bytes, os.PathLike))
+        self.file = open(target, 'wb') if self.owned else target
+        self.file.write(MAGIC)
+        self.lock: threading.Lock = threading.Lock()
+        self.connections: int = 0
+
+    def connection(self) -> int:
+        with self.lock:
+            self.connections += 1
+            return self.connections
+
+    def record(
+            self,
+            connection: int,
+            direction: int,
+            frame: bytes | list,
+    ) -> None:
+        record: bytes = RECORD.pack(time.time(), connection, direction)
+        with self.lock:
+            write = self.file.write
+            write(record)
+            if isinstance(frame, list):
+                for part in frame:
+                    write(part)
+            else:
+                write(frame)
+
+    def flush(self) -> None:
+        with self.lock:
+            self.file.flush()
+
+    def close(self) -> None:
+        with self.lock:
+            if self.owned:
+                self.file.close()
+            else:
+                self.file.flush()
+
+
+def read_capture(source):
+    owned: bool = isinstance(source, (str, bytes, os.PathLike))
+    file = open(source, 'rb') if owned else source
+    try:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise Exception('Not a py9 capture file')
+
+        prefix: int = RECORD.size + 4
+        while True:
+            head: bytes = file.read(prefix)
+            if not head:
+                return
+            if len(head) < prefix:
+                raise Exception('Truncated capture record')
+            stamp, connection, direction = RECORD.unpack_from(head)
+            size: int = struct.unpack_from('<I', head, RECORD.size)[0]
+            rest: bytes = file.read(size - 4)
+            if len(rest) < size - 4:
+                raise Exception('Truncated capture record')
+
+            yield stamp, connection, direction, head[RECORD.size:] + rest
+    finally:
+        if owned:
+            file.close()
@@ -0,0 +1,290 @@
+import struct
+import types
+
+from trs import TRs
+from qid import Qid
+from stat9 import Stat
+
+
+HEADER = struct.Struct('<IBH')
+HEADER_LEN = HEADER.size
+
+U16 = struct.Struct('<H')
+QID = struct.Struct('<BIQ')
+
+CODES: dict[str, str] = {
+    'B': 'B',
+    'H': 'H',
+    'I': 'I',
+    'Q': 'Q',
+    'qid': 'BIQ',
+}
+
+SCHEMA: dict[TRs, tuple] = {
+    TRs.Tversion: (('msize', 'I'), ('version', 's')),
+    TRs.Rversion: (('msize', 'I'), ('version', 's')),
+    TRs.Tauth: (('afid', 'I'), ('uname', 's'), ('aname', 's')),
+    TRs.Rauth: (('aqid', 'qid'),),
+    TRs.Tattach: (
+        ('fid', 'I'),
+        ('afid', 'I'),
+        ('uname', 's'),
+        ('aname', 's'),
+    ),
+    TRs.Rattach: (('qid', 'qid'),),
+    TRs.Rerror: (('ename', 's'),),
+    TRs.Tflush: (('oldtag', 'H'),),
+    TRs.Rflush: (),
+    TRs.Twalk: (('fid', 'I'), ('newfid', 'I'), ('wnames', 'strs')),
+    TRs.Rwalk: (('qids', 'qids'),),
+    TRs.Topen: (('fid', 'I'), ('mode', 'B')),
+    TRs.Ropen: (('qid', 'qid'), ('iounit', 'I')),
+    TRs.Tcreate: (
+        ('fid', 'I'),
+        ('name', 's'),
+        ('perm', 'I'),
+        ('mode', 'B'),
+    ),
+    TRs.Rcreate: (('qid', 'qid'), ('iounit', 'I')),
+    TRs.Tread: (('fid', 'I'), ('offset', 'Q'), ('count', 'I')),
+    TRs.Rread: (('data', 'data'),),
+    TRs.Twrite: (('fid', 'I'), ('offset', 'Q'), ('data', 'data')),
+    TRs.Rwrite: (('count', 'I'),),
+    TRs.Tclunk: (('fid', 'I'),),
+    TRs.Rclunk: (),
+    TRs.Tremove: (('fid', 'I'),),
+    TRs.Rremove: (),
+    TRs.Tstat: (('fid', 'I'),),
+    TRs.Rstat: (('stat', 'stat'),),
+    TRs.Twstat: (('fid', 'I'), ('stat', 'stat')),
+    TRs.Rwstat: (),
+}
+
+
+class Message:
+    # Each schema is compiled once into a pair of straight-line functions.
+    # Consecutive fixed-size fields, together with the length prefix of the
+    # variable field that follows them, share one precomputed Struct, so a
+    # message costs one pack/unpack_from per group of fields.
+
+    def __init__(self, _type: TRs, fields: tuple) -> None:
+        self._type: TRs = _type
+        self.code: int = int(_type)
+        self.fields: tuple = fields
+        self.namespace: dict = {
+            'Qid': Qid,
+            'Stat': Stat,
+            'pack_qid': QID.pack,
+            'pack_u16': U16.pack,
+            'unpack_qid': QID.unpack_from,
+            'unpack_u16': U16.unpack_from,
+        }
+
+        self.encode = self._compile('encode', self._encoder_source())
+        self.decode = self._compile('decode', self._decoder_source())
+        # Messages ending in a data payload can also be encoded as a header
+        # plus the caller's buffer, for scatter/gather sends.
+        self.encode_iov = None
+        if fields and fields[-1][1] == 'data':
+            self.encode_iov = self._compile(
+                'encode',
+                self._encoder_source(iov=True),
+            )
+
+    def _compile(self, name: str, source: list[str]):
+        exec('\n'.join(source), self.namespace)
+        return self.namespace.pop(name)
+
+    def _encoder_source(self, iov: bool = False) -> list[str]:
+        names: list[str] = [name for name, _ in self.fields]
+        prepare: list[str] = []
+        sizes: list[str] = []
+        pieces: list[str] = []
+        fmt: str = 'IBH'
+        values: list[str] = ['size', str(self.code), 'tag']
+        fixed: int = 0
+
+        def flush() -> None:
+            nonlocal fmt, values, fixed
+            if not fmt:
+                return
+            key: str = f'pack{len(self.namespace)}'
+            group = struct.Struct('<' + fmt)
+            self.namespace[key] = group.pack
+            pieces.append(f'{key}({", ".join(values)})')
+            fixed += group.size
+            fmt, values = '', []
+
+        for index, (name, kind) in enumerate(self.fields):
+            if kind == 'qid':
+                fmt += 'BIQ'
+                values += [f'{name}._type', f'{name}.version', f'{name}.path']
+                continue
+            if kind in CODES:
+                fmt += CODES[kind]
+                values.append(name)
+                continue
+
+            if kind == 's':
+                prepare.append(
+                    f'    {name} = {name}.encode() '
+                    f'if {name}.__class__ is str else {name}')
+            elif kind == 'stat':
+                prepare.append(
+                    f'    {name} = {name}.to_bytes() '
+                    f'if isinstance({name}, Stat) else {name}')
+            elif kind == 'data':
+                prepare.append(
+                    f'    {name} = {name} if {name}.__class__ is bytes '
+                    f'else memoryview({name}).cast("B")')
+            elif kind == 'strs':
+                prepare += [
+                    f'    n{index} = len({name})',
+                    '    parts = []',
+                    f'    for s in {name}:',
+                    '        if s.__class__ is str:',
+                    '            s = s.encode()',
+                    '        parts += (pack_u16(len(s)), s)',
+                    f'    {name} = b"".join(parts)',
+                ]
+            elif kind == 'qids':
+                prepare += [
+                    f'    n{index} = len({name})',
+                    f'    {name} = b"".join([',
+                    '        pack_qid(q._type, q.version, q.path)',
+                    f'        for q in {name}',
+                    '    ])',
+                ]
+
+            fmt += 'I' if kind == 'data' else 'H'
+            values.append(
+                f'n{index}' if kind in ('strs', 'qids') else f'len({name})')
+            sizes.append(f'len({name})')
+            flush()
+            pieces.append(name)
+
+        source: list[str] = [f'def encode({", ".join(["tag"] + names)}):']
+        if not sizes:
+            group = struct.Struct('<' + fmt)
+            self.namespace['head'] = group.pack
+            values[0] = str(group.size)
+            return source + [f'    return head({", ".join(values)})']
+
+        flush()
+        if iov:
+            head: str = pieces[0] if len(pieces) == 2 else \
+                f'b"".join(({", ".join(pieces[:-1])}))'
+            result: str = f'[{head}, {pieces[-1]}]'
+        else:
+            result = f'b"".join(({", ".join(pieces)}))'
+
+        return source + prepare + [
+            f'    size = {" + ".join([str(fixed)] + sizes)}',
+            f'    return {result}',
+        ]
+
+    def _decoder_source(self) -> list[str]:
+        body: list[str] = []
+        result: list[str] = []
+        fmt: str = ''
+        targets: list[str] = []
+        base: str = ''
+        const: int = 0
+
+        def at() -> str:
+            if not base:
+                return str(const)
+            return f'{base} + {const}' if const else base
+
+        def flush() -> None:
+            nonlocal fmt, targets, const
+            if not fmt:
+                return
+            key: str = f'unpack{len(self.namespace)}'
+            group = struct.Struct('<' + fmt)
+            self.namespace[key] = group.unpack_from
+            body.append(f'    {", ".join(targets)}, = {key}(buf, {at()})')
+            const += group.size
+            fmt, targets = '', []
+
+        def skip(length: str | None = None) -> None:
+            nonlocal base, const
+            if length is None:
+                if at() != 'o':
+                    body.append(f'    o = {at()}')
+            else:
+                body.append(f'    o = {at()} + {length}')
+            base, const = 'o', 0
+
+        for index, (name, kind) in enumerate(self.fields):
+            if kind == 'qid':
+                fmt += 'BIQ'
+                parts: list[str] = [f'q{index}_{i}' for i in range(3)]
+                targets += parts
+                result.append(f"'{name}': Qid({', '.join(parts)})")
+            elif kind in CODES:
+                fmt += CODES[kind]
+                targets.append(name)
+                result.append(f"'{name}': {name}")
+            elif kind in ('s', 'stat'):
+                fmt += 'H'
+                targets.append(f'n{index}')
+                flush()
+                view: str = f'buf[{at()}:{at()} + n{index}]'
+                if kind == 's':
+                    body.append(f'    {name} = bytes({view})')
+                else:
+                    body.append(f'    {name} = Stat.from_bytes({view})')
+                result.append(f"'{name}': {name}")
+                skip(f'n{index}')
+            elif kind == 'data':
+                fmt += 'I'
+                targets.append('count')
+                flush()
+                body.append(f'    {name} = buf[{at()}:{at()} + count]')
+                result += ["'count': count", f"'{name}': {name}"]
+                skip('count')
+            elif kind == 'strs':
+                fmt += 'H'
+                targets.append('nwname')
+                flush()
+                skip()
+                body += [
+                    f'    {name} = []',
+                    '    for _ in range(nwname):',
+                    '        n, = unpack_u16(buf, o)',
+                    f'        {name}.append(bytes(buf[o + 2:o + 2 + n]))',
+                    '        o += 2 + n',
+                ]
+                result += ["'nwname': nwname", f"'{name}': {name}"]
+            elif kind == 'qids':
+                fmt += 'H'
+                targets.append(f'n{index}')
+                flush()
+                skip()
+                body += [
+                    f'    {name} = []',
+                    f'    for _ in range(n{index}):',
+                    f'        {name}.append(Qid(*unpack_qid(buf, o)))',
+                    '        o += 13',
+                ]
+                result.append(f"'{name}': {name}")
+
+        flush()
+        return ['def decode(buf):'] + body + [
+            f'    return {{{", ".join(result)}}}',
+        ]
+
+
+MESSAGES: dict[TRs, Message] = {
+    _type: Message(_type, fields) for _type, fields in SCHEMA.items()
+}
+
+ENCODE = types.SimpleNamespace(**{
+    _type.name: message.encode for _type, message in MESSAGES.items()
+})
+
+ENCODE_IOV = types.SimpleNamespace(**{
+    _type.name: message.encode_iov for _type, message in MESSAGES.items()
+    if message.encode_iov is not None
+})
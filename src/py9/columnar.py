@@ -0,0 +1,187 @@
+from qid import Qid
+from stat9 import STAT, Stat
+
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+FIELDS: tuple[tuple[str, str, str], ...] = (
+    ('size', '<u2', 'H'),
+    ('_type', '<u2', 'H'),
+    ('dev', '<u4', 'I'),
+    ('qid_type', 'u1', 'B'),
+    ('qid_version', '<u4', 'I'),
+    ('qid_path', '<u8', 'Q'),
+    ('mode', '<u4', 'I'),
+    ('atime', '<u4', 'I'),
+    ('mtime', '<u4', 'I'),
+    ('length', '<u8', 'Q'),
+)
+
+STRINGS: tuple[str, ...] = ('name', 'uid', 'gid', 'muid')
+
+
+class StringTable:
+    def __init__(self, data: bytes, starts, ends) -> None:
+        self.data: bytes = data
+        self.starts = starts
+        self.ends = ends
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __getitem__(self, index: int) -> str:
+        return self.data[self.starts[index]:self.ends[index]].decode()
+
+    def __iter__(self):
+        data: bytes = self.data
+        for start, end in zip(self.starts, self.ends):
+            yield data[start:end].decode()
+
+    def raw(self, index: int) -> bytes:
+        return self.data[self.starts[index]:self.ends[index]]
+
+
+class Listing:
+    def __init__(
+            self,
+            data: bytes,
+            columns,
+            strings: dict[str, StringTable],
+    ) -> None:
+        self.data: bytes = data
+        self.columns = columns
+        self.strings: dict[str, StringTable] = strings
+
+    def __len__(self) -> int:
+        return len(self.strings['name'])
+
+    def __getitem__(self, field: str):
+        if field in self.strings:
+            return self.strings[field]
+
+        return self.columns[field]
+
+    def stat(self, index: int) -> Stat:
+        values: list[int] = [
+            int(self.columns[field][index]) for field, _, _ in FIELDS
+        ]
+
+        return Stat(
+            values[0],
+            values[1],
+            values[2],
+            Qid(values[3], values[4], values[5]),
+            values[6],
+            values[7],
+            values[8],
+            values[9],
+            *[self.strings[field][index] for field in STRINGS],
+        )
+
+
+def _records(data: bytes) -> tuple[list[int], bytes]:
+    offsets: list[int] = []
+    fixed: list[bytes] = []
+    size: int = STAT.size
+    end: int = len(data)
+    offset: int = 0
+
+    while offset < end:
+        if offset + size > end:
+            raise Exception('Truncated stat data')
+        offsets.append(offset)
+        fixed.append(data[offset:offset + size])
+        offset += 2 + (data[offset] | data[offset + 1] << 8)
+
+    if offset != end:
+        raise Exception('Truncated stat data')
+
+    return offsets, b''.join(fixed)
+
+
+def _decode_numpy(data: bytes, offsets: list[int], fixed: bytes) -> Listing:
+    dtype = numpy.dtype([(field, code) for field, code, _ in FIELDS])
+    columns = numpy.frombuffer(fixed, dtype=dtype)
+
+    raw = numpy.frombuffer(data, dtype=numpy.uint8)
+    position = numpy.array(offsets, dtype=numpy.int64) + STAT.size
+    strings: dict[str, StringTable] = {}
+    for field in STRINGS:
+        length = (raw[position].astype(numpy.int64) |
+                  raw[position + 1].astype(numpy.int64) << 8)
+        start = position + 2
+        position = start + length
+        strings[field] = StringTable(data, start, position)
+
+    if len(offsets) and position[-1] > len(data):
+        raise Exception('Truncated stat data')
+
+    return Listing(data, columns, strings)
+
+
+def _decode_array(data: bytes, offsets: list[int], fixed: bytes) -> Listing:
+    values = zip(*STAT.iter_unpack(fixed)) if fixed else \
+        [()] * len(FIELDS)
+    columns: dict[str, array] = {
+        field: array(code, column)
+        for (field, _, code), column in zip(FIELDS, values)
+    }
+
+    bounds: list[array] = [array('Q') for _ in range(2 * len(STRINGS))]
+    (
+        name_start,
+        name_end,
+        uid_start,
+        uid_end,
+        gid_start,
+        gid_end,
+        muid_start,
+        muid_end,
+    ) = [bound.append for bound in bounds]
+    end: int = 0
+    for offset in offsets:
+        a: int = offset + STAT.size + 2
+        b: int = a + (data[a - 2] | data[a - 1] << 8)
+        c: int = b + 2
+        d: int = c + (data[c - 2] | data[c - 1] << 8)
+        e: int = d + 2
+        f: int = e + (data[e - 2] | data[e - 1] << 8)
+        g: int = f + 2
+        end = g + (data[g - 2] | data[g - 1] << 8)
+        name_start(a)
+        name_end(b)
+        uid_start(c)
+        uid_end(d)
+        gid_start(e)
+        gid_end(f)
+        muid_start(g)
+        muid_end(end)
+
+    if end > len(data):
+        raise Exception('Truncated stat data')
+
+    strings: dict[str, StringTable] = {
+        field: StringTable(data, bounds[2 * index], bounds[2 * index + 1])
+        for index, field in enumerate(STRINGS)
+    }
+
+    return Listing(data, columns, strings)
+
+
+def decode_listing(buffer, use_numpy: bool | None = None) -> Listing:
+    data: bytes = bytes(buffer)
+    offsets, fixed = _records(data)
+
+    if use_numpy is None:
+        use_numpy = numpy is not None
+    if use_numpy:
+        if numpy is None:
+            raise Exception('numpy is not installed')
+        return _decode_numpy(data, offsets, fixed)
+
+    return _decode_array(data, offsets, fixed)
@@ -0,0 +1,443 @@
+from fileserver import Py9FileServer
+from py9server import blocking
+from errors import Errors
+from qid import Qid
+from stat9 import Stat
+
+from utils import (
+    DMDIR,
+    IOHDRSZ,
+    NOCHANGE32,
+    NOCHANGE64,
+    OEXEC,
+    ORDWR,
+    OTRUNC,
+    OWRITE,
+    QTDIR,
+)
+
+import grp
+import os
+import pwd
+import stat
+import threading
+
+
+OPEN_FLAGS: dict[int, int] = {
+    0: os.O_RDONLY,
+    OWRITE: os.O_WRONLY,
+    ORDWR: os.O_RDWR,
+    OEXEC: os.O_RDONLY,
+}
+
+
+class Py9ExportServer(Py9FileServer):
+    class Fid:
+        __slots__ = (
+            'path',
+            'qid',
+            'fd',
+            'mode',
+            'entries',
+            'index',
+            'end',
+            'lock',
+        )
+
+        def __init__(self, path: str, qid: Qid) -> None:
+            self.path: str = path
+            self.qid: Qid = qid
+            self.fd: int | None = None
+            self.mode: int | None = None
+            self.entries: list[bytes] | None = None
+            self.index: int = 0
+            self.end: int = 0
+            # Reads of one fid may run side by side on the thread pool, but
+            # a directory read moves its position.
+            self.lock: threading.Lock = threading.Lock()
+
+        def close(self) -> None:
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
+            self.mode = None
+            self.entries = None
+
+    def __init__(
+            self,
+            ip: str,
+            port: int,
+            root: str,
+            msize: int = 32768,
+            version: str = "9P2000",
+            readonly: bool = False,
+            **options,
+    ) -> None:
+        super().__init__(ip, port, msize, version, **options)
+        self.root: str = os.path.realpath(root)
+        self.readonly: bool = readonly
+        # Disk bound handlers run on the thread pool when threads is set,
+        # so the fid tables are only touched under fid_lock.
+        self.fids: dict[int, dict[int, Py9ExportServer.Fid]] = {}
+        self.fid_lock: threading.Lock = threading.Lock()
+        self.users: dict[int, str] = {}
+        self.groups: dict[int, str] = {}
+
+    @staticmethod
+    def _qid(st: os.stat_result) -> Qid:
+        return Qid(
+            QTDIR if stat.S_ISDIR(st.st_mode) else 0,
+            (st.st_mtime_ns ^ st.st_size) & NOCHANGE32,
+            (st.st_dev << 48 ^ st.st_ino) & NOCHANGE64,
+        )
+
+    def _user(self, uid: int) -> str:
+        name: str | None = self.users.get(uid)
+        if name is None:
+            try:
+                name = pwd.getpwuid(uid).pw_name
+            except KeyError:
+                name = str(uid)
+            self.users[uid] = name
+
+        return name
+
+    def _group(self, gid: int) -> str:
+        name: str | None = self.groups.get(gid)
+        if name is None:
+            try:
+                name = grp.getgrgid(gid).gr_name
+            except KeyError:
+                name = str(gid)
+            self.groups[gid] = name
+
+        return name
+
+    def _stat(self, name: str, st: os.stat_result) -> Stat:
+        mode: int = stat.S_IMODE(st.st_mode)
+        length: int = st.st_size
+        if stat.S_ISDIR(st.st_mode):
+            mode |= DMDIR
+            length = 0
+        uid: str = self._user(st.st_uid)
+
+        return Stat(
+            0,
+            0,
+            0,
+            self._qid(st),
+            mode,
+            int(st.st_atime),
+            int(st.st_mtime),
+            length,
+            name,
+            uid,
+            self._group(st.st_gid),
+            uid,
+        )
+
+    def _name(self, path: str) -> str:
+        return '/' if path == self.root else os.path.basename(path)
+
+    def _lookup(
+            self,
+            path: str,
+            name: str,
+    ) -> tuple[str, os.stat_result]:
+        if name == '..':
+            if path != self.root:
+                path = os.path.dirname(path)
+            return path, os.stat(path)
+        if '/' in name or name in ('', '.'):
+            raise Exception(Errors.Enotfound)
+
+        child: str = os.path.join(path, name)
+        st: os.stat_result = os.lstat(child)
+        if stat.S_ISLNK(st.st_mode):
+            real: str = os.path.realpath(child)
+            if real != self.root and \
+                    not real.startswith(self.root + os.sep):
+                raise Exception(Errors.Eperm)
+            st = os.stat(child)
+
+        return child, st
+
+    def _fid(self, d: dict, fid: int | None = None) -> 'Py9ExportServer.Fid':
+        if fid is None:
+            fid = d['data']['fid']
+        with self.fid_lock:
+            entry = self.fids.get(d['client_id'], {}).get(fid)
+        if entry is None:
+            raise Exception(Errors.Eunknownfid)
+
+        return entry
+
+    def _writable(self) -> None:
+        if self.readonly:
+            raise Exception(Errors.Eperm)
+
+    def handle_disconnect(self, client_id: int) -> None:
+        with self.fid_lock:
+            fids: dict = self.fids.pop(client_id, {})
+        for entry in fids.values():
+            entry.close()
+
+    def _pop_fid(self, d: dict) -> 'Py9ExportServer.Fid':
+        with self.fid_lock:
+            entry = self.fids.get(d['client_id'], {}).pop(
+                d['data']['fid'],
+                None,
+            )
+        if entry is None:
+            raise Exception(Errors.Eunknownfid)
+
+        return entry
+
+    def handle_Tattach(self, d: dict):
+        client = self.clients[d['client_id']]
+        data = d['data']
+
+        qid: Qid = self._qid(os.stat(self.root))
+        with self.fid_lock:
+            fids = self.fids.setdefault(d['client_id'], {})
+            if data['fid'] in fids:
+                raise Exception(Errors.Edupfid)
+            fids[data['fid']] = Py9ExportServer.Fid(self.root, qid)
+
+        client.send(client._encode_Rattach(qid, data['tag']))
+
+    @blocking
+    def handle_Twalk(self, d: dict):
+        client = self.clients[d['client_id']]
+        data = d['data']
+
+        entry = self._fid(d)
+        if entry.mode is not None:
+            raise Exception(Errors.Ebotch)
+        if data['newfid'] != data['fid']:
+            with self.fid_lock:
+                if data['newfid'] in self.fids[d['client_id']]:
+                    raise Exception(Errors.Edupfid)
+
+        path: str = entry.path
+        qid: Qid = entry.qid
+        qids: list[Qid] = []
+        for name in data['wnames']:
+            if not qid._type & QTDIR:
+                if not qids:
+                    raise Exception(Errors.Ewalknodir)
+                break
+            try:
+                path, st = self._lookup(path, os.fsdecode(name))
+                qid = self._qid(st)
+            except Exception:
+                if not qids:
+                    raise
+                break
+            qids.append(qid)
+
+        if len(qids) == len(data['wnames']):
+            with self.fid_lock:
+                self.fids[d['client_id']][data['newfid']] = \
+                    Py9ExportServer.Fid(path, qid)
+
+        client.send(client._encode_Rwalk(qids, data['tag']))
+
+    @blocking
+    def handle_Topen(self, d: dict):
+        client = self.clients[d['client_id']]
+        data = d['data']
+
+        entry = self._fid(d)
+        if entry.mode is not None:
+            raise Exception(Errors.Ebotch)
+
+        mode: int = data['mode']
+        if mode & 3 in (OWRITE, ORDWR) or mode & OTRUNC:
+            self._writable()
+            if entry.qid._type & QTDIR:
+                raise Exception(Errors.Eisdir)
+
+        st: os.stat_result = os.stat(entry.path)
+        if not stat.S_ISDIR(st.st_mode):
+            flags: int = OPEN_FLAGS[mode & 3]
+            if mode & OTRUNC:
+                flags |= os.O_TRUNC
+            entry.fd = os.open(entry.path, flags)
+            st = os.fstat(entry.fd)
+        entry.qid = self._qid(st)
+        entry.mode = mode
+
+        client.send(client._encode_Ropen(
+            entry.qid,
+            client.msize - IOHDRSZ,
+            data['tag'],
+        ))
+
+    @blocking
+    def handle_Tcreate(self, d: dict):
+        client = self.clients[d['client_id']]
+        data = d['data']
+
+        self._writable()
+        entry = self._fid(d)
+        if entry.mode is not None:
+            raise Exception(Errors.Ebotch)
+        if not entry.qid._type & QTDIR:
+            raise Exception(Errors.Ecreatenondir)
+
+        name: str = os.fsdecode(data['name'])
+        if name in ('.', '..') or '/' in name or not name:
+            raise Exception(Errors.Enocreate)
+
+        path: str = os.path.join(entry.path, name)
+        perm: int = data['perm']
+        if perm & DMDIR:
+            os.mkdir(path, perm & 0o777)
+            st: os.stat_result = os.stat(path)
+        else:
+            flags: int = OPEN_FLAGS[data['mode'] & 3] | os.O_CREAT | os.O_EXCL
+            if data['mode'] & OTRUNC:
+                flags |= os.O_TRUNC
+            fd: int = os.open(path, flags, perm & 0o777)
+            entry.fd = fd
+            st = os.fstat(fd)
+
+        entry.path = path
+        entry.qid = self._qid(st)
+        entry.mode = data['mode']
+
+        client.send(client._encode_Rcreate(
+            entry.qid,
+            client.msize - IOHDRSZ,
+            data['tag'],
+        ))
+
+    def _listing(self, entry: 'Py9ExportServer.Fid') -> list[bytes]:
+        entries: list[bytes] = []
+        with os.scandir(entry.path) as it:
+            for child in it:
+                try:
+                    st: os.stat_result = child.stat()
+                except OSError:
+                    st = child.stat(follow_symlinks=False)
+                entries.append(self._stat(child.name, st).to_bytes())
+
+        return entries
+
+    @blocking
+    def handle_Tread(self, d: dict):
+        client = self.clients[d['client_id']]
+        data = d['data']
+
+        entry = self._fid(d)
+        if entry.mode is None:
+            raise Exception(Errors.Ebotch)
+
+        count: int = min(data['count'], client.msize - IOHDRSZ)
+        if entry.fd is not None:
+            client.send(client._encode_Rread_iov(
+                os.pread(entry.fd, count, data['offset']),
+                data['tag'],
+            ))
+            return
+
+        # Directory contents are encoded once per open.
+        with entry.lock:
+            listing: bytes = self._read_dir(
+                entry,
+                data['offset'],
+                count,
+                self._listing,
+            )
+        client.send(client._encode_Rread(listing, data['tag']))
+
+    @blocking
+    def handle_Twrite(self, d: dict):
+        client = self.clients[d['client_id']]
+        data = d['data']
+
+        entry = self._fid(d)
+        if entry.fd is None or entry.mode & 3 not in (OWRITE, ORDWR):
+            raise Exception(Errors.Ebotch)
+
+        count: int = os.pwrite(entry.fd, data['data'], data['offset'])
+
+        client.send(client._encode_Rwrite(count, data['tag']))
+
+    def handle_Tclunk(self, d: dict):
+        client = self.clients[d['client_id']]
+        data = d['data']
+
+        self._pop_fid(d).close()
+
+        client.send(client._encode_Rclunk(data['tag']))
+
+    @blocking
+    def handle_Tremove(self, d: dict):
+        client = self.clients[d['client_id']]
+        data = d['data']
+
+        entry = self._pop_fid(d)
+        entry.close()
+        self._writable()
+        if entry.path == self.root:
+            raise Exception(Errors.Enoremove)
+
+        if entry.qid._type & QTDIR:
+            os.rmdir(entry.path)
+        else:
+            os.unlink(entry.path)
+
+        client.send(client._encode_Rremove(data['tag']))
+
+    @blocking
+    def handle_Tstat(self, d: dict):
+        client = self.clients[d['client_id']]
+        data = d['data']
+
+        entry = self._fid(d)
+        st: os.stat_result = os.fstat(entry.fd) if entry.fd is not None \
+            else os.stat(entry.path)
+
+        client.send(client._encode_Rstat(
+            self._stat(self._name(entry.path), st),
+            data['tag'],
+        ))
+
+    @blocking
+    def handle_Twstat(self, d: dict):
+        client = self.clients[d['client_id']]
+        data = d['data']
+
+        self._writable()
+        entry = self._fid(d)
+        change: Stat = data['stat']
+
+        if change.length != NOCHANGE64:
+            if entry.qid._type & QTDIR:
+                raise Exception(Errors.Eisdir)
+            os.truncate(entry.path, change.length)
+        if change.mode != NOCHANGE32:
+            os.chmod(entry.path, change.mode & 0o7777)
+        if change.mtime != NOCHANGE32:
+            st: os.stat_result = os.stat(entry.path)
+            os.utime(entry.path, (st.st_atime, change.mtime))
+        # An empty name leaves it unchanged.
+        if change.name and change.name != self._name(entry.path):
+            if entry.path == self.root or change.name in ('.', '..') or \
+                    '/' in change.name:
+                raise Exception(Errors.Eperm)
+            old: str = entry.path
+            path: str = os.path.join(os.path.dirname(old), change.name)
+            os.rename(old, path)
+            # Fids of every connection may point into the renamed tree.
+            with self.fid_lock:
+                for fids in self.fids.values():
+                    for other in fids.values():
+                        if other.path == old:
+                            other.path = path
+                        elif other.path.startswith(old + os.sep):
+                            other.path = path + other.path[len(old):]
+
+        client.send(client._encode_Rwstat(data['tag']))
@@ -0,0 +1,64 @@
+from py9server import Py9Server
+from errors import Errors
+
+
+class Py9FileServer(Py9Server):
+    def dispatch(self, packet: dict):
+        try:
+            return super().dispatch(packet)
+        except Exception as e:
+            client = self.clients.get(packet['client_id'])
+            if client is None:
+                return
+            ename: str = e.strerror if isinstance(e, OSError) and \
+                e.strerror else str(e)
+            client.send(client._encode_Rerror(
+                ename or str(Errors.Ebotch),
+                packet['data']['tag'],
+            ))
+
+    def handle_Tversion(self, d: dict):
+        self.handle_disconnect(d['client_id'])
+        return super().handle_Tversion(d)
+
+    def handle_Tauth(self, d: dict):
+        raise Exception('authentication not required')
+
+    def handle_Tflush(self, d: dict):
+        client = self.clients[d['client_id']]
+
+        client.send(client._encode_Rflush(d['data']['tag']))
+
+    @staticmethod
+    def _read_dir(
+            entry,
+            offset: int,
+            count: int,
+            listing,
+            encode=None,
+    ) -> bytes:
+        # Directory contents are snapshotted by listing at offset 0, then
+        # served in slices that never split an entry. encode may turn each
+        # listed item into its record lazily, or skip it by returning None.
+        if offset == 0:
+            entry.entries = listing(entry)
+            entry.index = 0
+            entry.end = 0
+        elif offset != entry.end:
+            raise Exception(Errors.Ebadoffset)
+
+        chunk: list[bytes] = []
+        size: int = 0
+        while entry.index < len(entry.entries):
+            record: bytes | None = entry.entries[entry.index]
+            if encode is not None:
+                record = encode(record)
+            if record is not None:
+                if size + len(record) > count:
+                    break
+                chunk.append(record)
+                size += len(record)
+            entry.index += 1
+        entry.end += size
+
+        return b''.join(chunk)
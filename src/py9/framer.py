@@ -0,0 +1,69 @@
+import socket
+import struct
+
+from codec import HEADER_LEN
+
+
+class Framer:
+    def __init__(
+            self,
+            msize: int = 32768,
+            chunk: int = 262144,
+    ) -> None:
+        self.msize: int = msize
+        self.chunk: int = chunk
+        self.buffer: bytearray = bytearray(chunk)
+        self.view: memoryview = memoryview(self.buffer)
+        self.start: int = 0
+        self.end: int = 0
+
+    def pending(self) -> int:
+        return self.end - self.start
+
+    def _needed(self) -> int:
+        if self.end - self.start < 4:
+            return 4
+
+        return struct.unpack_from('<I', self.buffer, self.start)[0]
+
+    def _renew(self) -> None:
+        # Frames handed out earlier are views into the current buffer and
+        # may still be in use, so only the unfinished frame is carried over
+        # into a fresh buffer instead of being moved to the front. The
+        # buffer only grows past chunk for a frame that needs it, so a large
+        # msize costs nothing until it is used.
+        pending: int = self.end - self.start
+        buffer = bytearray(
+            max(self.chunk, min(self._needed(), self.msize), pending),
+        )
+        buffer[0:pending] = self.view[self.start:self.end]
+
+        self.buffer = buffer
+        self.view = memoryview(buffer)
+        self.start = 0
+        self.end = pending
+
+    def fill(self, sock: socket.socket) -> int:
+        # Only the unfinished frame is ever pending here. As long as it fits
+        # in the buffer it keeps being received in place, however little
+        # room is left, so a large frame is never copied more than once.
+        if self.start + self._needed() > len(self.buffer):
+            self._renew()
+
+        received: int = sock.recv_into(self.view[self.end:])
+        self.end += received
+
+        return received
+
+    def frames(self):
+        while self.end - self.start >= 4:
+            size: int = struct.unpack_from('<I', self.buffer, self.start)[0]
+            if size < HEADER_LEN or size > self.msize:
+                raise Exception(f'Invalid message size {size}')
+            if self.end - self.start < size:
+                break
+
+            frame: memoryview = self.view[self.start:self.start + size]
+            self.start += size
+
+            yield frame
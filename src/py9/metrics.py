@@ -0,0 +1,186 @@
+from trs import TRs
+
+from math import frexp
+
+import threading
+
+
+# Upper bounds of the latency buckets, 1us to about 67s in powers of two.
+BUCKETS: tuple[float, ...] = tuple(2 ** i / 1e6 for i in range(27))
+
+
+class Histogram:
+    __slots__ = ('counts', 'total')
+
+    def __init__(self) -> None:
+        self.counts: list[int] = [0] * (len(BUCKETS) + 1)
+        self.total: float = 0.0
+
+    def observe(self, seconds: float) -> None:
+        # frexp yields the power of two just above the value in
+        # microseconds, which is the bucket index, without a search. The
+        # bounds are inclusive, so an exact power of two belongs one lower.
+        mantissa, index = frexp(seconds * 1e6)
+        if mantissa == 0.5:
+            index -= 1
+        if index < 0:
+            index = 0
+        elif index > len(BUCKETS):
+            index = len(BUCKETS)
+        self.counts[index] += 1
+        self.total += seconds
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def quantile(self, fraction: float) -> float:
+        total: int = self.count
+        if not total:
+            return 0.0
+
+        rank: float = fraction * total
+        seen: int = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen and seen >= rank:
+                return bound
+
+        return float('inf')
+
+
+class Metrics:
+    # One instance may be shared by pooled clients and by the threads a
+    # server offloads to, so updates are serialized by a lock. The
+    # in-flight gauge is derived from the counters when read, less the
+    # requests whose reply a flush or a disconnect cancelled.
+
+    def __init__(self, prefix: str = 'py9') -> None:
+        self.prefix: str = prefix
+        self.messages_in: list[int] = [0] * 256
+        self.messages_out: list[int] = [0] * 256
+        self.bytes_in: int = 0
+        self.bytes_out: int = 0
+        self.flushed: int = 0
+        self.latency: dict[int, Histogram] = {}
+        self.callbacks: list = []
+        self.lock = threading.Lock()
+
+    def count_in(self, operation: int, size: int) -> None:
+        with self.lock:
+            self.messages_in[operation] += 1
+            self.bytes_in += size
+
+    def count_out(self, operation: int, size: int) -> None:
+        with self.lock:
+            self.messages_out[operation] += 1
+            self.bytes_out += size
+
+    def count_flushed(self, requests: int = 1) -> None:
+        with self.lock:
+            self.flushed += requests
+
+    def observe(self, operation: int, seconds: float) -> None:
+        with self.lock:
+            histogram: Histogram | None = self.latency.get(operation)
+            if histogram is None:
+                histogram = self.latency[operation] = Histogram()
+            histogram.observe(seconds)
+
+        for callback in self.callbacks:
+            callback(TRs(operation), seconds)
+
+    def add_callback(self, callback) -> None:
+        self.callbacks.append(callback)
+
+    def remove_callback(self, callback) -> None:
+        self.callbacks.remove(callback)
+
+    @property
+    def in_flight(self) -> int:
+        counts: list[int] = [
+            a + b for a, b in zip(self.messages_in, self.messages_out)
+        ]
+
+        return sum(counts[0::2]) - sum(counts[1::2]) - self.flushed
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return self._snapshot()
+
+    def _snapshot(self) -> dict:
+        return {
+            'messages_in': {
+                TRs(op).name: count
+                for op, count in enumerate(self.messages_in) if count
+            },
+            'messages_out': {
+                TRs(op).name: count
+                for op, count in enumerate(self.messages_out) if count
+            },
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'in_flight': self.in_flight,
+            'latency': {
+                TRs(op).name: {
+                    'count': histogram.count,
+                    'sum': histogram.total,
+                    'p50': histogram.quantile(0.5),
+                    'p99': histogram.quantile(0.99),
+                }
+                for op, histogram in sorted(self.latency.items())
+            },
+        }
+
+    def to_prometheus(self) -> str:
+        with self.lock:
+            return self._to_prometheus()
+
+    def _to_prometheus(self) -> str:
+        name: str = self.prefix
+        lines: list[str] = [
+            f'# HELP {name}_messages_total 9P messages by type.',
+            f'# TYPE {name}_messages_total counter',
+        ]
+        for direction, counts in (
+                ('in', self.messages_in),
+                ('out', self.messages_out),
+        ):
+            for op, count in enumerate(counts):
+                if count:
+                    lines.append(
+                        f'{name}_messages_total{{direction="{direction}",'
+                        f'type="{TRs(op).name}"}} {count}'
+                    )
+
+        lines += [
+            f'# HELP {name}_bytes_total Bytes of 9P messages.',
+            f'# TYPE {name}_bytes_total counter',
+            f'{name}_bytes_total{{direction="in"}} {self.bytes_in}',
+            f'{name}_bytes_total{{direction="out"}} {self.bytes_out}',
+            f'# HELP {name}_in_flight Requests awaiting a reply.',
+            f'# TYPE {name}_in_flight gauge',
+            f'{name}_in_flight {self.in_flight}',
+            f'# HELP {name}_request_duration_seconds Request latency.',
+            f'# TYPE {name}_request_duration_seconds histogram',
+        ]
+        for op, histogram in sorted(self.latency.items()):
+            label: str = f'type="{TRs(op).name}"'
+            cumulative: int = 0
+            for bound, count in zip(BUCKETS, histogram.counts):
+                cumulative += count
+                lines.append(
+                    f'{name}_request_duration_seconds_bucket'
+                    f'{{{label},le="{bound:g}"}} {cumulative}'
+                )
+            cumulative += histogram.counts[-1]
+            lines += [
+                f'{name}_request_duration_seconds_bucket'
+                f'{{{label},le="+Inf"}} {cumulative}',
+                f'{name}_request_duration_seconds_sum{{{label}}} '
+                f'{histogram.total}',
+                f'{name}_request_duration_seconds_count{{{label}}} '
+                f'{cumulative}',
+            ]
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,196 @@
+from py9client import Py9Client
+from trs import TRs
+
+from contextlib import contextmanager
+
+import threading
+import time
+
+
+CACHES: tuple[str, ...] = ('cache', 'walk_cache', 'stat_cache')
+
+
+class Py9ClientPool:
+    def __init__(
+            self,
+            max_size: int = 8,
+            idle_timeout: float = 60.0,
+            check_after: float = 1.0,
+            check_timeout: float = 5.0,
+            msize: int = 32768,
+            version: str = "9P2000",
+            **options,
+    ) -> None:
+        self.max_size: int = max_size
+        self.idle_timeout: float = idle_timeout
+        self.check_after: float = check_after
+        self.check_timeout: float = check_timeout
+        self.msize: int = msize
+        self._version: str = version
+        self.options: dict = options
+
+        self.condition: threading.Condition = threading.Condition()
+        self.idle: dict[tuple, list[tuple[Py9Client, float]]] = {}
+        self.sizes: dict[tuple, int] = {}
+        self.keys: dict[int, tuple] = {}
+        self.closed: bool = False
+
+    def acquire(
+            self,
+            host: str,
+            port: int,
+            uname: str = 'testuser',
+            aname: str = '',
+            timeout: float | None = None,
+    ) -> Py9Client:
+        key: tuple = (host, port, uname, aname)
+        deadline: float | None = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+
+        while True:
+            client: Py9Client | None = None
+            with self.condition:
+                self._prune()
+                while True:
+                    if self.closed:
+                        raise Exception('Connection pool is closed')
+                    idle: list = self.idle.get(key, [])
+                    if idle:
+                        client, since = idle.pop()
+                        break
+                    if self.sizes.get(key, 0) < self.max_size:
+                        self.sizes[key] = self.sizes.get(key, 0) + 1
+                        break
+                    remaining: float | None = None
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise Exception('Connection pool exhausted')
+                    self.condition.wait(remaining)
+
+            if client is None:
+                return self._connect(key)
+            if (time.monotonic() - since < self.check_after or
+                    self._healthy(client)):
+                self.keys[id(client)] = key
+                return client
+
+            self._discard(key, client)
+
+    def release(self, client: Py9Client, discard: bool = False) -> None:
+        key: tuple | None = self.keys.pop(id(client), None)
+        if key is None:
+            raise Exception('Client does not belong to this pool')
+
+        if discard or self.closed or not client.is_connected or \
+                client.requests:
+            self._discard(key, client)
+            return
+
+        with self.condition:
+            self.idle.setdefault(key, []).append((client, time.monotonic()))
+            self.condition.notify()
+
+    @contextmanager
+    def lease(
+            self,
+            host: str,
+            port: int,
+            uname: str = 'testuser',
+            aname: str = '',
+            timeout: float | None = None,
+    ):
+        client: Py9Client = self.acquire(host, port, uname, aname, timeout)
+        try:
+            yield client
+        except BaseException:
+            self.release(client, discard=True)
+            raise
+        self.release(client)
+
+    def close(self) -> None:
+        with self.condition:
+            self.closed = True
+            idle, self.idle = self.idle, {}
+            for key, clients in idle.items():
+                self._shrink(key, len(clients))
+            self.condition.notify_all()
+
+        for clients in idle.values():
+            for client, _ in clients:
+                client.close()
+
+    def stats(self) -> dict:
+        with self.condition:
+            return {
+                'connections': sum(self.sizes.values()),
+                'idle': sum(len(clients) for clients in self.idle.values()),
+                'leased': len(self.keys),
+            }
+
+    def _connect(self, key: tuple) -> Py9Client:
+        host, port, uname, aname = key
+        client: Py9Client | None = None
+        # Cached blocks are keyed by qid path and cached walks hold fids,
+        # which only mean something on the connection that produced them.
+        # The caches given to the pool are templates and every connection
+        # fills empty ones of its own.
+        options: dict = dict(self.options)
+        for name in CACHES:
+            if options.get(name) is not None:
+                options[name] = options[name].spawn()
+        try:
+            client = Py9Client(
+                host,
+                port,
+                self.msize,
+                self._version,
+                **options,
+            )
+            client.connect()
+            client._check(client.attach(uname, aname))
+        except BaseException:
+            if client is not None:
+                client.close()
+            self._discard(key, None)
+            raise
+
+        self.keys[id(client)] = key
+
+        return client
+
+    def _healthy(self, client: Py9Client) -> bool:
+        try:
+            client.socket.settimeout(self.check_timeout)
+            try:
+                data: dict = client.stat(client.root_fid)
+            finally:
+                client.socket.settimeout(None)
+        except Exception:
+            return False
+
+        return data['operation'] == TRs.Rstat
+
+    def _discard(self, key: tuple, client: Py9Client | None) -> None:
+        if client is not None:
+            client.close()
+
+        with self.condition:
+            self._shrink(key)
+            self.condition.notify()
+
+    def _shrink(self, key: tuple, count: int = 1) -> None:
+        self.sizes[key] -= count
+        if not self.sizes[key]:
+            del self.sizes[key]
+
+    def _prune(self) -> None:
+        now: float = time.monotonic()
+        for key in list(self.idle):
+            clients: list = self.idle[key]
+            while clients and now - clients[0][1] > self.idle_timeout:
+                clients.pop(0)[0].close()
+                self._shrink(key)
+            if not clients:
+                del self.idle[key]
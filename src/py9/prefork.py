@@ -0,0 +1,148 @@
+from py9server import Py9Server
+
+import os
+import signal
+import socket
+import time
+import traceback
+
+
+class PreforkServer:
+    # Every worker binds its own SO_REUSEPORT listener and runs its own
+    # selector loop, so the kernel spreads new connections across the
+    # workers. The parent only supervises. It keeps a bound but
+    # non-listening socket, which reserves the port (and resolves port 0)
+    # without taking part in the load balancing.
+
+    def __init__(
+            self,
+            server_class: type[Py9Server],
+            ip: str,
+            port: int,
+            workers: int | None = None,
+            grace: float = 10.0,
+            restart_delay: float = 1.0,
+            **options,
+    ) -> None:
+        self.server_class: type[Py9Server] = server_class
+        self.ip: str = ip
+        self.port: int = port
+        self.workers: int = workers or os.cpu_count() or 1
+        self.grace: float = grace
+        self.restart_delay: float = restart_delay
+        self.options: dict = options
+
+        self.socket: socket.socket | None = None
+        self.pids: dict[int, float] = {}
+        self.stopping: bool = False
+
+    def start(self) -> None:
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self.socket.bind((self.ip, self.port))
+        self.port = self.socket.getsockname()[1]
+
+        for _ in range(self.workers):
+            self._spawn()
+
+    def serve_forever(self) -> None:
+        if self.socket is None:
+            self.start()
+
+        previous: dict = {
+            signum: signal.signal(signum, self._on_signal)
+            for signum in (signal.SIGTERM, signal.SIGINT)
+        }
+        try:
+            self.supervise()
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+            self.stop()
+
+    def supervise(self) -> None:
+        while self.pids and not self.stopping:
+            try:
+                pid, _ = os.wait()
+            except ChildProcessError:
+                break
+            started: float | None = self.pids.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+
+            if time.monotonic() - started < self.restart_delay:
+                time.sleep(self.restart_delay)
+            if not self.stopping:
+                self._spawn()
+
+    def stop(self) -> None:
+        self.stopping = True
+        self._signal_workers(signal.SIGTERM)
+
+        deadline: float = time.monotonic() + self.grace + 1.0
+        while self.pids and time.monotonic() < deadline:
+            for pid in list(self.pids):
+                done, _ = os.waitpid(pid, os.WNOHANG)
+                if done:
+                    del self.pids[pid]
+            time.sleep(0.05)
+
+        self._signal_workers(signal.SIGKILL)
+        for pid in list(self.pids):
+            os.waitpid(pid, 0)
+            del self.pids[pid]
+
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+    def _on_signal(self, signum: int, frame) -> None:
+        self.stopping = True
+        self._signal_workers(signal.SIGTERM)
+
+    def _signal_workers(self, signum: int) -> None:
+        for pid in self.pids:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def _spawn(self) -> int:
+        pid: int = os.fork()
+        if pid:
+            self.pids[pid] = time.monotonic()
+            return pid
+
+        status: int = 0
+        try:
+            self.socket.close()
+            self._worker()
+        except BaseException:
+            traceback.print_exc()
+            status = 1
+        finally:
+            os._exit(status)
+
+    def _worker(self) -> None:
+        stopping: list[bool] = [False]
+
+        def on_signal(signum: int, frame) -> None:
+            stopping[0] = True
+
+        signal.signal(signal.SIGTERM, on_signal)
+        signal.signal(signal.SIGINT, on_signal)
+
+        server: Py9Server = self.server_class(
+            self.ip,
+            self.port,
+            reuse_port=True,
+            **self.options,
+        )
+
+        while not stopping[0]:
+            server.serve(0.5)
+
+        server.stop_listening()
+        deadline: float = time.monotonic() + self.grace
+        while server.clients and time.monotonic() < deadline:
+            server.serve(0.5)
@@ -3,16 +3,24 @@ from abc import abstractmethod
 import selectors
 import socket
 import struct
+import threading
 
 from trs import TRs
 from qid import Qid
 from stat9 import Stat
-
-from utils import (
-    encode_string,
-    STR_LEN,
+from metrics import Metrics
+from capture import Capture, RECEIVED, SENT
+
+from codec import (
+    ENCODE,
+    ENCODE_IOV,
+    HEADER,
+    HEADER_LEN,
+    MESSAGES,
 )
 
+from utils import NOTAG
+
 
 class Py9:
     # http://man.cat-v.org/plan_9/5
@@ -25,425 +33,199 @@ class Py9:
             port: int,
             msize: int = 32768,
             version: str = "9P2000",
+            metrics: Metrics | None = None,
+            capture: Capture | None = None,
     ) -> None:
         self.ip: str = ip
         self.port: int = port
         self.msize: int = msize
         self._version: str = version
+        self.metrics: Metrics | None = metrics
+        self.capture: Capture | None = capture
+        self.capture_id: int = 0
+        if capture is not None:
+            self.capture_id = capture.connection()
         self.selector: selectors.BaseSelector = selectors.DefaultSelector()
         self.socket: socket.socket = socket.socket(
             socket.AF_INET,
             socket.SOCK_STREAM,
         )
         self.selector.register(self.socket, selectors.EVENT_READ)
+        # Only small replies land in rbuf, so it starts small and grows to
+        # the largest such reply instead of being sized for a whole msize.
+        self.rbuf: bytearray = bytearray(min(msize, 8192))
+        self.rview: memoryview = memoryview(self.rbuf)
 
         self.tag: int = -1
+        self.tags: set[int] = set()
+        self.tag_lock: threading.Lock = threading.Lock()
+
+    def get_tag(self) -> int:
+        with self.tag_lock:
+            if len(self.tags) >= NOTAG:
+                raise Exception('All tags are in flight')
 
-    def get_tag(self):
-        self.tag += 1
-        if self.tag > 65535:
-            self.tag = 0
+            tag: int = self.tag
+            while True:
+                tag = (tag + 1) % NOTAG
+                if tag not in self.tags:
+                    break
 
-        return self.tag
+            self.tag = tag
+            self.tags.add(tag)
 
-    def _recv_n(
+        return tag
+
+    def release_tag(self, tag: int) -> None:
+        with self.tag_lock:
+            self.tags.discard(tag)
+
+    def _send(
             self,
             sock: socket.socket,
-            num: int,
-    ) -> bytes:
-        assert num > 0
-
-        buffer: bytes = b''
+            packet: bytes | list,
+    ) -> None:
+        if self.metrics is not None:
+            size, op, _ = HEADER.unpack_from(
+                packet[0] if isinstance(packet, list) else packet)
+            self.metrics.count_out(op, size)
+        if self.capture is not None:
+            self.capture.record(self.capture_id, SENT, packet)
+
+        if not isinstance(packet, list):
+            sock.sendall(packet)
+            return
+
+        views: list[memoryview] = [memoryview(b).cast('B') for b in packet]
+        while views:
+            sent: int = sock.sendmsg(views)
+            while views and sent >= len(views[0]):
+                sent -= len(views[0])
+                views.pop(0)
+            if sent:
+                views[0] = views[0][sent:]
+
+    def _recv_into(
+            self,
+            sock: socket.socket,
+            view: memoryview,
+    ) -> None:
         i: int = 0
+        num: int = len(view)
 
         while i < num:
-            buffer += sock.recv(num - i)
-            i = len(buffer)
-
-        return buffer
+            received: int = sock.recv_into(view[i:])
+            if received == 0:
+                raise ConnectionError('Connection closed by peer')
+            i += received
 
     def _recv(
             self,
             sock: socket.socket,
+            sink=None,
     ) -> dict:
-        size: int = struct.unpack('<I', self._recv_n(sock, 4))[0]
-        buf: bytes = self._recv_n(sock, size - 4)
-        operation: TRs = TRs(struct.unpack('<B', buf[0:1])[0])
-        tag: int = struct.unpack('<H', buf[1:3])[0]
-        other_data: dict = self._parse_data(operation, buf[3:])
+        self._recv_into(sock, self.rview[0:HEADER_LEN])
+        size, op, tag = HEADER.unpack_from(self.rbuf, 0)
+        if size < HEADER_LEN or size > self.msize:
+            raise Exception(f'Invalid message size {size}')
+        operation: TRs = TRs(op)
+        if self.metrics is not None:
+            self.metrics.count_in(op, size)
+
+        if operation == TRs.Rread and sink is not None:
+            target = sink(tag)
+            if target is not None:
+                data: dict = self._recv_Rread_into(sock, size, target)
+                if self.capture is not None:
+                    self.capture.record(self.capture_id, RECEIVED, [
+                        HEADER.pack(size, op, tag),
+                        self.rview[HEADER_LEN:HEADER_LEN + 4],
+                        data['data'],
+                    ])
+                return {
+                    'operation': operation,
+                    'tag': tag,
+                } | data
+
+        body: memoryview
+        if operation in (TRs.Rread, TRs.Twrite):
+            # The payload is handed to the caller as is and may be kept
+            # while later replies arrive, so it cannot live in rbuf. Callers
+            # that want to avoid the allocation pass a sink instead.
+            body = memoryview(bytearray(size - HEADER_LEN))
+        else:
+            if size > len(self.rbuf):
+                self.rbuf = bytearray(size)
+                self.rview = memoryview(self.rbuf)
+            body = self.rview[HEADER_LEN:size]
+        self._recv_into(sock, body)
+        if self.capture is not None:
+            self.capture.record(self.capture_id, RECEIVED, [
+                HEADER.pack(size, op, tag),
+                body,
+            ])
+        other_data: dict = self._parse_data(operation, body)
 
         return {
             'operation': operation,
             'tag': tag,
         } | other_data
 
-    def _decode_qid(self, qid: bytes) -> dict:
-        _type: int = struct.unpack('<B', qid[0:1])[0]
-        version: int = struct.unpack('<I', qid[1:5])[0]
-        path: int = struct.unpack('<Q', qid[5:13])[0]
+    def _recv_Rread_into(
+            self,
+            sock: socket.socket,
+            size: int,
+            target: memoryview,
+    ) -> dict:
+        self._recv_into(sock, self.rview[HEADER_LEN:HEADER_LEN + 4])
+        count: int = struct.unpack_from('<I', self.rbuf, HEADER_LEN)[0]
+        if count != size - HEADER_LEN - 4 or count > len(target):
+            raise Exception(f'Invalid Rread count {count}')
 
-        ret = {
-            '_type': _type,
-            'version': version,
-            'path': path,
-        }
+        self._recv_into(sock, target[0:count])
 
-        return ret
+        return {
+            'count': count,
+            'data': target[0:count],
+        }
 
     def _parse_data(
             self,
             operation,
             data: bytes,
     ) -> dict:
-        ret: dict
-        match operation:
-            case TRs.Tversion:
-                msize: int = struct.unpack('<I', data[0:4])[0]
-                version_len: int = struct.unpack('<H', data[4:6])[0]
-                version: bytes = data[4 + STR_LEN:4 + STR_LEN + version_len]
-
-                ret = {
-                    'msize': msize,
-                    'version': version,
-                }
-
-            case TRs.Rversion:
-                msize: int = struct.unpack('<I', data[0:4])[0]
-                version_len: int = struct.unpack('<H', data[4:6])[0]
-                version: bytes = data[4 + STR_LEN:4 + STR_LEN + version_len]
-
-                ret = {
-                    'msize': msize,
-                    'version': version,
-                }
-
-            case TRs.Tauth:
-                uname_len: int = struct.unpack('<H', data[4: 4 + STR_LEN])[0]
-                aname_len: int = struct.unpack(
-                    '<H',
-                    data[4 + STR_LEN + uname_len:
-                         4 + STR_LEN + uname_len + STR_LEN])[0]
-
-                afid: int = struct.unpack('<I', data[0:4])[0]
-                uname: bytes = data[4 + STR_LEN: 4 + STR_LEN + uname_len]
-                aname: bytes = data[4 + STR_LEN + uname_len + STR_LEN:
-                                    4 + STR_LEN + uname_len + STR_LEN +
-                                    aname_len]
-
-                ret = {
-                    'afid': afid,
-                    'uname': uname,
-                    'aname': aname,
-                }
-
-            case TRs.Rauth:
-                aqid: bytes = data[0:13]
-
-                ret = {
-                    'aqid': aqid,
-                }
-
-            case TRs.Tattach:
-                uname_len: int = struct.unpack('<H', data[8: 8 + STR_LEN])[0]
-                aname_len: int = struct.unpack(
-                    '<H',
-                    data[8 + STR_LEN + uname_len:
-                         8 + STR_LEN + uname_len + STR_LEN])[0]
-
-                fid: int = struct.unpack('<I', data[0:4])[0]
-                afid: int = struct.unpack('<I', data[4:8])[0]
-                uname: bytes = data[8 + STR_LEN: 8 + STR_LEN + uname_len]
-                aname: bytes = data[8 + STR_LEN + uname_len + STR_LEN:
-                                    8 + STR_LEN + uname_len + STR_LEN +
-                                    aname_len]
-
-                ret = {
-                    'fid': fid,
-                    'afid': afid,
-                    'uname': uname,
-                    'aname': aname,
-                }
-
-            case TRs.Rattach:
-                qid: bytes = data[0:13]
-
-                ret = {
-                    'qid': Qid.from_bytes(qid),
-                }
-
-            case TRs.Terror:
-                raise Exception('There is no Terror code')
-
-            case TRs.Rerror:
-                ename_len: int = struct.unpack('<H', data[0:0 + STR_LEN])[0]
-
-                ename: bytes = data[0 + STR_LEN:0 + STR_LEN + ename_len]
-
-                ret = {
-                    'ename': ename,
-                }
-
-            case TRs.Tflush:
-                oldtag: int = struct.unpack('<H', data[0:2])[0]
-
-                ret = {
-                    'oldtag': oldtag,
-                }
-
-            case TRs.Rflush:
-                ret = {}
-
-            case TRs.Twalk:
-                fid: int = struct.unpack('<I', data[0:4])[0]
-                newfid: int = struct.unpack('<I', data[4:8])[0]
-                nwname: int = struct.unpack('<H', data[8:10])[0]
-
-                wnames: list = []
-                offset: int = 10
-
-                for _ in range(nwname):
-                    wname_len = struct.unpack(
-                        '<H', data[offset:offset + STR_LEN])[0]
-                    wname: bytes = data[offset + STR_LEN:
-                                        offset + STR_LEN + wname_len]
-                    wnames.append(wname)
-                    offset += wname_len + STR_LEN
-
-                ret = {
-                    'fid': fid,
-                    'newfid': newfid,
-                    'nwname': nwname,
-                    'wnames': wnames,
-                }
-
-            case TRs.Rwalk:
-                nwqid: int = struct.unpack('<H', data[0:2])[0]
-
-                qids: list = []
-                offset: int = 2
-
-                for _ in range(nwqid):
-                    qid: bytes = data[offset:offset + 13]
-                    qids.append(Qid.from_bytes(qid))
-                    offset += 13
-
-                ret = {
-                    'qids': qids,
-                }
-
-            case TRs.Topen:
-                fid: int = struct.unpack('<I', data[0:4])[0]
-                mode: int = struct.unpack('<B', data[4:5])[0]
-
-                ret = {
-                    'fid': fid,
-                    'mode': mode,
-                }
-
-            case TRs.Ropen:
-                qid: bytes = data[0:13]
-                iounit: int = struct.unpack('<I', data[13:17])[0]
-
-                ret = {
-                    'qid': Qid.from_bytes(qid),
-                    'iounit': iounit,
-                }
-
-            case TRs.Tcreate:
-                name_len = struct.unpack('<H', data[4:4 + STR_LEN])[0]
-
-                fid: int = struct.unpack('<I', data[0:4])[0]
-                name: bytes = data[4 + STR_LEN:4 + STR_LEN + name_len]
-                perm: int = struct.unpack(
-                    '<I',
-                    data[4 + STR_LEN + name_len:
-                         4 + STR_LEN + name_len + 4])[0]
-                mode: int = struct.unpack(
-                    '<B',
-                    data[4 + STR_LEN + name_len + 4:
-                         4 + STR_LEN + name_len + 4 + 1])[0]
-
-                ret = {
-                    'fid': fid,
-                    'name': name,
-                    'perm': perm,
-                    'mode': mode,
-                }
-
-            case TRs.Rcreate:
-                qid: bytes = data[0:13]
-                iounit: bytes = data[13:17]
-
-                ret = {
-                    'qid': Qid.from_bytes(qid),
-                    'iounit': iounit,
-                }
-
-            case TRs.Tread:
-                fid: int = struct.unpack('<I', data[0:4])[0]
-                offset: int = struct.unpack('<Q', data[4:12])[0]
-                count: int = struct.unpack('<I', data[12:16])[0]
-
-                ret = {
-                    'fid': fid,
-                    'offset': offset,
-                    'count': count,
-                }
-
-            case TRs.Rread:
-                count: int = struct.unpack('<I', data[0:4])[0]
-                _data: bytes = data[4:4 + count]
-
-                ret = {
-                    'count': count,
-                    'data': _data,
-                }
-
-            case TRs.Twrite:
-                fid: int = struct.unpack('<I', data[0:4])[0]
-                offset: int = struct.unpack('<Q', data[4:12])[0]
-                count: int = struct.unpack('<I', data[12:16])[0]
-                _data: bytes = data[16:16 + count]
-
-                ret = {
-                    'fid': fid,
-                    'offset': offset,
-                    'count': count,
-                    'data': _data,
-                }
-
-            case TRs.Rwrite:
-                count: int = struct.unpack('<I', data[0:4])[0]
-
-                ret = {
-                    'count': count,
-                }
-
-            case TRs.Tclunk:
-                fid: int = struct.unpack('<I', data[0:4])[0]
-
-                ret = {
-                    'fid': fid,
-                }
-
-            case TRs.Rclunk:
-                ret = {}
-
-            case TRs.Tremove:
-                fid: int = struct.unpack('<I', data[0:4])[0]
-
-                ret = {
-                    'fid': fid,
-                }
-
-            case TRs.Rremove:
-                ret = {}
-
-            case TRs.Tstat:
-                fid: int = struct.unpack('<I', data[0:4])[0]
-
-                ret = {
-                    'fid': fid,
-                }
-
-            case TRs.Rstat:
-                stat_len: int = struct.unpack('<H', data[0:2])[0]
-                stats: bytes = data[0 + STR_LEN:0 + STR_LEN + stat_len]
-
-                ret = {
-                    'stat': Stat.from_bytes(stats),
-                }
-
-            case TRs.Twstat:
-                fid: int = struct.unpack('<I', data[0:4])[0]
-                stat: bytes = data[4:]
-
-                ret = {
-                    'fid': fid,
-                    'stat': stat,
-                }
-
-            case TRs.Rwstat:
-                ret = {}
-
-            case _:
-                raise Exception('No such operation')
-        return ret
+        message = MESSAGES.get(operation)
+        if message is None:
+            raise Exception('No such operation')
 
-    def _encode_packet(
-            self,
-            _type,
-            data: bytes,
-            tag: bytes = None,
-    ) -> bytes:
-        size: bytes = struct.pack('<I', len(data) + 7)
-        t: bytes = struct.pack('<B', _type.value)
-        if not tag:
-            tag = self.get_tag()
-
-        if isinstance(tag, int):
-            tag: bytes = struct.pack('<H', tag)
-
-        return size + t + tag + data
+        return message.decode(data)
 
     def _encode_Tversion(self) -> bytes:
-        buff: bytes = b''
-
-        buff += struct.pack('<I', self.msize)
-        buff += struct.pack('<H', len(self._version))
-        buff += self._version.encode()
-
-        return self._encode_packet(TRs.Tversion, buff)
+        return ENCODE.Tversion(self.get_tag(), self.msize, self._version)
 
     def _encode_Rversion(self, tag: int) -> bytes:
-        buff: bytes = b''
-
-        buff += struct.pack('<I', self.msize)
-        buff += struct.pack('<H', len(self._version))
-        buff += self._version.encode()
-
-        return self._encode_packet(TRs.Rversion, buff, tag)
+        return ENCODE.Rversion(tag, self.msize, self._version)
 
     def _encode_Tauth(self, afid: int, uname: str, aname: str) -> bytes:
-        buff: bytes = b''
-
-        buff += struct.pack('<I', afid)
-        buff += encode_string(uname)
-        buff += encode_string(aname)
-
-        return self._encode_packet(TRs.Tauth, buff)
+        return ENCODE.Tauth(self.get_tag(), afid, uname, aname)
 
     def _encode_Rauth(self, aqid: Qid, tag: int) -> bytes:
-        buff: bytes = b''
-
-        buff += aqid.to_bytes()
-
-        return self._encode_packet(TRs.Rauth, tag)
+        return ENCODE.Rauth(tag, aqid)
 
     def _encode_Rerror(self, ename: str, tag: int) -> bytes:
-        buff: bytes = b''
-
-        buff += encode_string(ename)
-
-        return self._encode_packet(TRs.Rerror, tag)
+        return ENCODE.Rerror(tag, ename)
 
     def _encode_Tflush(
             self,
             oldtag: int
     ) -> bytes:
-        buff: bytes = b''
-
-        buff += struct.pack('<H', oldtag)
-
-        return self._encode_packet(TRs.Tflush, buff)
+        return ENCODE.Tflush(self.get_tag(), oldtag)
 
     def _encode_Rflush(
             self,
             tag: int
     ) -> bytes:
-        buff: bytes = b''
-
-        return self._encode_packet(TRs.Rflush, buff, tag)
+        return ENCODE.Rflush(tag)
 
     def _encode_Tattach(
             self,
@@ -452,25 +234,14 @@ class Py9:
             uname: str = 'testuser',
             aname: str = '',
     ) -> bytes:
-        buff: bytes = b''
-
-        buff += struct.pack('<I', fid)
-        buff += struct.pack('<I', afid)
-        buff += encode_string(uname)
-        buff += encode_string(aname)
-
-        return self._encode_packet(TRs.Tattach, buff)
+        return ENCODE.Tattach(self.get_tag(), fid, afid, uname, aname)
 
     def _encode_Rattach(
             self,
             qid: Qid,
             tag: int,
     ) -> bytes:
-        buff: bytes = b''
-
-        buff += qid.to_bytes()
-
-        return self._encode_packet(TRs.Rattach, buff, tag)
+        return ENCODE.Rattach(tag, qid)
 
     def _encode_Twalk(
             self,
@@ -478,42 +249,21 @@ class Py9:
             newfid: int,
             names: list[str],
     ) -> bytes:
-        buff: bytes = b''
-
-        buff += struct.pack('<I', fid)
-        buff += struct.pack('<I', newfid)
-        buff += struct.pack('<H', len(names))
-
-        for name in names:
-            buff += encode_string(name)
-
-        return self._encode_packet(TRs.Twalk, buff)
+        return ENCODE.Twalk(self.get_tag(), fid, newfid, names)
 
     def _encode_Rwalk(
             self,
             nwqids: list[Qid],
             tag: int,
     ) -> bytes:
-        buff: bytes = b''
-
-        buff += struct.pack('<I', len(nwqids))
-
-        for nwqid in nwqids:
-            buff += nwqid.to_bytes()
-
-        return self._encode_packet(TRs.Rwalk, buff, tag)
+        return ENCODE.Rwalk(tag, nwqids)
 
     def _encode_Topen(
             self,
             fid: int,
             mode: int,
     ) -> bytes:
-        buff: bytes = b''
-
-        buff += struct.pack('<I', fid)
-        buff += struct.pack('<B', mode)
-
-        return self._encode_packet(TRs.Topen, buff)
+        return ENCODE.Topen(self.get_tag(), fid, mode)
 
     def _encode_Ropen(
             self,
@@ -521,12 +271,7 @@ class Py9:
             iounit: int,
             tag: int,
     ) -> bytes:
-        buff: bytes = b''
-
-        buff += qid.to_bytes()
-        buff += struct.pack('<I', iounit)
-
-        return self._encode_packet(TRs.Ropen, buff, tag)
+        return ENCODE.Ropen(tag, qid, iounit)
 
     def _encode_Tcreate(
             self,
@@ -535,14 +280,7 @@ class Py9:
             perm: int,
             mode: int,
     ) -> bytes:
-        buff: bytes = b''
-
-        buff += struct.pack('<I', fid)
-        buff += encode_string(name)
-        buff += struct.pack('<I', perm)
-        buff += struct.pack('<B', mode)
-
-        return self._encode_packet(TRs.Tcreate, buff)
+        return ENCODE.Tcreate(self.get_tag(), fid, name, perm, mode)
 
     def _encode_Rcreate(
             self,
@@ -550,12 +288,7 @@ class Py9:
             iounit: int,
             tag: int,
     ) -> bytes:
-        buff: bytes = b''
-
-        buff += qid.to_bytes()
-        buff += struct.pack('<I', iounit)
-
-        return self._encode_packet(TRs.Rcreate, buff, tag)
+        return ENCODE.Rcreate(tag, qid, iounit)
 
     def _encode_Tread(
             self,
@@ -563,25 +296,21 @@ class Py9:
             offset: int,
             count: int,
     ) -> bytes:
-        buff: bytes = b''
-
-        buff += struct.pack('<I', fid)
-        buff += struct.pack('<Q', offset)
-        buff += struct.pack('<I', count)
-
-        return self._encode_packet(TRs.Tread, buff)
+        return ENCODE.Tread(self.get_tag(), fid, offset, count)
 
     def _encode_Rread(
             self,
             data: bytes,
             tag: int,
     ) -> bytes:
-        buff: bytes = b''
-
-        buff += struct.pack('<I', len(data))
-        buff += data
+        return ENCODE.Rread(tag, data)
 
-        return self._encode_packet(TRs.Rread, buff, tag)
+    def _encode_Rread_iov(
+            self,
+            data: bytes,
+            tag: int,
+    ) -> list:
+        return ENCODE_IOV.Rread(tag, data)
 
     def _encode_Twrite(
             self,
@@ -589,105 +318,72 @@ class Py9:
             offset: int,
             data: bytes,
     ) -> bytes:
-        buff: bytes = b''
+        return ENCODE.Twrite(self.get_tag(), fid, offset, data)
 
-        buff += struct.pack('<I', fid)
-        buff += struct.pack('<Q', offset)
-        buff += struct.pack('<I', len(data))
-        buff += data
-
-        return self._encode_packet(TRs.Twrite, buff)
+    def _encode_Twrite_iov(
+            self,
+            fid: int,
+            offset: int,
+            data: bytes,
+    ) -> list:
+        return ENCODE_IOV.Twrite(self.get_tag(), fid, offset, data)
 
     def _encode_Rwrite(
             self,
             count: int,
             tag: int,
     ) -> bytes:
-        buff: bytes = b''
-
-        buff += struct.pack('<I', count)
-
-        return self._encode_packet(TRs.Rwrite, buff, tag)
+        return ENCODE.Rwrite(tag, count)
 
     def _encode_Tclunk(
             self,
             fid: int,
     ) -> bytes:
-        buff: bytes = b''
-
-        buff += struct.pack('<I', fid)
-
-        return self._encode_packet(TRs.Tclunk, buff)
+        return ENCODE.Tclunk(self.get_tag(), fid)
 
     def _encode_Rclunk(
             self,
             tag: int
     ) -> bytes:
-        buff: bytes = b''
-
-        return self._encode_packet(TRs.Rclunk, buff, tag)
+        return ENCODE.Rclunk(tag)
 
     def _encode_Tremove(
             self,
             fid: int,
     ) -> bytes:
-        buff: bytes = b''
-
-        buff += struct.pack('<I', fid)
-
-        return self._encode_packet(TRs.Tremove, buff)
+        return ENCODE.Tremove(self.get_tag(), fid)
 
     def _encode_Rremove(
             self,
             tag: int,
     ) -> bytes:
-        buff: bytes = b''
-
-        return self._encode_packet(TRs.Rremove, buff, tag)
+        return ENCODE.Rremove(tag)
 
     def _encode_Tstat(
             self,
             fid: int,
     ) -> bytes:
-        buff: bytes = b''
-
-        buff += struct.pack('<I', fid)
-
-        return self._encode_packet(TRs.Tstat, buff)
+        return ENCODE.Tstat(self.get_tag(), fid)
 
     def _encode_Rstat(
             self,
-            stats: list[Stat],
+            stat: Stat,
             tag: int,
     ) -> bytes:
-        buff: bytes = b''
-
-        buff += struct.pack('<H', len(stats))
-
-        for stat in stats:
-            buff += stat.to_bytes()
-
-        return self._encode_packet(TRs.Rstat, buff, tag)
+        return ENCODE.Rstat(tag, stat)
 
     def _encode_Twstat(
             self,
             fid: int,
             stat: Stat,
     ) -> bytes:
-        buff: bytes = b''
-
-        buff += struct.pack('<I', fid)
-        buff += stat.to_bytes()
-
-        return self._encode_packet(TRs.Tremove, buff)
+        return ENCODE.Twstat(self.get_tag(), fid, stat)
 
     def _encode_Rwstat(
             self,
             tag: int,
     ) -> bytes:
-        buff: bytes = b''
-
-        return self._encode_packet(TRs.Rremove, buff, tag)
+        return ENCODE.Rwstat(tag)
 
     @abstractmethod
     def __del__(self):
@@ -0,0 +1,206 @@
+from py9 import Py9
+from trs import TRs
+from stat9 import Stat
+from codec import HEADER_LEN
+
+from utils import MIN_MSIZE, NOTAG
+
+import asyncio
+import struct
+import threading
+
+
+class AsyncPy9Client(Py9):
+    def __init__(
+            self,
+            ip: str,
+            port: int,
+            msize: int = 32768,
+            version: str = "9P2000",
+    ) -> None:
+        self.ip: str = ip
+        self.port: int = port
+        self.msize: int = msize
+        self._version: str = version
+        self.reader: asyncio.StreamReader | None = None
+        self.writer: asyncio.StreamWriter | None = None
+        self.receiver: asyncio.Task | None = None
+        self.requests: dict[int, asyncio.Future] = {}
+        self.slots: asyncio.Semaphore = asyncio.Semaphore(NOTAG)
+        self.is_connected: bool = False
+
+        self.tag: int = -1
+        self.tags: set[int] = set()
+        self.tag_lock: threading.Lock = threading.Lock()
+
+    async def connect(self) -> None:
+        self.reader, self.writer = await asyncio.open_connection(
+            self.ip,
+            self.port,
+        )
+        self.receiver = asyncio.create_task(self._receive_loop())
+
+        data = await self.version()
+
+        if data['operation'] != TRs.Rversion:
+            raise Exception("Server hasn't responded with Rversion")
+        if data['tag'] != 0:
+            raise Exception("Server has responded to Tversion with invali tag")
+        if data['version'].decode() != self._version:
+            raise Exception(
+                "Server has responded with version " +
+                f"{data['version'].decode()}, expected {self._version}"
+            )
+        if not MIN_MSIZE <= data['msize'] <= self.msize:
+            raise Exception(
+                f"Server has responded with msize {data['msize']}, " +
+                f"expected at most {self.msize}"
+            )
+        self.msize = data['msize']
+
+        self.is_connected = True
+
+    async def close(self) -> None:
+        self.is_connected = False
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
+        if self.receiver is not None:
+            await self.receiver
+
+    async def _receive_loop(self) -> None:
+        error: Exception = Exception('Connection closed')
+        try:
+            while True:
+                header: bytes = await self.reader.readexactly(4)
+                size: int = struct.unpack('<I', header)[0]
+                if size < HEADER_LEN or size > self.msize:
+                    raise Exception(f'Invalid message size {size}')
+                buf: bytes = await self.reader.readexactly(size - 4)
+
+                operation: TRs = TRs(buf[0])
+                tag: int = struct.unpack_from('<H', buf, 1)[0]
+                other_data: dict = self._parse_data(
+                    operation,
+                    memoryview(buf)[3:],
+                )
+
+                future = self.requests.pop(tag, None)
+                if future is None:
+                    raise Exception(
+                        f"Server has responded with unknown tag {tag}")
+
+                self.release_tag(tag)
+                self.slots.release()
+                if not future.done():
+                    future.set_result({
+                        'operation': operation,
+                        'tag': tag,
+                    } | other_data)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            error = e
+        finally:
+            requests, self.requests = self.requests, {}
+            for future in requests.values():
+                if not future.done():
+                    future.set_exception(error)
+
+    async def _submit(self, encode, *args) -> asyncio.Future:
+        if self.receiver is None or self.receiver.done():
+            raise Exception('Client is not connected')
+
+        await self.slots.acquire()
+        try:
+            packet: bytes | list = encode(*args)
+        except Exception:
+            self.slots.release()
+            raise
+
+        head: bytes = packet[0] if isinstance(packet, list) else packet
+        tag: int = struct.unpack_from('<H', head, 5)[0]
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.requests[tag] = future
+
+        if isinstance(packet, list):
+            self.writer.writelines(packet)
+        else:
+            self.writer.write(packet)
+        await self.writer.drain()
+
+        return future
+
+    async def _transact(self, encode, *args) -> dict:
+        future = await self._submit(encode, *args)
+        return await future
+
+    def _abandon(self, oldtag: int) -> None:
+        future = self.requests.pop(oldtag, None)
+        if future is None:
+            return
+
+        self.release_tag(oldtag)
+        self.slots.release()
+        if not future.done():
+            future.set_result({
+                'operation': TRs.Rflush,
+                'tag': oldtag,
+            })
+
+    async def version(self) -> dict:
+        return await self._transact(self._encode_Tversion)
+
+    async def auth(self, afid: int, uname: str, aname: str) -> dict:
+        return await self._transact(self._encode_Tauth, afid, uname, aname)
+
+    async def flush(self, oldtag: int) -> dict:
+        data: dict = await self._transact(self._encode_Tflush, oldtag)
+        self._abandon(oldtag)
+        return data
+
+    async def attach(
+            self,
+            uname: str = 'testuser',
+            aname: str = '',
+    ) -> dict:
+        return await self._transact(self._encode_Tattach, 0, 0, uname, aname)
+
+    async def walk(self, fid: int, newfid: int, names: list[str]) -> dict:
+        return await self._transact(self._encode_Twalk, fid, newfid, names)
+
+    async def open(self, fid: int, mode: int) -> dict:
+        return await self._transact(self._encode_Topen, fid, mode)
+
+    async def read(self, fid: int, offset: int, count: int) -> dict:
+        return await self._transact(self._encode_Tread, fid, offset, count)
+
+    async def write(self, fid: int, offset: int, data: bytes) -> dict:
+        return await self._transact(
+            self._encode_Twrite_iov,
+            fid,
+            offset,
+            data,
+        )
+
+    async def clunk(self, fid: int) -> dict:
+        return await self._transact(self._encode_Tclunk, fid)
+
+    async def remove(self, fid: int) -> dict:
+        return await self._transact(self._encode_Tremove, fid)
+
+    async def stat(self, fid: int) -> dict:
+        return await self._transact(self._encode_Tstat, fid)
+
+    async def wstat(self, fid: int, stat: Stat) -> dict:
+        return await self._transact(self._encode_Twstat, fid, stat)
+
+    async def read_dir(self, fid: int, offset: int, count: int) -> list[Stat]:
+        pkt: dict = await self.read(fid, offset, count)
+        data = pkt['data']
+
+        return Stat.decode_many(data)
+
+    def __del__(self) -> None:
+        if self.is_connected and self.writer is not None:
+            self.writer.close()
@@ -0,0 +1,194 @@
+from py9server import Py9Server
+from trs import TRs
+from codec import HEADER_LEN
+
+import asyncio
+import inspect
+import struct
+
+
+class AsyncPy9Server(Py9Server):
+    class Client(Py9Server.Client):
+        def __init__(
+                self,
+                reader: asyncio.StreamReader,
+                writer: asyncio.StreamWriter,
+                client_id: int,
+                msize: int = 32768,
+                version: str = "9P2000",
+        ) -> None:
+            self.reader: asyncio.StreamReader = reader
+            self.writer: asyncio.StreamWriter = writer
+            self.socket = writer.get_extra_info('socket')
+            self.client_id = client_id
+            self.msize = msize
+            self._version: str = version
+            self.queue: asyncio.Queue = asyncio.Queue()
+
+            self.tag: int = -1
+            self.tags: set[int] = set()
+
+        async def receive(self) -> dict:
+            header: bytes = await self.reader.readexactly(4)
+            size: int = struct.unpack('<I', header)[0]
+            if size < HEADER_LEN or size > self.msize:
+                raise ConnectionError(f'Invalid message size {size}')
+            buf: bytes = await self.reader.readexactly(size - 4)
+
+            try:
+                operation: TRs = TRs(buf[0])
+                tag: int = struct.unpack_from('<H', buf, 1)[0]
+                other_data: dict = self._parse_data(
+                    operation,
+                    memoryview(buf)[3:],
+                )
+            except Exception:
+                raise ConnectionError('Invalid message')
+
+            return {
+                'operation': operation,
+                'tag': tag,
+            } | other_data
+
+        def set_msize(self, msize: int) -> None:
+            self.msize = msize
+
+        def send(self, data: bytes | list) -> None:
+            self.queue.put_nowait(data)
+
+        def close(self) -> None:
+            self.queue.put_nowait(None)
+
+    def __init__(
+            self,
+            ip: str,
+            port: int,
+            msize: int = 32768,
+            version: str = "9P2000",
+    ) -> None:
+        self.ip: str = ip
+        self.port: int = port
+        self.msize: int = msize
+        self._version: str = version
+        self.clients: dict[int, AsyncPy9Server.Client] = {}
+        self.client_id: int = 0
+        self.server: asyncio.Server | None = None
+
+        self.tag: int = -1
+        self.tags: set[int] = set()
+
+    def _get_new_client_id(self) -> int:
+        self.client_id += 1
+        return self.client_id
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(
+            self._handle_connection,
+            self.ip,
+            self.port,
+        )
+
+    async def serve_forever(self) -> None:
+        if self.server is None:
+            await self.start()
+
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+        for client in list(self.clients.values()):
+            client.close()
+
+    async def _handle_connection(
+            self,
+            reader: asyncio.StreamReader,
+            writer: asyncio.StreamWriter,
+    ) -> None:
+        cid = self._get_new_client_id()
+        client = AsyncPy9Server.Client(
+            reader,
+            writer,
+            cid,
+            self.msize,
+            self._version,
+        )
+        self.clients[cid] = client
+        writer_task = asyncio.create_task(self._write_loop(client))
+        tasks: set[asyncio.Task] = set()
+
+        try:
+            while True:
+                data: dict = await client.receive()
+                try:
+                    result = self.dispatch({
+                        'client_id': cid,
+                        'data': data,
+                        'operation': data['operation'],
+                    })
+                except Exception:
+                    # Like a failed async handler, this only costs the
+                    # peer its own connection.
+                    break
+
+                if inspect.isawaitable(result):
+                    task = asyncio.create_task(result)
+                    tasks.add(task)
+                    task.add_done_callback(
+                        lambda t: self._handler_done(client, tasks, t))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            client.close()
+            await writer_task
+            del self.clients[cid]
+            self.handle_disconnect(cid)
+
+    def _handler_done(
+            self,
+            client: 'AsyncPy9Server.Client',
+            tasks: set[asyncio.Task],
+            task: asyncio.Task,
+    ) -> None:
+        tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            client.writer.close()
+
+    def _write(
+            self,
+            client: 'AsyncPy9Server.Client',
+            data: bytes | list,
+    ) -> None:
+        if isinstance(data, list):
+            client.writer.writelines(data)
+        else:
+            client.writer.write(data)
+
+    async def _write_loop(self, client: 'AsyncPy9Server.Client') -> None:
+        try:
+            while True:
+                data = await client.queue.get()
+                if data is None:
+                    break
+                self._write(client, data)
+
+                while not client.queue.empty():
+                    data = client.queue.get_nowait()
+                    if data is None:
+                        return
+                    self._write(client, data)
+
+                await client.writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            client.writer.close()
+
+    def __del__(self) -> None:
+        if self.server is not None:
+            self.server.close()
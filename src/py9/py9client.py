@@ -1,25 +1,100 @@
 from py9 import Py9
 from trs import TRs
-from stat9 import Stat
+from qid import Qid
+from stat9 import DirEntry, Stat
+from cache import BlockCache, StatCache, WalkCache
+from columnar import Listing, decode_listing
+from metrics import Metrics
+from capture import Capture
+
+from utils import (
+    IOHDRSZ,
+    MAXWELEM,
+    MIN_MSIZE,
+    NOFID,
+    OREAD,
+    OTRUNC,
+    OWRITE,
+    QTDIR,
+    split_path,
+)
+
+from collections import deque
 
 import socket
+import struct
+import threading
+import time
 
 
 class Py9Client(Py9):
+    class Request:
+        def __init__(
+                self,
+                client: 'Py9Client',
+                tag: int,
+        ) -> None:
+            self.client: Py9Client = client
+            self.tag: int = tag
+            self.reply: dict | None = None
+            self.callbacks: list = []
+            self.into: memoryview | None = None
+            self.operation: int = 0
+            self.started: float = 0.0
+
+        def done(self) -> bool:
+            return self.reply is not None
+
+        def result(self) -> dict:
+            while self.reply is None:
+                self.client.poll(self)
+
+            return self.reply
+
+        def add_done_callback(self, fn) -> None:
+            if self.reply is not None:
+                fn(self)
+            else:
+                self.callbacks.append(fn)
+
+        def set_reply(self, reply: dict) -> None:
+            self.reply = reply
+            callbacks, self.callbacks = self.callbacks, []
+            for fn in callbacks:
+                fn(self)
+
     def __init__(
             self,
             ip: str,
             port: int,
             msize: int = 32768,
             version: str = "9P2000",
+            cache: BlockCache | None = None,
+            walk_cache: WalkCache | None = None,
+            stat_cache: StatCache | None = None,
+            metrics: Metrics | None = None,
+            capture: Capture | None = None,
     ) -> None:
-        super().__init__(ip, port, msize, version)
+        super().__init__(ip, port, msize, version, metrics, capture)
         self.is_connected: bool = False
+        self.cache: BlockCache | None = cache
+        self.walk_cache: WalkCache | None = walk_cache
+        self.stat_cache: StatCache | None = stat_cache
+        self.qids: dict[int, Qid] = {}
+        self.paths: dict[int, tuple[str, ...]] = {}
+        self.requests: dict[int, Py9Client.Request] = {}
+        self.send_lock: threading.Lock = threading.Lock()
+        self.recv_lock: threading.RLock = threading.RLock()
+
+        self.root_fid: int = 0
+        self.fid: int = 0
+        self.fids: set[int] = {self.root_fid}
+        self.fid_lock: threading.Lock = threading.Lock()
 
     def connect(self) -> None:
         self.socket.connect((self.ip, self.port))
 
-        data = self.version()
+        data = self._check(self.version())
 
         if data['operation'] != TRs.Rversion:
             raise Exception("Server hasn't responded with Rversion")
@@ -30,91 +105,864 @@ class Py9Client(Py9):
                 "Server has responded with version " +
                 f"{data['version'].decode()}, expected {self._version}"
             )
+        if not MIN_MSIZE <= data['msize'] <= self.msize:
+            raise Exception(
+                f"Server has responded with msize {data['msize']}, " +
+                f"expected at most {self.msize}"
+            )
+        self.msize = data['msize']
 
         self.is_connected = True
 
-    def version(self) -> dict:
-        self.socket.sendall(self._encode_Tversion())
-        data: dict = self.recv()
-        return data
+    def get_fid(self) -> int:
+        with self.fid_lock:
+            fid: int = self.fid
+            while True:
+                fid = (fid + 1) % NOFID
+                if fid not in self.fids:
+                    break
 
-    def auth(self, afid: int, uname: str, aname: str) -> dict:
-        self.socket.sendall(self._encode_Tauth(afid, uname, aname))
-        data: dict = self.recv()
-        return data
+            self.fid = fid
+            self.fids.add(fid)
 
-    def flush(self, oldtag: int) -> dict:
-        self.socket.sendall(self._encode_Tflush(oldtag))
-        data: dict = self.recv()
-        return data
+        return fid
 
-    def attach(self) -> dict:
-        self.socket.sendall(self._encode_Tattach())
-        data: dict = self.recv()
-        return data
+    def release_fid(self, fid: int) -> None:
+        if fid != self.root_fid:
+            with self.fid_lock:
+                self.fids.discard(fid)
 
-    def walk(self, fid: int, newfid: int, names: list[str]) -> dict:
-        self.socket.sendall(self._encode_Twalk(fid, newfid, names))
-        data: dict = self.recv()
-        return data
+    def iosize(self, iounit: int = 0) -> int:
+        size: int = self.msize - IOHDRSZ
+        if iounit:
+            size = min(size, iounit)
 
-    def open(self, fid: int, mode: int) -> dict:
-        self.socket.sendall(self._encode_Topen(fid, mode))
-        data: dict = self.recv()
-        return data
+        return size
 
-    def create(self, fid: int, name: str, perm: int, mode: int) -> dict:
-        raise NotImplementedError
+    @staticmethod
+    def _check(data: dict) -> dict:
+        if data['operation'] == TRs.Rerror:
+            raise Exception(data['ename'].decode())
 
-    def read(self, fid: int, offset: int, count: int) -> dict:
-        self.socket.sendall(self._encode_Tread(fid, offset, count))
-        data: dict = self.recv()
         return data
 
-    def write(self, fid: int, offset: int, data: bytes) -> dict:
-        self.socket.sendall(self._encode_Twrite(fid, offset, data))
-        data: dict = self.recv()
-        return data
+    def submit(
+            self,
+            packet: bytes | list,
+            into: memoryview | None = None,
+    ) -> 'Py9Client.Request':
+        head: bytes = packet[0] if isinstance(packet, list) else packet
+        tag: int = struct.unpack_from('<H', head, 5)[0]
+        request = Py9Client.Request(self, tag)
+        request.into = into
+        if self.metrics is not None:
+            request.operation = head[4]
+            request.started = time.perf_counter()
+        self.requests[tag] = request
 
-    def clunk(self, fid: int) -> dict:
-        self.socket.sendall(self._encode_Tclunk(fid))
-        data: dict = self.recv()
-        return data
+        with self.send_lock:
+            self._send(self.socket, packet)
 
-    def remove(self, fid: int) -> dict:
-        self.socket.sendall(self._encode_Tremove(fid))
-        data: dict = self.recv()
-        return data
+        return request
 
-    def stat(self, fid: int) -> dict:
-        self.socket.sendall(self._encode_Tstat(fid))
-        data: dict = self.recv()
-        return data
+    def poll(self, request: 'Py9Client.Request | None' = None) -> None:
+        with self.recv_lock:
+            if request is not None and request.done():
+                return
 
-    def wstat(self, fid: int, stat: Stat) -> dict:
-        self.socket.sendall(self._encode_Twstat(fid, stat))
-        data: dict = self.recv()
-        return data
+            data: dict = self.recv()
+            pending = self.requests.pop(data['tag'], None)
+            if pending is None:
+                raise Exception(
+                    f"Server has responded with unknown tag {data['tag']}")
+
+            self.release_tag(data['tag'])
+            if self.metrics is not None and pending.started:
+                self.metrics.observe(
+                    pending.operation,
+                    time.perf_counter() - pending.started,
+                )
+            pending.set_reply(data)
+
+    def _transact(
+            self,
+            packet: bytes | list,
+            wait: bool,
+            callback=None,
+    ) -> 'dict | Py9Client.Request':
+        request = self.submit(packet)
+        if callback is not None:
+            request.add_done_callback(lambda r: callback(r.reply))
+        if not wait:
+            return request
+
+        return request.result()
+
+    def _abandon(self, oldtag: int, reply: dict) -> None:
+        with self.recv_lock:
+            pending = self.requests.pop(oldtag, None)
+            if pending is None:
+                return
+
+            self.release_tag(oldtag)
+            if self.metrics is not None and reply['operation'] == TRs.Rflush:
+                self.metrics.count_flushed()
+            pending.set_reply({
+                'operation': TRs.Rflush,
+                'tag': oldtag,
+            })
+
+    def version(self, wait: bool = True) -> 'dict | Py9Client.Request':
+        return self._transact(self._encode_Tversion(), wait)
+
+    def auth(
+            self,
+            afid: int,
+            uname: str,
+            aname: str,
+            wait: bool = True,
+    ) -> 'dict | Py9Client.Request':
+        return self._transact(self._encode_Tauth(afid, uname, aname), wait)
+
+    def flush(
+            self,
+            oldtag: int,
+            wait: bool = True,
+    ) -> 'dict | Py9Client.Request':
+        request = self.submit(self._encode_Tflush(oldtag))
+        request.add_done_callback(
+            lambda request: self._abandon(oldtag, request.reply))
+        if not wait:
+            return request
+
+        return request.result()
+
+    def attach(
+            self,
+            uname: str = 'testuser',
+            aname: str = '',
+            wait: bool = True,
+    ) -> 'dict | Py9Client.Request':
+        return self._transact(
+            self._encode_Tattach(self.root_fid, uname=uname, aname=aname),
+            wait,
+            lambda reply: self._opened(self.root_fid, reply),
+        )
+
+    def walk(
+            self,
+            fid: int,
+            newfid: int,
+            names: list[str],
+            wait: bool = True,
+    ) -> 'dict | Py9Client.Request':
+        return self._transact(
+            self._encode_Twalk(fid, newfid, names),
+            wait,
+            lambda reply: self._walked(fid, newfid, len(names), reply),
+        )
+
+    def open(
+            self,
+            fid: int,
+            mode: int,
+            wait: bool = True,
+    ) -> 'dict | Py9Client.Request':
+        return self._transact(
+            self._encode_Topen(fid, mode),
+            wait,
+            lambda reply: self._opened(fid, reply, mode & OTRUNC),
+        )
+
+    def create(
+            self,
+            fid: int,
+            name: str,
+            perm: int,
+            mode: int,
+            wait: bool = True,
+    ) -> 'dict | Py9Client.Request':
+        return self._transact(
+            self._encode_Tcreate(fid, name, perm, mode),
+            wait,
+            lambda reply: self._created(fid, name, reply),
+        )
+
+    def read(
+            self,
+            fid: int,
+            offset: int,
+            count: int,
+            wait: bool = True,
+    ) -> 'dict | Py9Client.Request':
+        if (wait and self.cache is not None and
+                self.cache.block_size <= self.iosize()):
+            qid: Qid | None = self.qids.get(fid)
+            if qid is not None and not qid._type & QTDIR:
+                return self._cached_read(fid, qid, offset, count)
+
+        return self._transact(self._encode_Tread(fid, offset, count), wait)
+
+    def read_into(
+            self,
+            fid: int,
+            offset: int,
+            buffer,
+            wait: bool = True,
+    ) -> 'dict | Py9Client.Request':
+        view: memoryview = memoryview(buffer).cast('B')
+        request = self.submit(
+            self._encode_Tread(fid, offset, len(view)),
+            view,
+        )
+        if not wait:
+            return request
+
+        return request.result()
+
+    def write(
+            self,
+            fid: int,
+            offset: int,
+            data: bytes,
+            wait: bool = True,
+    ) -> 'dict | Py9Client.Request':
+        return self._transact(
+            self._encode_Twrite_iov(fid, offset, data),
+            wait,
+            lambda reply: self._modified(fid),
+        )
+
+    def clunk(self, fid: int, wait: bool = True) -> 'dict | Py9Client.Request':
+        return self._transact(
+            self._encode_Tclunk(fid),
+            wait,
+            lambda reply: self._forget(fid),
+        )
+
+    def remove(
+            self,
+            fid: int,
+            wait: bool = True,
+    ) -> 'dict | Py9Client.Request':
+        self._modified(fid)
+        self._unlinked(fid)
+        return self._transact(
+            self._encode_Tremove(fid),
+            wait,
+            lambda reply: self._forget(fid),
+        )
+
+    def stat(self, fid: int, wait: bool = True) -> 'dict | Py9Client.Request':
+        return self._transact(
+            self._encode_Tstat(fid),
+            wait,
+            lambda reply: self._statted(fid, reply),
+        )
+
+    def wstat(
+            self,
+            fid: int,
+            stat: Stat,
+            wait: bool = True,
+    ) -> 'dict | Py9Client.Request':
+        return self._transact(
+            self._encode_Twstat(fid, stat),
+            wait,
+            lambda reply: self._wstatted(fid, stat, reply),
+        )
+
+    def _opened(self, fid: int, reply: dict, truncated: int = 0) -> None:
+        if reply['operation'] in (TRs.Rattach, TRs.Ropen, TRs.Rcreate):
+            self.qids[fid] = reply['qid']
+            if self.stat_cache is not None:
+                self.stat_cache.check(reply['qid'])
+            if truncated:
+                self._modified(fid)
+
+    def _created(self, fid: int, name: str, reply: dict) -> None:
+        self._opened(fid, reply)
+        if reply['operation'] == TRs.Rcreate and fid in self.paths:
+            self.paths[fid] += (name,)
+
+    def _walked(
+            self,
+            fid: int,
+            newfid: int,
+            nwname: int,
+            reply: dict,
+    ) -> None:
+        if reply['operation'] != TRs.Rwalk:
+            return
+        if self.stat_cache is not None:
+            for qid in reply['qids']:
+                self.stat_cache.check(qid)
+        if len(reply['qids']) != nwname:
+            return
+
+        if nwname:
+            self.qids[newfid] = reply['qids'][-1]
+        elif fid in self.qids:
+            self.qids[newfid] = self.qids[fid]
+
+    def _statted(self, fid: int, reply: dict) -> None:
+        if reply['operation'] == TRs.Rstat:
+            self.qids[fid] = reply['stat'].qid
+            if self.stat_cache is not None:
+                self.stat_cache.put(reply['stat'], self.paths.get(fid))
+
+    def _forget(self, fid: int) -> None:
+        self.qids.pop(fid, None)
+        self.paths.pop(fid, None)
+
+    def _modified(self, fid: int) -> None:
+        qid: Qid | None = self.qids.get(fid)
+        if qid is None:
+            return
+        if self.cache is not None:
+            self.cache.invalidate(qid.path)
+        if self.stat_cache is not None:
+            self.stat_cache.invalidate(qid.path)
+
+    def _unlinked(self, fid: int) -> None:
+        qid: Qid | None = self.qids.get(fid)
+        if self.walk_cache is not None and qid is not None:
+            self.walk_cache.invalidate(qid.path)
+            self._discard()
+
+    def _wstatted(self, fid: int, stat: Stat, reply: dict) -> None:
+        self._modified(fid)
+        if reply['operation'] == TRs.Rwstat and stat.name:
+            self._unlinked(fid)
+
+    def _discard(self) -> None:
+        for fid in self.walk_cache.take_stale():
+            self.clunk(fid, wait=False).add_done_callback(
+                lambda request, fid=fid: self.release_fid(fid))
+
+    def _cached_read(
+            self,
+            fid: int,
+            qid: Qid,
+            offset: int,
+            count: int,
+    ) -> dict:
+        block_size: int = self.cache.block_size
+        first: int = offset // block_size
+        last: int = (offset + max(count, 1) - 1) // block_size
+
+        blocks: dict[int, bytes] = {}
+        missing: list = []
+        for index in range(first, last + 1):
+            block = self.cache.get(qid.path, qid.version, index)
+            if block is None:
+                missing.append((index, self.read(
+                    fid,
+                    index * block_size,
+                    block_size,
+                    wait=False,
+                )))
+            else:
+                blocks[index] = block
+
+        for index, request in missing:
+            data: dict = request.result()
+            if data['operation'] == TRs.Rerror:
+                return data
+            block = bytes(data['data'])
+            self.cache.put(qid.path, qid.version, index, block)
+            blocks[index] = block
+
+        parts: list[bytes] = []
+        for index in range(first, last + 1):
+            parts.append(blocks[index])
+            if len(blocks[index]) < block_size:
+                break
+
+        start: int = offset - first * block_size
+        data: bytes = b''.join(parts)[start:start + count]
+
+        return {
+            'operation': TRs.Rread,
+            'tag': None,
+            'count': len(data),
+            'data': data,
+        }
+
+    def walk_path(self, path: str) -> int:
+        names: list[str] = split_path(path)
+        if self.walk_cache is not None and names:
+            return self._walk_cached(names)
+
+        key: tuple[str, ...] = tuple(names)
+        fid: int = self.get_fid()
+        source: int = self.root_fid
+
+        try:
+            while True:
+                step: list[str] = names[:MAXWELEM]
+                names = names[MAXWELEM:]
+                data = self._check(self.walk(source, fid, step))
+                if len(data['qids']) != len(step):
+                    raise Exception(f'{path}: file not found')
+                source = fid
+                if not names:
+                    self.paths[fid] = key
+                    return fid
+        except Exception:
+            if source == fid:
+                self.clunk(fid)
+            self.release_fid(fid)
+            raise
+
+    def _walk_cached(self, names: list[str]) -> int:
+        # Walks start from the deepest ancestor that still holds a cached
+        # fid. The parent directory of the target is kept walked in the
+        # cache, so siblings cost a single one-name Twalk. On a miss the
+        # target is walked from the ancestor too, so both walks go out in
+        # one round trip; a walk only waits when it starts from a fid that
+        # an earlier walk of this call has yet to create.
+        key: tuple[str, ...] = tuple(names)
+        base, cached, ancestry = self.walk_cache.lookup(key)
+        origin: int = self.root_fid if cached is None else cached
+
+        source: int = origin
+        depth: int = base
+        parent: int = len(names) - 1
+        steps: list[tuple[int, int, int, int]] = []
+        dirfid: int | None = None
+        if depth < parent:
+            dirfid = self.get_fid()
+            for start in range(depth, parent, MAXWELEM):
+                end: int = min(start + MAXWELEM, parent)
+                steps.append((source, dirfid, start, end))
+                source = dirfid
+            depth = parent
+
+        fid: int = self.get_fid()
+        if len(names) - base <= MAXWELEM:
+            steps.append((origin, fid, base, len(names)))
+        else:
+            steps.append((source, fid, depth, len(names)))
+
+        walked: set[int] = set()
+        found: dict[int, Qid] = {}
+        failures: list[tuple[int, dict]] = []
+        pending: list = []
+        for step in steps:
+            fid_from, fid_to, start, end = step
+            if any(fid_from == sent[1] for sent, _ in pending):
+                failures += self._settle_walks(pending, walked, found)
+                if failures:
+                    break
+            pending.append((step, self.walk(
+                fid_from,
+                fid_to,
+                names[start:end],
+                wait=False,
+            )))
+        failures += self._settle_walks(pending, walked, found)
+
+        if failures:
+            # An error from a cached fid may mean the server no longer
+            # knows it, so it is evicted with everything walked below it.
+            # A partial walk proves the fid still good.
+            if cached is not None and any(
+                    fid_from == cached and data['operation'] == TRs.Rerror
+                    for fid_from, data in failures):
+                self.walk_cache.evict(key[:base])
+            for used in (dirfid, fid):
+                if used is None:
+                    continue
+                if used in walked:
+                    self.clunk(used)
+                self.release_fid(used)
+            self._discard()
+            self._check(failures[0][1])
+            raise Exception(f'{"/".join(names)}: file not found')
+
+        if dirfid is not None:
+            self.walk_cache.put(key[:parent], ancestry + tuple(
+                found[index] for index in range(base, parent)), dirfid)
+        self._discard()
+        self.paths[fid] = key
+
+        return fid
+
+    def _settle_walks(
+            self,
+            pending: list,
+            walked: set[int],
+            found: dict[int, Qid],
+    ) -> list[tuple[int, dict]]:
+        failures: list[tuple[int, dict]] = []
+        for (fid_from, fid_to, start, end), request in pending:
+            data: dict = request.result()
+            if (data['operation'] != TRs.Rwalk or
+                    len(data['qids']) != end - start):
+                failures.append((fid_from, data))
+                continue
+            walked.add(fid_to)
+            for index, qid in enumerate(data['qids']):
+                found[start + index] = qid
+        pending.clear()
+
+        return failures
+
+    def read_range(
+            self,
+            fid: int,
+            offset: int,
+            length: int,
+            into=None,
+            window: int = 8,
+            iounit: int = 0,
+    ) -> memoryview:
+        buffer = bytearray(length) if into is None else into
+        view: memoryview = memoryview(buffer).cast('B')[:length]
+        chunk: int = self.iosize(iounit)
+        pending: deque = deque()
+        position: int = 0
+        eof: int = length
+
+        while pending or position < eof:
+            while position < eof and len(pending) < window:
+                size: int = min(chunk, eof - position)
+                pending.append((
+                    self.read_into(
+                        fid,
+                        offset + position,
+                        view[position:position + size],
+                        wait=False,
+                    ),
+                    position,
+                    size,
+                ))
+                position += size
+
+            request, start, size = pending.popleft()
+            count: int = self._check(request.result())['count']
+            if count == 0:
+                eof = min(eof, start)
+            elif count < size and start + count < eof:
+                pending.append((
+                    self.read_into(
+                        fid,
+                        offset + start + count,
+                        view[start + count:start + size],
+                        wait=False,
+                    ),
+                    start + count,
+                    size - count,
+                ))
+
+        return view[:eof]
+
+    def read_stream(
+            self,
+            fid: int,
+            out,
+            offset: int = 0,
+            window: int = 8,
+            iounit: int = 0,
+    ) -> int:
+        chunk: int = self.iosize(iounit)
+        pending: deque = deque()
+        position: int = offset
+        eof: bool = False
+
+        while pending or not eof:
+            while not eof and len(pending) < window:
+                pending.append(
+                    (self.read(fid, position, chunk, wait=False), chunk))
+                position += chunk
+
+            request, size = pending.popleft()
+            data: dict = self._check(request.result())
+            if eof:
+                continue
+            if data['count'] == 0:
+                eof = True
+                continue
+
+            out.write(data['data'])
+            offset += data['count']
+            if data['count'] < size:
+                # The rest of this chunk was skipped; later replies are
+                # dropped and reading resumes right after the short one.
+                for request, _ in pending:
+                    request.result()
+                pending.clear()
+                position = offset
+
+        return offset
+
+    def read_file(
+            self,
+            path: str,
+            out=None,
+            window: int = 8,
+    ) -> bytearray | int:
+        fid: int = self.walk_path(path)
+        try:
+            iounit: int = self._check(self.open(fid, OREAD))['iounit']
+            if out is not None:
+                return self.read_stream(fid, out, 0, window, iounit)
+
+            # The stat length only sizes the first allocation. Synthetic
+            # files report zero and others may grow while being read, so
+            # reading goes on until the server runs out of data.
+            length: int = self._check(self.stat(fid))['stat'].length
+            buffer: bytearray = bytearray(length)
+            received: int = 0
+            while True:
+                rest: memoryview = memoryview(buffer)[received:]
+                data: memoryview = self.read_range(
+                    fid,
+                    received,
+                    len(rest),
+                    rest,
+                    window,
+                    iounit,
+                )
+                received += len(data)
+                data.release()
+                rest.release()
+                if received < len(buffer):
+                    break
+                buffer.extend(bytes(max(self.iosize(iounit), received)))
+
+            del buffer[received:]
+            return buffer
+        finally:
+            self.clunk(fid)
+            self.release_fid(fid)
+
+    def _open_for_write(self, path: str, perm: int) -> tuple[int, int]:
+        try:
+            fid: int = self.walk_path(path)
+        except Exception:
+            names: list[str] = split_path(path)
+            if not names:
+                raise
+            fid = self.walk_path('/'.join(names[:-1]))
+            try:
+                data: dict = self._check(
+                    self.create(fid, names[-1], perm, OWRITE))
+            except Exception:
+                self.clunk(fid)
+                self.release_fid(fid)
+                raise
+            return fid, data['iounit']
+
+        try:
+            data = self._check(self.open(fid, OWRITE | OTRUNC))
+        except Exception:
+            self.clunk(fid)
+            self.release_fid(fid)
+            raise
+        return fid, data['iounit']
+
+    @staticmethod
+    def _chunks(source, size: int):
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = (source,)
+        if hasattr(source, 'read'):
+            while True:
+                data = source.read(size)
+                if not data:
+                    return
+                yield data
+
+        pending: bytearray = bytearray()
+        for data in source:
+            view: memoryview = memoryview(data).cast('B')
+            if pending:
+                taken: int = size - len(pending)
+                pending += view[:taken]
+                view = view[taken:]
+                if len(pending) < size:
+                    continue
+                yield bytes(pending)
+                pending = bytearray()
+
+            while len(view) >= size:
+                yield view[:size]
+                view = view[size:]
+            pending += view
+
+        if pending:
+            yield bytes(pending)
+
+    def write_stream(
+            self,
+            fid: int,
+            source,
+            offset: int = 0,
+            window: int = 8,
+            iounit: int = 0,
+            progress=None,
+    ) -> int:
+        pending: deque = deque()
+        position: int = offset
+        written: int = 0
+        chunks = self._chunks(source, self.iosize(iounit))
+        exhausted: bool = False
+
+        while pending or not exhausted:
+            while not exhausted and len(pending) < window:
+                data = next(chunks, None)
+                if data is None:
+                    exhausted = True
+                    break
+                view: memoryview = memoryview(data).cast('B')
+                pending.append((
+                    self.write(fid, position, view, wait=False),
+                    position,
+                    view,
+                ))
+                position += len(view)
+
+            if not pending:
+                break
+
+            request, start, view = pending.popleft()
+            count: int = self._check(request.result())['count']
+            if count == 0:
+                raise Exception(f'Short write at offset {start}')
+            if count < len(view):
+                view = view[count:]
+                pending.append((
+                    self.write(fid, start + count, view, wait=False),
+                    start + count,
+                    view,
+                ))
+
+            written += count
+            if progress is not None:
+                progress(written)
+
+        return written
+
+    def write_file(
+            self,
+            path_or_fid: str | int,
+            source,
+            window: int = 8,
+            perm: int = 0o644,
+            progress=None,
+    ) -> int:
+        if isinstance(path_or_fid, int):
+            return self.write_stream(
+                path_or_fid,
+                source,
+                window=window,
+                progress=progress,
+            )
+
+        fid, iounit = self._open_for_write(path_or_fid, perm)
+        try:
+            return self.write_stream(
+                fid,
+                source,
+                window=window,
+                iounit=iounit,
+                progress=progress,
+            )
+        finally:
+            self.clunk(fid)
+            self.release_fid(fid)
 
     def recv(self) -> dict:
-        return self._recv(self.socket)
+        return self._recv(self.socket, self._sink)
+
+    def _sink(self, tag: int) -> memoryview | None:
+        request = self.requests.get(tag)
+        if request is None:
+            return None
+
+        return request.into
+
+    def stat_path(self, path: str) -> Stat:
+        if self.stat_cache is not None:
+            stat: Stat | None = self.stat_cache.get_path(
+                tuple(split_path(path)))
+            if stat is not None:
+                return stat
+
+        fid: int = self.walk_path(path)
+        try:
+            return self._check(self.stat(fid))['stat']
+        finally:
+            self.clunk(fid)
+            self.release_fid(fid)
+
+    def iter_dir(
+            self,
+            fid: int,
+            offset: int = 0,
+            readahead: bool = True,
+            iounit: int = 0,
+    ):
+        # Directory reads must continue exactly where the previous reply
+        # ended, so the next Tread is sent as soon as a reply arrives and
+        # overlaps with the caller consuming the current chunk.
+        count: int = self.iosize(iounit)
+        request = self.read(fid, offset, count, wait=False)
+
+        while request is not None:
+            data = self._check(request.result())['data']
+            if not data:
+                return
+
+            offset += len(data)
+            request = None
+            if readahead:
+                request = self.read(fid, offset, count, wait=False)
+
+            yield from DirEntry.iter_bytes(data)
+
+            if request is None:
+                request = self.read(fid, offset, count, wait=False)
+
+    def read_listing(
+            self,
+            fid: int,
+            iounit: int = 0,
+            use_numpy: bool | None = None,
+    ) -> Listing:
+        data: bytearray = bytearray()
+        count: int = self.iosize(iounit)
+        while True:
+            chunk = self._check(self.read(fid, len(data), count))['data']
+            if not chunk:
+                return decode_listing(data, use_numpy)
+            data += chunk
 
     def read_dir(self, fid: int, offset: int, count: int) -> list[Stat]:
-        self.socket.sendall(self._encode_Tread(fid, offset, count))
-        pkt: dict = self.recv()
+        pkt: dict = self.read(fid, offset, count)
         data = pkt['data']
 
-        stats: list[Stat] = []
-        offset = 0
+        stats: list[Stat] = Stat.decode_many(data)
+        if self.stat_cache is not None:
+            parent: tuple[str, ...] | None = self.paths.get(fid)
+            for stat in stats:
+                self.stat_cache.put(
+                    stat,
+                    None if parent is None else parent + (stat.name,),
+                )
 
-        while offset < len(data):
-            stat = Stat.from_bytes(data[offset:])
-            offset += stat.size + 2
-            stats.append(stat)
         return stats
 
-    def __del__(self) -> None:
+    def close(self) -> None:
         if self.is_connected:
-            self.socket.shutdown(socket.SHUT_RDWR)
-            self.socket.recv(0)
-            self.socket.close()
+            self.is_connected = False
+            try:
+                self.socket.shutdown(socket.SHUT_RDWR)
+                self.socket.recv(0)
+            except OSError:
+                pass
+        self.socket.close()
+
+    def __del__(self) -> None:
+        self.close()
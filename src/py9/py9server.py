@@ -1,9 +1,36 @@
 from py9 import Py9
 from trs import TRs
+from framer import Framer
+from metrics import Metrics
+from capture import Capture, RECEIVED, SENT
+from utils import MIN_MSIZE
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 
 import socket
 import selectors
 import struct
+import threading
+import time
+
+
+# Replies sent by a handler running on the thread pool are collected here
+# and handed back to the selector loop instead of being written directly.
+_deferred = threading.local()
+
+
+# Offloaded requests of these types may run side by side on one fid.
+SHARED: frozenset[TRs] = frozenset((TRs.Tread, TRs.Tstat))
+
+# Most buffers handed to a single sendmsg call.
+IOV_MAX: int = 1024
+
+
+def blocking(handler):
+    handler.blocking = True
+    return handler
 
 
 class Py9Server(Py9):
@@ -14,38 +41,113 @@ class Py9Server(Py9):
                 client_id: int,
                 msize: int = 32768,
                 version: str = "9P2000",
+                writers: set | None = None,
+                metrics: Metrics | None = None,
+                capture: Capture | None = None,
         ) -> None:
             self.socket = sock
             self.client_id = client_id
             self.msize = msize
             self._version: str = version
-            self.buffer: bytes = b''
+            self.framer: Framer = Framer(msize)
 
             self.tag: int = -1
+            self.tags: set[int] = set()
+
+            # Replies are queued here and written by the server loop when
+            # the socket has room, so one slow reader cannot stall the
+            # others. writers collects the clients with new output.
+            self.outbox: deque[memoryview] = deque()
+            self.queued: int = 0
+            self.last_write: float = 0.0
+            self.events: int = selectors.EVENT_READ
+            self.paused: bool = False
+            self.writers: set = writers if writers is not None else set()
+            self.metrics: Metrics | None = metrics
+            self.capture: Capture | None = capture
+            self.capture_id: int = 0
+            if capture is not None:
+                self.capture_id = capture.connection()
+
+        def set_msize(self, msize: int) -> None:
+            self.msize = msize
+            self.framer.msize = msize
+
+        def receive(self) -> bool:
+            try:
+                received: int = self.framer.fill(self.socket)
+            except BlockingIOError:
+                return True
+            except ConnectionError:
+                return False
+
+            return received != 0
 
-        def receive(self):
-            if len(self.buffer) < 4:
-                self.buffer += self.socket.recv(4 - len(self.buffer))
-            if len(self.buffer) < 4:
-                return None
+        def messages(self):
+            for frame in self.framer.frames():
+                operation: TRs = TRs(frame[4])
+                if self.metrics is not None:
+                    self.metrics.count_in(frame[4], len(frame))
+                if self.capture is not None:
+                    self.capture.record(self.capture_id, RECEIVED, frame)
+                tag: int = struct.unpack_from('<H', frame, 5)[0]
+                other_data: dict = self._parse_data(operation, frame[7:])
 
-            size = struct.unpack('<I', self.buffer[0:4])[0]
-            if len(self.buffer) < size:
-                self.buffer += self.socket.recv(size - len(self.buffer))
-            if len(self.buffer) < size:
-                return None
+                yield {
+                    'operation': operation,
+                    'tag': tag,
+                } | other_data
 
-            operation: TRs = TRs(
-                struct.unpack('<B', self.buffer[4:5])[0])
-            tag: int = struct.unpack('<H', self.buffer[5:7])[0]
-            other_data: dict = self._parse_data(operation, self.buffer[7:])
+        def send(self, data: bytes | list) -> None:
+            replies: list | None = getattr(_deferred, 'replies', None)
+            if replies is not None:
+                replies.append((self, data))
+                return
 
-            self.buffer = b''
+            if self.metrics is not None:
+                head = data[0] if isinstance(data, list) else data
+                self.metrics.count_out(
+                    head[4],
+                    struct.unpack_from('<I', head)[0],
+                )
+            if self.capture is not None:
+                self.capture.record(self.capture_id, SENT, data)
+            if not self.outbox:
+                self.last_write = time.monotonic()
+            for buffer in data if isinstance(data, list) else (data,):
+                view: memoryview = memoryview(buffer).cast('B')
+                if view:
+                    self.outbox.append(view)
+                    self.queued += len(view)
+            self.writers.add(self)
 
-            return {
-                'operation': operation,
-                'tag': tag,
-            } | other_data
+        def flush(self) -> bool:
+            outbox: deque[memoryview] = self.outbox
+            while outbox:
+                views: list[memoryview] = list(islice(outbox, IOV_MAX))
+                try:
+                    sent: int = self.socket.sendmsg(views)
+                except (BlockingIOError, InterruptedError):
+                    break
+                except OSError:
+                    outbox.clear()
+                    self.queued = 0
+                    return False
+
+                self.queued -= sent
+                self.last_write = time.monotonic()
+                full: bool = sent < sum(len(view) for view in views)
+                while sent:
+                    head: memoryview = outbox[0]
+                    if sent < len(head):
+                        outbox[0] = head[sent:]
+                        break
+                    sent -= len(head)
+                    outbox.popleft()
+                if full:
+                    break
+
+            return True
 
     def __init__(
             self,
@@ -53,12 +155,54 @@ class Py9Server(Py9):
             port: int,
             msize: int = 32768,
             version: str = "9P2000",
+            reuse_port: bool = False,
+            backlog: int = 10,
+            threads: int = 0,
+            high_water: int = 1 << 20,
+            send_timeout: float | None = 30.0,
+            metrics: Metrics | None = None,
+            capture: Capture | None = None,
     ) -> None:
-        super().__init__(ip, port, msize, version)
+        super().__init__(ip, port, msize, version, metrics, capture)
         self.clients: dict[int, Py9Server.Client] = {}
         self.client_id: int = 0
+        self.listening: bool = True
+        if reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         self.socket.bind((ip, port))
-        self.socket.listen(10)
+        self.socket.listen(backlog)
+
+        # Once more than high_water bytes of replies are queued for a
+        # client, its requests are left in its Framer and its socket is no
+        # longer read. Both resume below half of that. A client whose queue
+        # makes no progress for send_timeout seconds is dropped. readers
+        # collects the clients with received frames to handle.
+        self.high_water: int = high_water
+        self.send_timeout: float | None = send_timeout
+        self.writers: set[Py9Server.Client] = set()
+        self.backlog: set[Py9Server.Client] = set()
+        self.readers: set[Py9Server.Client] = set()
+
+        self.executor: ThreadPoolExecutor | None = None
+        self.blocking: set[TRs] = set()
+        self.busy: dict[tuple[int, int], list] = {}
+        self.completed: deque = deque()
+        # Offloaded and waiting requests by client and tag, so a Tflush can
+        # find them.
+        self.pending: dict[tuple[int, int], dict] = {}
+        if threads:
+            self.executor = ThreadPoolExecutor(threads)
+            self.blocking = {
+                operation for operation in TRs
+                if getattr(
+                    getattr(self, f'handle_{operation.name}', None),
+                    'blocking',
+                    False,
+                )
+            }
+            self.wakeup, self.waker = socket.socketpair()
+            self.wakeup.setblocking(False)
+            self.selector.register(self.wakeup, selectors.EVENT_READ)
 
     def __get_new_client_id(self) -> int:
         self.client_id += 1
@@ -66,71 +210,338 @@ class Py9Server(Py9):
 
     def __accept(self) -> Client:
         sock, _ = self.socket.accept()
+        sock.setblocking(False)
         cid = self.__get_new_client_id()
         new_client: Py9Server.Client = Py9Server.Client(
             sock,
             cid,
+            self.msize,
+            self._version,
+            self.writers,
+            self.metrics,
+            self.capture,
         )
         self.clients[sock.fileno()] = new_client
         self.selector.register(sock, selectors.EVENT_READ)
         return new_client
 
-    def serve(self):
+    def __disconnect(self, fd: int) -> None:
+        client: Py9Server.Client = self.clients.pop(fd)
+        self.writers.discard(client)
+        self.backlog.discard(client)
+        self.readers.discard(client)
+        cancelled: list[tuple[int, int]] = [
+            ident for ident in self.pending if ident[0] == fd
+        ]
+        for ident in cancelled:
+            self.pending.pop(ident)['flushed'] = True
+        if self.metrics is not None and cancelled:
+            self.metrics.count_flushed(len(cancelled))
+        self.selector.unregister(client.socket)
+        client.socket.close()
+        self.handle_disconnect(fd)
+
+    def stop_listening(self) -> None:
+        if self.listening:
+            self.listening = False
+            self.selector.unregister(self.socket)
+            self.socket.close()
+
+    def serve(self, timeout: float | None = None):
         ret: list[dict] = []
-        events = self.selector.select()
+        if self.backlog and self.send_timeout is not None:
+            oldest: float = min(client.last_write for client in self.backlog)
+            wait: float = max(
+                0.0,
+                oldest + self.send_timeout - time.monotonic(),
+            )
+            timeout = wait if timeout is None else min(timeout, wait)
+        if self.readers:
+            timeout = 0
+        events = self.selector.select(timeout)
 
-        for key, _ in events:
-            if key.fd == self.socket.fileno():
+        for key, mask in events:
+            if self.listening and key.fd == self.socket.fileno():
                 self.__accept()
+            elif self.executor is not None and key.fileobj is self.wakeup:
+                self._complete()
             else:
-                client: Py9Server.Client = self.clients[key.fd]
-                data = client.receive()
-                if data:
-                    ret.append({
-                        'client_id': key.fd,
-                        'data': data,
-                        'operation': data['operation'],
-                    })
-
-        for packet in ret:
-            match packet['operation']:
-                case TRs.Tversion:
-                    self.handle_Tversion(packet)
-                case TRs.Tauth:
-                    self.handle_Tauth(packet)
-                case TRs.Tattach:
-                    self.handle_Tattach(packet)
-                case TRs.Tflush(packet):
-                    self.handle_Tflush(packet)
-                case TRs.Twalk(packet):
-                    self.handle_Twalk(packet)
-                case TRs.Topen(packet):
-                    self.handle_Topen(packet)
-                case TRs.Tcreate(packet):
-                    self.handle_Tcreate(packet)
-                case TRs.Tread(packet):
-                    self.handle_Tread(packet)
-                case TRs.Twrite(packet):
-                    self.handle_Twrite(packet)
-                case TRs.Tclunk(packet):
-                    self.handle_Tclunk(packet)
-                case TRs.Tremove(packet):
-                    self.handle_Tremove(packet)
-                case TRs.Tstat(packet):
-                    self.handle_Tstat(packet)
-                case TRs.Twstat(packet):
-                    self.handle_Twstat(packet)
+                client: Py9Server.Client | None = self.clients.get(key.fd)
+                if client is None:
+                    continue
+                if mask & selectors.EVENT_WRITE:
+                    self.writers.add(client)
+                if not mask & selectors.EVENT_READ:
+                    continue
+                if not client.receive():
+                    self.__disconnect(key.fd)
+                    continue
+                self.readers.add(client)
+
+        self._drain(ret)
+        self._flush()
+        self._expire()
+
         return ret
 
+    def _handle(self, packet: dict) -> None:
+        started: float = time.perf_counter()
+        try:
+            self.dispatch(packet)
+        except Exception:
+            self._fail(packet)
+        if self.metrics is not None:
+            self.metrics.observe(
+                packet['operation'],
+                time.perf_counter() - started,
+            )
+
+    def _fail(self, packet: dict) -> None:
+        # A request that cannot be handled, like a reply sent by a confused
+        # peer or one whose handler raised, only costs its own client the
+        # connection. A flushed request no longer has anyone waiting.
+        if packet['client_id'] in self.clients and not packet.get('flushed'):
+            self.__disconnect(packet['client_id'])
+
+    def _drain(self, ret: list[dict]) -> None:
+        # Requests are handled one at a time, so a client stops being
+        # served as soon as its replies pile up past high_water.
+        while self.readers:
+            client: Py9Server.Client = self.readers.pop()
+            fd: int = client.socket.fileno()
+            if self.clients.get(fd) is not client:
+                continue
+
+            messages = client.messages()
+            while client.queued <= self.high_water:
+                try:
+                    data: dict | None = next(messages, None)
+                except Exception:
+                    self.__disconnect(fd)
+                    break
+                if data is None:
+                    break
+
+                packet: dict = {
+                    'client_id': fd,
+                    'data': data,
+                    'operation': data['operation'],
+                }
+                ret.append(packet)
+                if self.executor is None:
+                    self._handle(packet)
+                else:
+                    self._schedule(packet)
+                if self.clients.get(fd) is not client:
+                    break
+            else:
+                client.paused = True
+            if self.clients.get(fd) is client:
+                self.writers.add(client)
+
+    def _flush(self) -> None:
+        while self.writers:
+            client: Py9Server.Client = self.writers.pop()
+            fd: int = client.socket.fileno()
+            if self.clients.get(fd) is not client:
+                continue
+            if not client.flush():
+                self.__disconnect(fd)
+                continue
+
+            # The socket is only read again once the requests left in the
+            # Framer have been handled, which the next serve does without
+            # waiting for the client to send more.
+            if client.queued > self.high_water:
+                client.paused = True
+            elif client.paused and client.queued <= self.high_water // 2:
+                client.paused = False
+                if client.framer.pending():
+                    self.readers.add(client)
+
+            events: int = 0
+            if not client.paused and client not in self.readers:
+                events = selectors.EVENT_READ
+            if client.outbox:
+                events |= selectors.EVENT_WRITE
+                self.backlog.add(client)
+            else:
+                self.backlog.discard(client)
+
+            if events != client.events:
+                self.selector.modify(client.socket, events)
+                client.events = events
+
+    def _expire(self) -> None:
+        if self.send_timeout is None or not self.backlog:
+            return
+
+        deadline: float = time.monotonic() - self.send_timeout
+        for client in [
+            client for client in self.backlog
+            if client.last_write <= deadline
+        ]:
+            self.__disconnect(client.socket.fileno())
+
+    @staticmethod
+    def _fids(packet: dict) -> tuple[int, ...]:
+        data: dict = packet['data']
+        if 'newfid' in data:
+            return data['fid'], data['newfid']
+        if 'fid' in data:
+            return data['fid'],
+
+        return ()
+
+    def _schedule(self, packet: dict) -> None:
+        ident: tuple[int, int] = (packet['client_id'], packet['data']['tag'])
+        if packet['operation'] == TRs.Tflush:
+            # The Rflush must be the last word on the flushed request, so
+            # one still running or waiting has its reply dropped.
+            flushed: dict | None = self.pending.pop(
+                (packet['client_id'], packet['data']['oldtag']),
+                None,
+            )
+            if flushed is not None:
+                flushed['flushed'] = True
+                if self.metrics is not None:
+                    self.metrics.count_flushed()
+
+        # Requests on one fid must take effect in order, so a request waits
+        # behind any offloaded request holding one of its fids, even if it
+        # would otherwise be handled inline. Reads and stats do not change
+        # the fid and may overlap with each other.
+        # busy[key] is [running, shared, waiting requests].
+        keys: list[tuple[int, int]] = [
+            (packet['client_id'], fid) for fid in self._fids(packet)
+        ]
+        shared: bool = packet['operation'] in SHARED
+        for key in keys:
+            state: list | None = self.busy.get(key)
+            if state is not None and not (shared and state[1] and
+                                          not state[2]):
+                state[2].append(packet)
+                self.pending[ident] = packet
+                return
+
+        if packet['operation'] not in self.blocking:
+            if self.pending.get(ident) is packet:
+                del self.pending[ident]
+            self._handle(packet)
+            return
+
+        self.pending[ident] = packet
+
+        for key in keys:
+            state = self.busy.get(key)
+            if state is None:
+                self.busy[key] = [1, shared, deque()]
+            else:
+                state[0] += 1
+        self.executor.submit(self._offload, packet, keys)
+
+    def _offload(self, packet: dict, keys: list) -> None:
+        _deferred.replies = []
+        error: BaseException | None = None
+        started: float = time.perf_counter()
+        try:
+            self.dispatch(packet)
+        except BaseException as e:
+            error = e
+        finally:
+            replies, _deferred.replies = _deferred.replies, None
+
+        elapsed: float = time.perf_counter() - started
+        self.completed.append((replies, keys, error, packet, elapsed))
+        self.waker.send(b'\0')
+
+    def _complete(self) -> None:
+        try:
+            while self.wakeup.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+        while self.completed:
+            replies, keys, error, packet, elapsed = \
+                self.completed.popleft()
+            ident: tuple[int, int] = (
+                packet['client_id'],
+                packet['data']['tag'],
+            )
+            if self.pending.get(ident) is packet:
+                del self.pending[ident]
+            if self.metrics is not None:
+                self.metrics.observe(packet['operation'], elapsed)
+            if error is not None:
+                self._fail(packet)
+            elif not packet.get('flushed'):
+                for client, data in replies:
+                    if self.clients.get(client.socket.fileno()) is client:
+                        client.send(data)
+
+            waiting: list[dict] = []
+            for key in keys:
+                state: list = self.busy[key]
+                state[0] -= 1
+                if not state[0]:
+                    del self.busy[key]
+                    waiting += state[2]
+            for packet in waiting:
+                if not packet.get('flushed'):
+                    self._schedule(packet)
+
+    def dispatch(self, packet: dict):
+        match packet['operation']:
+            case TRs.Tversion:
+                return self.handle_Tversion(packet)
+            case TRs.Tauth:
+                return self.handle_Tauth(packet)
+            case TRs.Tattach:
+                return self.handle_Tattach(packet)
+            case TRs.Tflush:
+                return self.handle_Tflush(packet)
+            case TRs.Twalk:
+                return self.handle_Twalk(packet)
+            case TRs.Topen:
+                return self.handle_Topen(packet)
+            case TRs.Tcreate:
+                return self.handle_Tcreate(packet)
+            case TRs.Tread:
+                return self.handle_Tread(packet)
+            case TRs.Twrite:
+                return self.handle_Twrite(packet)
+            case TRs.Tclunk:
+                return self.handle_Tclunk(packet)
+            case TRs.Tremove:
+                return self.handle_Tremove(packet)
+            case TRs.Tstat:
+                return self.handle_Tstat(packet)
+            case TRs.Twstat:
+                return self.handle_Twstat(packet)
+            case _:
+                raise Exception('No such operation')
+
     def handle_Tversion(self, d: dict):
         client = self.clients[d['client_id']]
         data = d['data']
 
-        client.socket.sendall(client._encode_Rversion(data['tag']))
+        if data['msize'] < MIN_MSIZE:
+            client.send(client._encode_Rerror(
+                'version: message size too small',
+                data['tag'],
+            ))
+            return
+
+        client.set_msize(min(data['msize'], self.msize))
+        client.send(client._encode_Rversion(data['tag']))
 
     def handle_Tauth(self, d: dict):
         raise NotImplementedError
 
+    def handle_disconnect(self, client_id: int) -> None:
+        pass
+
     def handle_Tattach(self, d: dict):
         raise NotImplementedError
 
@@ -165,6 +576,9 @@ class Py9Server(Py9):
         raise NotImplementedError
 
     def __del__(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
         clients = list(self.clients.keys())
         for id in clients:
             self.selector.unregister(self.clients[id].socket)
@@ -1,7 +1,12 @@
 import struct
 
 
+QID = struct.Struct('<BIQ')
+
+
 class Qid:
+    __slots__ = ('_type', 'version', 'path')
+
     def __init__(
             self,
             _type: int,
@@ -14,20 +19,10 @@ class Qid:
 
     @classmethod
     def from_bytes(cls, qid: bytes):
-        _type: int = struct.unpack('<B', qid[0:1])[0]
-        version: int = struct.unpack('<I', qid[1:5])[0]
-        path: int = struct.unpack('<Q', qid[5:13])[0]
-
-        return cls(_type, version, path)
+        return cls(*QID.unpack_from(qid))
 
     def to_bytes(self) -> bytes:
-        buff = b''
-
-        buff += struct.pack('<B', self._type)
-        buff += struct.pack('<I', self.version)
-        buff += struct.pack('<Q', self.path)
-
-        return buff
+        return QID.pack(self._type, self.version, self.path)
 
     def __iter__(self) -> dict:
         yield 'type', self._type
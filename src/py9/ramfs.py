@@ -0,0 +1,482 @@
+from fileserver import Py9FileServer
+from errors import Errors
+from qid import Qid
+from stat9 import Stat
+
+from utils import (
+    DMDIR,
+    IOHDRSZ,
+    NOCHANGE32,
+    NOCHANGE64,
+    ORDWR,
+    OTRUNC,
+    OWRITE,
+    QTDIR,
+    split_path,
+)
+
+from array import array
+
+import time
+
+
+class InodeTable:
+    # Inode attributes live in parallel arrays indexed by inode number, so
+    # an inode costs a few machine words plus its name and contents instead
+    # of a Python object. Contents are a bytearray for files, a dict of
+    # name -> inode for directories, or None for generated files.
+
+    def __init__(self) -> None:
+        self.modes: array = array('I')
+        self.versions: array = array('I')
+        self.atimes: array = array('I')
+        self.mtimes: array = array('I')
+        self.generations: array = array('I')
+        self.parents: array = array('Q')
+        self.names: list[str | None] = []
+        self.contents: list = []
+        self.generators: dict[int, tuple] = {}
+        self.free: list[int] = []
+
+    def __len__(self) -> int:
+        return len(self.names) - len(self.free)
+
+    def alloc(self, parent: int, name: str, mode: int, contents) -> int:
+        now: int = int(time.time())
+        if self.free:
+            ino: int = self.free.pop()
+            self.modes[ino] = mode
+            self.versions[ino] = 0
+            self.atimes[ino] = now
+            self.mtimes[ino] = now
+            self.parents[ino] = parent
+            self.names[ino] = name
+            self.contents[ino] = contents
+        else:
+            ino = len(self.names)
+            self.modes.append(mode)
+            self.versions.append(0)
+            self.atimes.append(now)
+            self.mtimes.append(now)
+            self.generations.append(0)
+            self.parents.append(parent)
+            self.names.append(name)
+            self.contents.append(contents)
+
+        return ino
+
+    def release(self, ino: int) -> None:
+        self.generations[ino] = (self.generations[ino] + 1) & NOCHANGE32
+        self.names[ino] = None
+        self.contents[ino] = None
+        self.generators.pop(ino, None)
+        self.free.append(ino)
+
+    def is_dir(self, ino: int) -> bool:
+        return bool(self.modes[ino] & DMDIR)
+
+    def length(self, ino: int) -> int:
+        contents = self.contents[ino]
+        if contents is None:
+            return self.generators[ino][0]
+        if contents.__class__ is dict:
+            return 0
+
+        return len(contents)
+
+    def qid(self, ino: int) -> Qid:
+        return Qid(
+            QTDIR if self.modes[ino] & DMDIR else 0,
+            self.versions[ino],
+            ino,
+        )
+
+    def touch(self, ino: int) -> None:
+        self.versions[ino] = (self.versions[ino] + 1) & NOCHANGE32
+        self.mtimes[ino] = int(time.time())
+
+    def materialize(self, ino: int) -> bytearray:
+        contents = self.contents[ino]
+        if contents is None:
+            length, generator = self.generators.pop(ino)
+            contents = bytearray(generator(0, length))
+            self.contents[ino] = contents
+
+        return contents
+
+    def truncate(self, ino: int, length: int) -> None:
+        if self.contents[ino] is None and length == 0:
+            del self.generators[ino]
+            self.contents[ino] = bytearray()
+        else:
+            contents: bytearray = self.materialize(ino)
+            if length < len(contents):
+                del contents[length:]
+            else:
+                contents.extend(bytes(length - len(contents)))
+        self.touch(ino)
+
+    def read(self, ino: int, offset: int, count: int) -> bytes:
+        contents = self.contents[ino]
+        if contents is None:
+            length, generator = self.generators[ino]
+            if offset >= length:
+                return b''
+            return generator(offset, min(count, length - offset))
+
+        return contents[offset:offset + count]
+
+
+class Py9RamServer(Py9FileServer):
+    class Fid:
+        __slots__ = ('ino', 'generation', 'mode', 'entries', 'index', 'end')
+
+        def __init__(self, ino: int, generation: int) -> None:
+            self.ino: int = ino
+            self.generation: int = generation
+            self.mode: int | None = None
+            self.entries: list[str] | None = None
+            self.index: int = 0
+            self.end: int = 0
+
+    def __init__(
+            self,
+            ip: str,
+            port: int,
+            msize: int = 32768,
+            version: str = "9P2000",
+            owner: str = 'ramfs',
+            **options,
+    ) -> None:
+        super().__init__(ip, port, msize, version, **options)
+        self.owner: str = owner
+        self.inodes: InodeTable = InodeTable()
+        self.root: int = self.inodes.alloc(0, '/', DMDIR | 0o755, {})
+        self.fids: dict[int, dict[int, Py9RamServer.Fid]] = {}
+
+    def _resolve(self, path: str, create: bool = False) -> int:
+        ino: int = self.root
+        for name in split_path(path):
+            entries = self.inodes.contents[ino]
+            if entries.__class__ is not dict:
+                raise Exception(Errors.Ewalknodir)
+            child: int | None = entries.get(name)
+            if child is None:
+                if not create:
+                    raise Exception(Errors.Enotfound)
+                child = self.inodes.alloc(ino, name, DMDIR | 0o755, {})
+                entries[name] = child
+            ino = child
+
+        return ino
+
+    def _add(self, path: str, mode: int, contents) -> int:
+        names: list[str] = split_path(path)
+        if not names:
+            raise Exception(Errors.Eperm)
+
+        parent: int = self._resolve('/'.join(names[:-1]), create=True)
+        entries: dict = self.inodes.contents[parent]
+        if names[-1] in entries:
+            raise Exception(f'{path}: file exists')
+
+        ino: int = self.inodes.alloc(parent, names[-1], mode, contents)
+        entries[names[-1]] = ino
+        self.inodes.touch(parent)
+
+        return ino
+
+    def mkdir(self, path: str, perm: int = 0o755) -> int:
+        return self._add(path, DMDIR | perm & 0o777, {})
+
+    def add_file(
+            self,
+            path: str,
+            data: bytes = b'',
+            perm: int = 0o644,
+    ) -> int:
+        return self._add(path, perm & 0o777, bytearray(data))
+
+    def add_generated(
+            self,
+            path: str,
+            length: int,
+            generator,
+            perm: int = 0o444,
+    ) -> int:
+        ino: int = self._add(path, perm & 0o777, None)
+        self.inodes.generators[ino] = (length, generator)
+
+        return ino
+
+    def _stat(self, ino: int) -> Stat:
+        inodes: InodeTable = self.inodes
+
+        return Stat(
+            0,
+            0,
+            0,
+            inodes.qid(ino),
+            inodes.modes[ino],
+            inodes.atimes[ino],
+            inodes.mtimes[ino],
+            inodes.length(ino),
+            inodes.names[ino],
+            self.owner,
+            self.owner,
+            self.owner,
+        )
+
+    def _fid(self, d: dict) -> 'Py9RamServer.Fid':
+        entry = self.fids.get(d['client_id'], {}).get(d['data']['fid'])
+        if entry is None:
+            raise Exception(Errors.Eunknownfid)
+        if self.inodes.generations[entry.ino] != entry.generation:
+            raise Exception(Errors.Enotfound)
+
+        return entry
+
+    def handle_disconnect(self, client_id: int) -> None:
+        self.fids.pop(client_id, None)
+
+    def handle_Tattach(self, d: dict):
+        client = self.clients[d['client_id']]
+        data = d['data']
+
+        fids = self.fids.setdefault(d['client_id'], {})
+        if data['fid'] in fids:
+            raise Exception(Errors.Edupfid)
+        fids[data['fid']] = Py9RamServer.Fid(
+            self.root,
+            self.inodes.generations[self.root],
+        )
+
+        client.send(client._encode_Rattach(
+            self.inodes.qid(self.root),
+            data['tag'],
+        ))
+
+    def handle_Twalk(self, d: dict):
+        client = self.clients[d['client_id']]
+        data = d['data']
+        inodes: InodeTable = self.inodes
+
+        entry = self._fid(d)
+        fids = self.fids[d['client_id']]
+        if entry.mode is not None:
+            raise Exception(Errors.Ebotch)
+        if data['newfid'] != data['fid'] and data['newfid'] in fids:
+            raise Exception(Errors.Edupfid)
+
+        ino: int = entry.ino
+        qids: list[Qid] = []
+        for name in data['wnames']:
+            entries = inodes.contents[ino]
+            if entries.__class__ is not dict:
+                if not qids:
+                    raise Exception(Errors.Ewalknodir)
+                break
+            name = name.decode()
+            if name == '..':
+                child: int | None = inodes.parents[ino]
+            else:
+                child = entries.get(name)
+            if child is None:
+                if not qids:
+                    raise Exception(Errors.Enotfound)
+                break
+            ino = child
+            qids.append(inodes.qid(ino))
+
+        if len(qids) == len(data['wnames']):
+            fids[data['newfid']] = Py9RamServer.Fid(
+                ino,
+                inodes.generations[ino],
+            )
+
+        client.send(client._encode_Rwalk(qids, data['tag']))
+
+    def handle_Topen(self, d: dict):
+        client = self.clients[d['client_id']]
+        data = d['data']
+        inodes: InodeTable = self.inodes
+
+        entry = self._fid(d)
+        if entry.mode is not None:
+            raise Exception(Errors.Ebotch)
+
+        mode: int = data['mode']
+        if mode & 3 in (OWRITE, ORDWR) or mode & OTRUNC:
+            if inodes.is_dir(entry.ino):
+                raise Exception(Errors.Eisdir)
+            if mode & OTRUNC:
+                inodes.truncate(entry.ino, 0)
+        entry.mode = mode
+
+        client.send(client._encode_Ropen(
+            inodes.qid(entry.ino),
+            client.msize - IOHDRSZ,
+            data['tag'],
+        ))
+
+    def handle_Tcreate(self, d: dict):
+        client = self.clients[d['client_id']]
+        data = d['data']
+        inodes: InodeTable = self.inodes
+
+        entry = self._fid(d)
+        if entry.mode is not None:
+            raise Exception(Errors.Ebotch)
+        entries = inodes.contents[entry.ino]
+        if entries.__class__ is not dict:
+            raise Exception(Errors.Ecreatenondir)
+
+        name: str = data['name'].decode()
+        if name in ('', '.', '..') or '/' in name:
+            raise Exception(Errors.Enocreate)
+        if name in entries:
+            raise Exception(f'{name}: file exists')
+
+        perm: int = data['perm']
+        if perm & DMDIR:
+            ino: int = inodes.alloc(entry.ino, name, DMDIR | perm & 0o777, {})
+        else:
+            ino = inodes.alloc(entry.ino, name, perm & 0o777, bytearray())
+        entries[name] = ino
+        inodes.touch(entry.ino)
+
+        entry.ino = ino
+        entry.generation = inodes.generations[ino]
+        entry.mode = data['mode']
+
+        client.send(client._encode_Rcreate(
+            inodes.qid(ino),
+            client.msize - IOHDRSZ,
+            data['tag'],
+        ))
+
+    def handle_Tread(self, d: dict):
+        client = self.clients[d['client_id']]
+        data = d['data']
+        inodes: InodeTable = self.inodes
+
+        entry = self._fid(d)
+        if entry.mode is None:
+            raise Exception(Errors.Ebotch)
+
+        count: int = min(data['count'], client.msize - IOHDRSZ)
+        if not inodes.is_dir(entry.ino):
+            inodes.atimes[entry.ino] = int(time.time())
+            client.send(client._encode_Rread_iov(
+                inodes.read(entry.ino, data['offset'], count),
+                data['tag'],
+            ))
+            return
+
+        # A directory read snapshots the child names and encodes only as
+        # many entries as fit into each reply. Removed children are skipped.
+        entries: dict = inodes.contents[entry.ino]
+
+        def encode(name: str) -> bytes | None:
+            child: int | None = entries.get(name)
+            return None if child is None else self._stat(child).to_bytes()
+
+        client.send(client._encode_Rread(
+            self._read_dir(
+                entry,
+                data['offset'],
+                count,
+                lambda entry: list(inodes.contents[entry.ino]),
+                encode,
+            ),
+            data['tag'],
+        ))
+
+    def handle_Twrite(self, d: dict):
+        client = self.clients[d['client_id']]
+        data = d['data']
+        inodes: InodeTable = self.inodes
+
+        entry = self._fid(d)
+        if entry.mode is None or entry.mode & 3 not in (OWRITE, ORDWR):
+            raise Exception(Errors.Ebotch)
+
+        contents: bytearray = inodes.materialize(entry.ino)
+        offset: int = data['offset']
+        if offset > len(contents):
+            contents.extend(bytes(offset - len(contents)))
+        contents[offset:offset + data['count']] = data['data']
+        inodes.touch(entry.ino)
+
+        client.send(client._encode_Rwrite(data['count'], data['tag']))
+
+    def handle_Tclunk(self, d: dict):
+        client = self.clients[d['client_id']]
+        data = d['data']
+
+        if data['fid'] not in self.fids.get(d['client_id'], {}):
+            raise Exception(Errors.Eunknownfid)
+        del self.fids[d['client_id']][data['fid']]
+
+        client.send(client._encode_Rclunk(data['tag']))
+
+    def _unlink(self, ino: int) -> None:
+        inodes: InodeTable = self.inodes
+        if ino == self.root:
+            raise Exception(Errors.Enoremove)
+        entries = inodes.contents[ino]
+        if entries.__class__ is dict and entries:
+            raise Exception('directory not empty')
+
+        parent: int = inodes.parents[ino]
+        del inodes.contents[parent][inodes.names[ino]]
+        inodes.touch(parent)
+        inodes.release(ino)
+
+    def handle_Tremove(self, d: dict):
+        client = self.clients[d['client_id']]
+        data = d['data']
+
+        entry = self._fid(d)
+        del self.fids[d['client_id']][data['fid']]
+        self._unlink(entry.ino)
+
+        client.send(client._encode_Rremove(data['tag']))
+
+    def handle_Tstat(self, d: dict):
+        client = self.clients[d['client_id']]
+        data = d['data']
+
+        entry = self._fid(d)
+
+        client.send(client._encode_Rstat(self._stat(entry.ino), data['tag']))
+
+    def handle_Twstat(self, d: dict):
+        client = self.clients[d['client_id']]
+        data = d['data']
+        inodes: InodeTable = self.inodes
+
+        entry = self._fid(d)
+        ino: int = entry.ino
+        change: Stat = data['stat']
+
+        if change.length != NOCHANGE64:
+            if inodes.is_dir(ino):
+                raise Exception(Errors.Eisdir)
+            inodes.truncate(ino, change.length)
+        if change.mode != NOCHANGE32:
+            inodes.modes[ino] = inodes.modes[ino] & DMDIR | \
+                change.mode & 0o777
+        if change.mtime != NOCHANGE32:
+            inodes.mtimes[ino] = change.mtime
+        if change.name and change.name != inodes.names[ino]:
+            if ino == self.root or '/' in change.name:
+                raise Exception(Errors.Eperm)
+            siblings: dict = inodes.contents[inodes.parents[ino]]
+            if change.name in siblings:
+                raise Exception(f'{change.name}: file exists')
+            del siblings[inodes.names[ino]]
+            siblings[change.name] = ino
+            inodes.names[ino] = change.name
+
+        client.send(client._encode_Rwstat(data['tag']))
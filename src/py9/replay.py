@@ -0,0 +1,358 @@
+from capture import SENT, RECEIVED, read_capture
+from codec import CODES, HEADER_LEN, SCHEMA
+from framer import Framer
+from trs import TRs
+from utils import NOFID, NOTAG
+
+from collections import deque
+
+import argparse
+import json
+import selectors
+import socket
+import struct
+import time
+
+
+U16 = struct.Struct('<H')
+U32 = struct.Struct('<I')
+
+
+def _fid_fields() -> dict[int, list[tuple[int, bool]]]:
+    # Offsets of the fid fields of every request, and whether the field
+    # brings a new fid into use. They all sit in the fixed-size prefix.
+    fields: dict[int, list[tuple[int, bool]]] = {}
+    for _type, schema in SCHEMA.items():
+        if _type % 2:
+            continue
+        offset: int = HEADER_LEN
+        for name, kind in schema:
+            if kind not in CODES:
+                break
+            if name in ('fid', 'afid', 'newfid'):
+                new: bool = name == 'newfid' or (
+                    name == 'fid' and _type == TRs.Tattach or
+                    name == 'afid' and _type == TRs.Tauth
+                )
+                fields.setdefault(_type, []).append((offset, new))
+            offset += struct.calcsize('<' + CODES[kind])
+
+    return fields
+
+
+FIDS: dict[int, list[tuple[int, bool]]] = _fid_fields()
+
+
+def summarize(values: list[float]) -> dict:
+    ordered: list[float] = sorted(values)
+    count: int = len(ordered)
+
+    def at(fraction: float) -> float:
+        return ordered[min(count - 1, int(fraction * count))]
+
+    return {
+        'count': count,
+        'mean': sum(ordered) / count,
+        'p50': at(0.5),
+        'p90': at(0.9),
+        'p99': at(0.99),
+        'max': ordered[-1],
+    }
+
+
+class Replay:
+    class Connection:
+        def __init__(self, connection: int, msize: int) -> None:
+            self.connection: int = connection
+            self.socket: socket.socket | None = None
+            self.framer: Framer = Framer(msize)
+            self.outbox: bytearray = bytearray()
+            self.events: int = 0
+
+            # Requests that are due but held back by the window, and when
+            # the connection last sent a request or got a reply.
+            self.queue: deque[bytes] = deque()
+            self.progress: float = 0.0
+
+            # Captured tags and fids are mapped onto ones allocated for the
+            # replay, so requests stay consistent however replies overlap.
+            self.tags: dict[int, int] = {}
+            self.fids: dict[int, int] = {}
+            self.pending: dict[int, tuple[int, float]] = {}
+            self.flushes: dict[int, int] = {}
+            self.tag: int = -1
+            self.fid: int = -1
+
+        def new_tag(self) -> int:
+            tag: int = self.tag
+            while True:
+                tag = (tag + 1) % NOTAG
+                if tag not in self.pending:
+                    break
+            self.tag = tag
+
+            return tag
+
+        def map_fid(self, fid: int, new: bool) -> int:
+            if fid == NOFID:
+                return fid
+            mapped: int | None = self.fids.get(fid)
+            if mapped is None or new:
+                self.fid = (self.fid + 1) % NOFID
+                mapped = self.fids[fid] = self.fid
+
+            return mapped
+
+        def rewrite(self, frame: bytes) -> tuple[bytearray, int]:
+            frame = bytearray(frame)
+            operation: int = frame[4]
+            captured: int = U16.unpack_from(frame, 5)[0]
+            tag: int = captured
+            if captured != NOTAG:
+                tag = self.tags[captured] = self.new_tag()
+            U16.pack_into(frame, 5, tag)
+
+            if operation == TRs.Tflush:
+                oldtag: int = U16.unpack_from(frame, HEADER_LEN)[0]
+                oldtag = self.tags.get(oldtag, oldtag)
+                U16.pack_into(frame, HEADER_LEN, oldtag)
+                self.flushes[tag] = oldtag
+
+            # Existing fids are resolved before new ones are allocated, and
+            # a walk whose newfid equals its fid keeps the same replay fid.
+            mapped: dict[int, int] = {}
+            fields: list[tuple[int, bool]] = FIDS.get(operation, [])
+            for offset, new in sorted(fields, key=lambda field: field[1]):
+                fid: int = U32.unpack_from(frame, offset)[0]
+                if fid not in mapped:
+                    mapped[fid] = self.map_fid(fid, new)
+                U32.pack_into(frame, offset, mapped[fid])
+
+            return frame, tag
+
+    def __init__(
+            self,
+            source,
+            host: str,
+            port: int,
+            speed: float = 1.0,
+            window: int = 64,
+            timeout: float = 30.0,
+            direction: int | None = None,
+    ) -> None:
+        self.host: str = host
+        self.port: int = port
+        self.speed: float = speed
+        self.window: int = window
+        self.timeout: float = timeout
+
+        # Requests are the even message types. A capture taken on either
+        # side holds them, in one direction or the other.
+        self.requests: list[tuple[float, int, bytes]] = [
+            (stamp, connection, frame)
+            for stamp, connection, way, frame in read_capture(source)
+            if not frame[4] % 2 and (direction is None or way == direction)
+        ]
+        msize: int = max([
+            U32.unpack_from(frame, HEADER_LEN)[0]
+            for _, _, frame in self.requests if frame[4] == TRs.Tversion
+        ] or [1 << 20])
+        self.connections: dict[int, Replay.Connection] = {
+            connection: Replay.Connection(connection, msize)
+            for _, connection, _ in self.requests
+        }
+
+        self.selector: selectors.BaseSelector = selectors.DefaultSelector()
+        self.backlog: dict[int, Replay.Connection] = {}
+        self.latency: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+        self.sent: int = 0
+        self.received: int = 0
+
+    def run(self) -> dict:
+        requests: list = self.requests
+        if not requests:
+            return self.report(0.0)
+
+        first: float = requests[0][0]
+        clock = time.monotonic
+        start: float = clock()
+        index: int = 0
+        deadline: float | None = None
+        backlog: dict[int, Replay.Connection] = self.backlog
+
+        while True:
+            now: float = clock()
+            while index < len(requests):
+                stamp, connection, frame = requests[index]
+                if (self.speed > 0 and
+                        (stamp - first) / self.speed > now - start):
+                    break
+                state: Replay.Connection = self.connections[connection]
+                if not state.queue:
+                    state.progress = now
+                    backlog[connection] = state
+                state.queue.append(frame)
+                index += 1
+
+            # A connection held back by its window only delays its own
+            # requests, the others keep to the timeline.
+            for connection, state in list(backlog.items()):
+                while state.queue and len(state.pending) < self.window:
+                    self._send(state, state.queue.popleft())
+                if not state.queue:
+                    del backlog[connection]
+
+            wait: float = self.timeout
+            if index < len(requests):
+                wait = min(wait, start + (requests[index][0] - first) /
+                           self.speed - clock())
+            elif not backlog:
+                if not any(c.pending for c in self.connections.values()):
+                    break
+                if deadline is None:
+                    deadline = now + self.timeout
+                wait = deadline - now
+                if wait <= 0:
+                    break
+
+            self._poll(max(0.0, wait))
+
+            # A connection that is held back by its window and gets no
+            # reply for a whole timeout has stalled.
+            now = clock()
+            if any(now - state.progress >= self.timeout
+                   for state in backlog.values()):
+                break
+
+        elapsed: float = clock() - start
+        for state in self.connections.values():
+            if state.socket is not None:
+                self.selector.unregister(state.socket)
+                state.socket.close()
+
+        return self.report(elapsed)
+
+    def report(self, elapsed: float) -> dict:
+        return {
+            'duration': elapsed,
+            'sent': self.sent,
+            'received': self.received,
+            'lost': self.sent - self.received,
+            'errors': self.errors,
+            'latency': {
+                name: summarize(values)
+                for name, values in sorted(self.latency.items())
+            },
+        }
+
+    def _send(self, state: 'Replay.Connection', frame: bytes) -> None:
+        if state.socket is None:
+            state.socket = socket.create_connection((self.host, self.port))
+            state.socket.setsockopt(
+                socket.IPPROTO_TCP,
+                socket.TCP_NODELAY,
+                1,
+            )
+            state.socket.setblocking(False)
+            state.events = selectors.EVENT_READ
+            self.selector.register(state.socket, state.events, state)
+
+        frame, tag = state.rewrite(frame)
+        state.progress = time.monotonic()
+        state.pending[tag] = (frame[4], state.progress)
+        state.outbox += frame
+        self.sent += 1
+        self._write(state)
+
+    def _write(self, state: 'Replay.Connection') -> None:
+        if state.outbox:
+            try:
+                sent: int = state.socket.send(state.outbox)
+                del state.outbox[:sent]
+            except BlockingIOError:
+                pass
+
+        events: int = selectors.EVENT_READ
+        if state.outbox:
+            events |= selectors.EVENT_WRITE
+        if events != state.events:
+            self.selector.modify(state.socket, events, state)
+            state.events = events
+
+    def _poll(self, timeout: float) -> int:
+        events: list = self.selector.select(timeout)
+        for key, mask in events:
+            state: Replay.Connection = key.data
+            if mask & selectors.EVENT_WRITE:
+                self._write(state)
+            if not mask & selectors.EVENT_READ:
+                continue
+
+            try:
+                received: int = state.framer.fill(state.socket)
+            except BlockingIOError:
+                continue
+            if not received:
+                raise Exception(
+                    f'Server closed replay connection {state.connection}')
+
+            now: float = time.monotonic()
+            for frame in state.framer.frames():
+                tag: int = U16.unpack_from(frame, 5)[0]
+                request: tuple[int, float] | None = state.pending.pop(
+                    tag,
+                    None,
+                )
+                if request is None:
+                    continue
+                state.progress = now
+                name: str = TRs(request[0]).name
+                self.received += 1
+                self.latency.setdefault(name, []).append(now - request[1])
+                if frame[4] == TRs.Rerror:
+                    self.errors[name] = self.errors.get(name, 0) + 1
+                elif frame[4] == TRs.Rflush:
+                    # The flushed request gets no reply of its own.
+                    if state.pending.pop(state.flushes.pop(tag), None):
+                        self.received += 1
+
+        return len(events)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Replay the requests of a py9 capture against a server')
+    parser.add_argument('capture')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=564)
+    parser.add_argument(
+        '--speed', type=float, default=1.0,
+        help='time scale, 2 replays twice as fast, 0 as fast as possible')
+    parser.add_argument(
+        '--window', type=int, default=64,
+        help='most requests in flight per connection')
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument(
+        '--direction', choices=('sent', 'received'),
+        help='only replay requests recorded in this direction')
+    args = parser.parse_args()
+
+    direction: int | None = None
+    if args.direction is not None:
+        direction = SENT if args.direction == 'sent' else RECEIVED
+
+    replay = Replay(
+        args.capture,
+        args.host,
+        args.port,
+        args.speed,
+        args.window,
+        args.timeout,
+        direction,
+    )
+    print(json.dumps(replay.run(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -8,7 +8,26 @@ from utils import (
 )
 
 
+# size[2] type[2] dev[4] qid[13] mode[4] atime[4] mtime[4] length[8]
+STAT = struct.Struct('<HHIBIQIIIQ')
+
+
 class Stat:
+    __slots__ = (
+        'size',
+        '_type',
+        'dev',
+        'qid',
+        'mode',
+        'atime',
+        'mtime',
+        'length',
+        'name',
+        'uid',
+        'gid',
+        'muid',
+    )
+
     def __init__(
             self,
             size: int,
@@ -39,76 +58,99 @@ class Stat:
 
     @classmethod
     def from_bytes(cls, stat: bytes):
-        try:
-            size: int = struct.unpack('<H', stat[0:2])[0]
-            _type: int = struct.unpack('<H', stat[2:4])[0]
-            dev: int = struct.unpack('<I', stat[4:8])[0]
-            qid: bytes = Qid.from_bytes(stat[8:21])
-            mode: int = struct.unpack('<I', stat[21:25])[0]
-            atime: int = struct.unpack('<I', stat[25:29])[0]
-            mtime: int = struct.unpack('<I', stat[29:33])[0]
-            length: int = struct.unpack('<Q', stat[33:41])[0]
-
-            _name_offset: int = struct.unpack(
-                '<H',
-                stat[41:41 + STR_LEN])[0] + 41 + STR_LEN
-            name: bytes = stat[41 + STR_LEN:_name_offset].decode()
-
-            _uid_offset: int = struct.unpack(
-                '<H',
-                stat[_name_offset:_name_offset + STR_LEN],
-            )[0] + _name_offset + STR_LEN
-            uid: bytes = stat[_name_offset + STR_LEN:_uid_offset].decode()
-
-            _gid_offset: int = struct.unpack(
-                '<H',
-                stat[_uid_offset:_uid_offset + STR_LEN],
-            )[0] + _uid_offset + STR_LEN
-            gid: bytes = stat[_uid_offset + STR_LEN:_gid_offset].decode()
-
-            _muid_offset: int = struct.unpack(
-                '<H',
-                stat[_gid_offset:_gid_offset + STR_LEN],
-            )[0] + _gid_offset + STR_LEN
-            muid: bytes = stat[_gid_offset + STR_LEN:_muid_offset].decode()
-        except Exception:
-            raise Exception(
-                "Error in parsing stat data. " +
-                "Is provided data a valid stat?")
-
-        return cls(
-            size,
-            _type,
-            dev,
-            qid,
-            mode,
-            atime,
-            mtime,
-            length,
-            name,
-            uid,
-            gid,
-            muid,
-        )
+        size: int = stat[0] | stat[1] << 8
+        return cls.decode_many(stat[:size + STR_LEN], 1)[0]
 
-    def to_bytes(self) -> bytes:
-        buff = b''
-
-        buff += struct.pack('<H', self._type)
-        buff += struct.pack('<I', self.dev)
-        buff += self.qid.to_bytes()
-        buff += struct.pack('<I', self.mode)
-        buff += struct.pack('<I', self.atime)
-        buff += struct.pack('<I', self.mtime)
-        buff += struct.pack('<Q', self.length)
-        buff += encode_string(self.name)
-        buff += encode_string(self.uid)
-        buff += encode_string(self.gid)
-        buff += encode_string(self.muid)
-
-        size = struct.pack('<H', len(buff))
+    @classmethod
+    def decode_many(cls, buffer, limit: int = -1) -> list['Stat']:
+        # One unpack_from covers the fixed 41-byte prefix. The four string
+        # lengths are read straight from the bytes object, which is much
+        # cheaper than a Struct call per string. Owner names repeat across
+        # a listing, so each distinct uid/gid/muid is decoded only once and
+        # shared between entries.
+        if buffer.__class__ is not bytes:
+            buffer = bytes(buffer)
+        unpack_fixed = STAT.unpack_from
+        fixed: int = STAT.size
+        end: int = len(buffer)
+        stats: list[Stat] = []
+        owners: dict[bytes, str] = {}
+        offset: int = 0
+
+        while offset < end and limit != 0:
+            (
+                size,
+                _type,
+                dev,
+                qid_type,
+                qid_version,
+                qid_path,
+                mode,
+                atime,
+                mtime,
+                length,
+            ) = unpack_fixed(buffer, offset)
+
+            a: int = offset + fixed + STR_LEN
+            b: int = a + (buffer[a - 2] | buffer[a - 1] << 8)
+            c: int = b + STR_LEN
+            d: int = c + (buffer[c - 2] | buffer[c - 1] << 8)
+            e: int = d + STR_LEN
+            f: int = e + (buffer[e - 2] | buffer[e - 1] << 8)
+            g: int = f + STR_LEN
+            h: int = g + (buffer[g - 2] | buffer[g - 1] << 8)
+            if h > end:
+                raise struct.error('Truncated stat data')
+
+            uid: bytes = buffer[c:d]
+            gid: bytes = buffer[e:f]
+            muid: bytes = buffer[g:h]
+            if uid not in owners:
+                owners[uid] = uid.decode()
+            if gid not in owners:
+                owners[gid] = gid.decode()
+            if muid not in owners:
+                owners[muid] = muid.decode()
+
+            stats.append(cls(
+                size,
+                _type,
+                dev,
+                Qid(qid_type, qid_version, qid_path),
+                mode,
+                atime,
+                mtime,
+                length,
+                buffer[a:b].decode(),
+                owners[uid],
+                owners[gid],
+                owners[muid],
+            ))
+            offset += size + STR_LEN
+            limit -= 1
+
+        return stats
 
-        return size + buff
+    def to_bytes(self) -> bytes:
+        strings: bytes = b''.join([
+            encode_string(self.name),
+            encode_string(self.uid),
+            encode_string(self.gid),
+            encode_string(self.muid),
+        ])
+
+        return STAT.pack(
+            STAT.size - STR_LEN + len(strings),
+            self._type,
+            self.dev,
+            self.qid._type,
+            self.qid.version,
+            self.qid.path,
+            self.mode,
+            self.atime,
+            self.mtime,
+            self.length,
+        ) + strings
 
     def __iter__(self) -> dict:
         yield '_type', self._type
@@ -125,3 +167,87 @@ class Stat:
 
     def __str__(self) -> str:
         return str(dict(self))
+
+
+class DirEntry:
+    __slots__ = (
+        'data',
+        'offset',
+        'size',
+        '_type',
+        'dev',
+        'qid',
+        'mode',
+        'atime',
+        'mtime',
+        'length',
+        '_strings',
+    )
+
+    def __init__(self, data: bytes | memoryview, offset: int = 0) -> None:
+        self.data: bytes | memoryview = data
+        self.offset: int = offset
+        (
+            self.size,
+            self._type,
+            self.dev,
+            qid_type,
+            qid_version,
+            qid_path,
+            self.mode,
+            self.atime,
+            self.mtime,
+            self.length,
+        ) = STAT.unpack_from(data, offset)
+        self.qid: Qid = Qid(qid_type, qid_version, qid_path)
+        self._strings: list | None = None
+
+    @classmethod
+    def iter_bytes(cls, data):
+        # Entries keep the chunk they came in and decode from their offset
+        # into it, so a listing is walked without copying each record.
+        offset: int = 0
+        end: int = len(data)
+        while offset + STR_LEN <= end:
+            entry: DirEntry = cls(data, offset)
+            yield entry
+            offset += STR_LEN + entry.size
+
+    def _string(self, index: int) -> str:
+        if self._strings is None:
+            self._strings = [None] * 4
+
+        value: str | None = self._strings[index]
+        if value is None:
+            offset: int = self.offset + STAT.size
+            for _ in range(index):
+                offset += STR_LEN + struct.unpack_from(
+                    '<H', self.data, offset)[0]
+            length: int = struct.unpack_from('<H', self.data, offset)[0]
+            value = str(self.data[offset + STR_LEN:
+                                  offset + STR_LEN + length], 'utf-8')
+            self._strings[index] = value
+
+        return value
+
+    @property
+    def name(self) -> str:
+        return self._string(0)
+
+    @property
+    def uid(self) -> str:
+        return self._string(1)
+
+    @property
+    def gid(self) -> str:
+        return self._string(2)
+
+    @property
+    def muid(self) -> str:
+        return self._string(3)
+
+    def to_stat(self) -> Stat:
+        return Stat.from_bytes(memoryview(self.data)[self.offset:])
+
+    def __str__(self) -> str:
+        return str(self.to_stat())
@@ -2,6 +2,23 @@ import struct
 
 
 STR_LEN = 2
+NOTAG = 0xFFFF
+NOFID = 0xFFFFFFFF
+IOHDRSZ = 24
+MIN_MSIZE = 256
+MAXWELEM = 16
+
+OREAD = 0
+OWRITE = 1
+ORDWR = 2
+OEXEC = 3
+OTRUNC = 0x10
+
+QTDIR = 0x80
+DMDIR = 0x80000000
+
+NOCHANGE32 = 0xFFFFFFFF
+NOCHANGE64 = 0xFFFFFFFFFFFFFFFF
 
 
 def encode_string(string: str) -> bytes:
@@ -9,3 +26,7 @@ def encode_string(string: str) -> bytes:
     buff = struct.pack('<H', len(data)) + data
 
     return buff
+
+
+def split_path(path: str) -> list[str]:
+    return [name for name in path.split('/') if name and name != '.']
@@ -0,0 +1,178 @@
+from cache import BlockCache, StatCache, WalkCache
+from qid import Qid
+from stat9 import Stat
+
+import time
+import unittest
+
+
+def qids(*paths: int) -> tuple[Qid, ...]:
+    return tuple(Qid(0x80, 0, path) for path in paths)
+
+
+def stat(name: str, path: int, version: int = 0) -> Stat:
+    return Stat(
+        0,
+        0,
+        0,
+        Qid(0, version, path),
+        0o644,
+        0,
+        0,
+        path,
+        name,
+        'user',
+        'group',
+        'user',
+    )
+
+
+class TestBlockCache(unittest.TestCase):
+    def test_hit_and_miss(self) -> None:
+        cache = BlockCache(block_size=4)
+        self.assertIsNone(cache.get(1, 0, 0))
+        cache.put(1, 0, 0, b'abcd')
+        self.assertEqual(cache.get(1, 0, 0), b'abcd')
+        self.assertIsNone(cache.get(1, 0, 1))
+        self.assertIsNone(cache.get(2, 0, 0))
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 3)
+
+    def test_new_version_drops_block(self) -> None:
+        cache = BlockCache(block_size=4)
+        cache.put(1, 0, 0, b'abcd')
+        self.assertIsNone(cache.get(1, 1, 0))
+        self.assertEqual(cache.stats()['blocks'], 0)
+        self.assertEqual(cache.stats()['bytes'], 0)
+
+    def test_evicts_least_recently_used(self) -> None:
+        cache = BlockCache(capacity=12, block_size=4)
+        for index in range(3):
+            cache.put(1, 0, index, b'%4d' % index)
+        cache.get(1, 0, 0)
+        cache.put(2, 0, 0, b'next')
+
+        self.assertIsNotNone(cache.get(1, 0, 0))
+        self.assertIsNone(cache.get(1, 0, 1))
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(cache.stats()['bytes'], 12)
+
+    def test_replacing_block_keeps_size(self) -> None:
+        cache = BlockCache(block_size=4)
+        cache.put(1, 0, 0, b'ab')
+        cache.put(1, 0, 0, b'abcd')
+        self.assertEqual(cache.stats()['bytes'], 4)
+
+    def test_oversized_block_is_not_cached(self) -> None:
+        cache = BlockCache(capacity=4, block_size=8)
+        cache.put(1, 0, 0, b'12345678')
+        self.assertEqual(cache.stats()['blocks'], 0)
+
+    def test_invalidate(self) -> None:
+        cache = BlockCache(block_size=4)
+        for index in range(3):
+            cache.put(1, 0, index, b'abcd')
+        cache.put(2, 0, 0, b'abcd')
+        cache.invalidate(1)
+        self.assertEqual(cache.stats()['blocks'], 1)
+        self.assertEqual(cache.paths, {2: {0}})
+
+
+class TestWalkCache(unittest.TestCase):
+    def test_lookup_finds_deepest_ancestor(self) -> None:
+        cache = WalkCache()
+        cache.put(('a',), qids(1), 10)
+        cache.put(('a', 'b', 'c'), qids(1, 2, 3), 11)
+
+        self.assertEqual(cache.lookup(('a', 'b', 'c', 'd'))[:2], (3, 11))
+        self.assertEqual(cache.lookup(('a', 'b', 'x'))[:2], (1, 10))
+        self.assertEqual(cache.lookup(('x',)), (0, None, ()))
+        self.assertEqual(cache.stats()['hits'], 2)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_invalidate_drops_descendants(self) -> None:
+        cache = WalkCache()
+        cache.put(('a',), qids(1), 10)
+        cache.put(('a', 'b', 'c'), qids(1, 2, 3), 11)
+        cache.put(('x', 'y'), qids(4, 5), 12)
+
+        cache.invalidate(2)
+        self.assertEqual(list(cache.entries), [('a',), ('x', 'y')])
+        self.assertEqual(cache.take_stale(), [11])
+        self.assertEqual(cache.take_stale(), [])
+
+    def test_replaced_fid_becomes_stale(self) -> None:
+        cache = WalkCache()
+        cache.put(('a',), qids(1), 10)
+        cache.put(('a',), qids(1), 20)
+        self.assertEqual(cache.take_stale(), [10])
+
+    def test_expiry_and_capacity(self) -> None:
+        cache = WalkCache(capacity=2, ttl=0.05)
+        for fid, name in enumerate('abc'):
+            cache.put((name,), qids(fid), fid)
+        self.assertEqual(cache.take_stale(), [0])
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+        time.sleep(0.1)
+        self.assertEqual(cache.lookup(('b',)), (0, None, ()))
+        self.assertEqual(cache.take_stale(), [1])
+
+    def test_evict_prefix(self) -> None:
+        cache = WalkCache()
+        cache.put(('a',), qids(1), 10)
+        cache.put(('a', 'b'), qids(1, 2), 11)
+        cache.put(('ab',), qids(3), 12)
+        cache.evict(('a',))
+        self.assertEqual(list(cache.entries), [('ab',)])
+        self.assertEqual(sorted(cache.take_stale()), [10, 11])
+
+
+class TestStatCache(unittest.TestCase):
+    def test_get_by_qid_path_and_name(self) -> None:
+        cache = StatCache()
+        cache.put(stat('a', 1), ('d', 'a'))
+        cache.put(stat('b', 2))
+
+        self.assertEqual(cache.get(1).name, 'a')
+        self.assertEqual(cache.get_path(('d', 'a')).name, 'a')
+        self.assertEqual(cache.get(2).name, 'b')
+        self.assertIsNone(cache.get_path(('d', 'b')))
+        self.assertIsNone(cache.get(3))
+        self.assertEqual(cache.stats()['hits'], 3)
+        self.assertEqual(cache.stats()['misses'], 2)
+
+    def test_name_moves_to_new_file(self) -> None:
+        cache = StatCache()
+        cache.put(stat('a', 1), ('a',))
+        cache.put(stat('a', 2), ('a',))
+        self.assertEqual(cache.get_path(('a',)).qid.path, 2)
+
+        cache.invalidate(1)
+        self.assertEqual(cache.get_path(('a',)).qid.path, 2)
+        cache.invalidate(2)
+        self.assertIsNone(cache.get_path(('a',)))
+
+    def test_new_version_drops_entry(self) -> None:
+        cache = StatCache()
+        cache.put(stat('a', 1), ('a',))
+        cache.check(Qid(0, 0, 1))
+        self.assertIsNotNone(cache.get(1))
+        cache.check(Qid(0, 1, 1))
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.names, {})
+
+    def test_expiry_and_capacity(self) -> None:
+        cache = StatCache(capacity=2, ttl=0.05)
+        for path in range(3):
+            cache.put(stat(str(path), path), (str(path),))
+        self.assertIsNone(cache.get_path(('0',)))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+        time.sleep(0.1)
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.stats()['entries'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
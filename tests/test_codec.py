@@ -0,0 +1,147 @@
+from codec import ENCODE, ENCODE_IOV, HEADER, HEADER_LEN, MESSAGES, SCHEMA
+from qid import Qid
+from stat9 import Stat
+from trs import TRs
+
+import struct
+import unittest
+
+
+STAT: Stat = Stat(
+    0,
+    1,
+    2,
+    Qid(0x80, 3, 1 << 40),
+    0o755 | 0x80000000,
+    1000,
+    2000,
+    4096,
+    'dir',
+    'user',
+    'group',
+    'other',
+)
+
+VALUES: dict[str, object] = {
+    'B': 0x41,
+    'H': 0xBEEF,
+    'I': 0x01020304,
+    'Q': 1 << 40 | 5,
+    's': 'nämé',
+    'qid': Qid(0x80, 7, 1 << 33),
+    'strs': ['a', 'bc', 'déf'],
+    'qids': [Qid(0x80, i, i << 20) for i in range(3)],
+    'data': b'payload\x00\xff',
+    'stat': STAT,
+}
+
+
+def qid_tuple(qid: Qid) -> tuple[int, int, int]:
+    return qid._type, qid.version, qid.path
+
+
+def wire(kind: str, value) -> object:
+    # What the decoder hands back for a value of the given kind.
+    if kind == 's':
+        return value.encode()
+    if kind == 'strs':
+        return [name.encode() for name in value]
+    if kind == 'qid':
+        return qid_tuple(value)
+    if kind == 'qids':
+        return [qid_tuple(qid) for qid in value]
+    if kind == 'stat':
+        return value.to_bytes()
+
+    return value
+
+
+def received(kind: str, value) -> object:
+    if kind == 'qid':
+        return qid_tuple(value)
+    if kind == 'qids':
+        return [qid_tuple(qid) for qid in value]
+    if kind == 'stat':
+        return value.to_bytes()
+    if kind == 'data':
+        return bytes(value)
+
+    return value
+
+
+class TestCodec(unittest.TestCase):
+    def test_every_message_has_a_codec(self) -> None:
+        self.assertEqual(len(MESSAGES), 27)
+        for _type in TRs:
+            if _type == TRs.Terror:
+                self.assertNotIn(_type, MESSAGES)
+                continue
+            self.assertIs(getattr(ENCODE, _type.name), MESSAGES[_type].encode)
+
+    def test_round_trip(self) -> None:
+        for _type, fields in SCHEMA.items():
+            with self.subTest(_type.name):
+                args: list = [VALUES[kind] for _, kind in fields]
+                packet: bytes = getattr(ENCODE, _type.name)(0x1234, *args)
+
+                size, op, tag = HEADER.unpack_from(packet)
+                self.assertEqual(size, len(packet))
+                self.assertEqual(op, _type)
+                self.assertEqual(tag, 0x1234)
+
+                data: dict = MESSAGES[_type].decode(
+                    memoryview(packet)[HEADER_LEN:])
+                for (name, kind), value in zip(fields, args):
+                    self.assertEqual(
+                        received(kind, data[name]),
+                        wire(kind, value),
+                        name,
+                    )
+                if any(kind == 'data' for _, kind in fields):
+                    self.assertEqual(data['count'], len(VALUES['data']))
+                if any(kind == 'strs' for _, kind in fields):
+                    self.assertEqual(data['nwname'], len(VALUES['strs']))
+
+    def test_iov_matches_flat_encoding(self) -> None:
+        self.assertEqual(
+            sorted(vars(ENCODE_IOV)),
+            ['Rread', 'Twrite'],
+        )
+        payload = bytearray(b'x' * 100)
+        for name, args in (
+                ('Rread', (payload,)),
+                ('Twrite', (5, 1 << 33, payload)),
+        ):
+            parts: list = getattr(ENCODE_IOV, name)(9, *args)
+            self.assertEqual(len(parts), 2)
+            self.assertIs(parts[1].obj, payload)
+            self.assertEqual(
+                b''.join(parts),
+                getattr(ENCODE, name)(9, *args),
+            )
+
+    def test_wire_format(self) -> None:
+        self.assertEqual(
+            ENCODE.Tversion(0xFFFF, 8192, '9P2000'),
+            struct.pack('<IBHIH6s', 19, TRs.Tversion, 0xFFFF, 8192, 6,
+                        b'9P2000'),
+        )
+        self.assertEqual(
+            ENCODE.Twalk(1, 2, 3, ['ab', 'c']),
+            struct.pack('<IBHIIHH2sH1s', 24, TRs.Twalk, 1, 2, 3, 2,
+                        2, b'ab', 1, b'c'),
+        )
+        self.assertEqual(
+            ENCODE.Rclunk(7),
+            struct.pack('<IBH', 7, TRs.Rclunk, 7),
+        )
+
+    def test_strings_accept_bytes(self) -> None:
+        self.assertEqual(
+            ENCODE.Rerror(1, b'no such file'),
+            ENCODE.Rerror(1, 'no such file'),
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+from columnar import decode_listing, numpy
+from qid import Qid
+from stat9 import Stat
+
+import unittest
+
+
+def sample(index: int) -> Stat:
+    return Stat(
+        0,
+        index % 3,
+        index,
+        Qid(0x80 if index % 2 else 0, index, 1 << 40 | index),
+        0o644,
+        1000 + index,
+        2000 + index,
+        index * 512,
+        f'entry{index}' * (index % 4 + 1),
+        'user',
+        'grüp',
+        '' if index % 5 else 'muid',
+    )
+
+
+STATS: list[Stat] = [sample(i) for i in range(20)]
+DATA: bytes = b''.join(stat.to_bytes() for stat in STATS)
+
+
+class ColumnarTests:
+    use_numpy: bool = False
+
+    def decode(self, data):
+        return decode_listing(data, self.use_numpy)
+
+    def test_columns(self) -> None:
+        listing = self.decode(DATA)
+        self.assertEqual(len(listing), len(STATS))
+        self.assertEqual(
+            [int(length) for length in listing['length']],
+            [stat.length for stat in STATS],
+        )
+        self.assertEqual(
+            [int(path) for path in listing['qid_path']],
+            [stat.qid.path for stat in STATS],
+        )
+        self.assertEqual(list(listing['name']), [s.name for s in STATS])
+        self.assertEqual(listing['gid'][3], 'grüp')
+        self.assertEqual(listing['gid'].raw(3), 'grüp'.encode())
+        self.assertEqual(listing['muid'][0], 'muid')
+        self.assertEqual(listing['muid'][1], '')
+
+    def test_stat(self) -> None:
+        listing = self.decode(bytearray(DATA))
+        for index, expected in enumerate(STATS):
+            self.assertEqual(
+                listing.stat(index).to_bytes(),
+                expected.to_bytes(),
+            )
+
+    def test_empty(self) -> None:
+        listing = self.decode(b'')
+        self.assertEqual(len(listing), 0)
+        self.assertEqual(list(listing['name']), [])
+
+    def test_truncated(self) -> None:
+        for end in (10, len(DATA) - 1, len(DATA) - 45):
+            with self.assertRaises(Exception):
+                self.decode(DATA[:end])
+
+
+class TestArrayListing(ColumnarTests, unittest.TestCase):
+    pass
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class TestNumpyListing(ColumnarTests, unittest.TestCase):
+    use_numpy: bool = True
+
+
+class TestDefault(unittest.TestCase):
+    @unittest.skipIf(numpy is not None, 'numpy is installed')
+    def test_numpy_required_when_asked_for(self) -> None:
+        with self.assertRaises(Exception):
+            decode_listing(DATA, use_numpy=True)
+
+    def test_default_backend(self) -> None:
+        listing = decode_listing(DATA)
+        self.assertEqual(len(listing), len(STATS))
+        if numpy is not None:
+            self.assertIsInstance(listing.columns, numpy.ndarray)
+        else:
+            self.assertIsInstance(listing.columns, dict)
+
+
+if __name__ == '__main__':
+    unittest.main()
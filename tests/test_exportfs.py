@@ -0,0 +1,243 @@
+from exportfs import Py9ExportServer
+from errors import Errors
+from py9client import Py9Client
+from qid import Qid
+from stat9 import Stat
+from trs import TRs
+from utils import DMDIR, NOCHANGE32, NOCHANGE64, OREAD, OWRITE
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+
+class SlowListing(Py9ExportServer):
+    def _listing(self, entry):
+        time.sleep(0.5)
+        return super()._listing(entry)
+
+
+def renamed(name: str, length: int = NOCHANGE64) -> Stat:
+    return Stat(
+        0,
+        0xFFFF,
+        NOCHANGE32,
+        Qid(0xFF, NOCHANGE32, NOCHANGE64),
+        NOCHANGE32,
+        NOCHANGE32,
+        NOCHANGE32,
+        length,
+        name,
+        '',
+        '',
+        '',
+    )
+
+
+class ExportTestCase(unittest.TestCase):
+    server_class: type = Py9ExportServer
+    options: dict = {}
+
+    def setUp(self) -> None:
+        self.root: str = tempfile.mkdtemp(prefix='py9-test-')
+        os.mkdir(os.path.join(self.root, 'dir'))
+        for i in range(300):
+            with open(os.path.join(self.root, 'dir', f'{i:03}'), 'wb') as f:
+                f.write(b'%d' % i)
+
+        self.server = self.server_class(
+            '127.0.0.1',
+            0,
+            self.root,
+            msize=8192,
+            threads=4,
+            **self.options,
+        )
+        self.running: bool = True
+        self.thread = threading.Thread(target=self._serve)
+        self.thread.start()
+        self.clients: list[Py9Client] = []
+
+    def tearDown(self) -> None:
+        for client in self.clients:
+            client.close()
+        self.running = False
+        self.thread.join()
+        self.server.stop_listening()
+        shutil.rmtree(self.root)
+
+    def _serve(self) -> None:
+        while self.running:
+            self.server.serve(0.05)
+
+    def connect(self) -> Py9Client:
+        client = Py9Client(
+            '127.0.0.1',
+            self.server.socket.getsockname()[1],
+            8192,
+        )
+        client.connect()
+        client._check(client.attach())
+        client.socket.settimeout(5)
+        self.clients.append(client)
+
+        return client
+
+    def listing(self, client: Py9Client, path: str) -> list[str]:
+        fid: int = client.walk_path(path)
+        try:
+            client._check(client.open(fid, OREAD))
+            return [entry.name for entry in client.iter_dir(fid)]
+        finally:
+            client.clunk(fid)
+            client.release_fid(fid)
+
+
+class TestOffload(ExportTestCase):
+    def test_disk_handlers_are_offloaded(self) -> None:
+        for operation in (
+                TRs.Twalk,
+                TRs.Topen,
+                TRs.Tread,
+                TRs.Twrite,
+                TRs.Tstat,
+                TRs.Twstat,
+        ):
+            self.assertIn(operation, self.server.blocking)
+
+    def test_files_and_directories(self) -> None:
+        client: Py9Client = self.connect()
+        payload: bytes = os.urandom(100_000)
+        client.write_file('dir/new', payload)
+        self.assertEqual(bytes(client.read_file('dir/new')), payload)
+        self.assertEqual(client.stat_path('dir/new').length, len(payload))
+        self.assertEqual(
+            sorted(self.listing(client, 'dir')),
+            sorted([f'{i:03}' for i in range(300)] + ['new']),
+        )
+
+    def test_concurrent_clients(self) -> None:
+        clients: list[Py9Client] = [self.connect() for _ in range(4)]
+        listings: list[list[str]] = []
+
+        def read(client: Py9Client) -> None:
+            for _ in range(3):
+                listings.append(sorted(self.listing(client, 'dir')))
+
+        threads: list[threading.Thread] = [
+            threading.Thread(target=read, args=(client,))
+            for client in clients
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        expected: list[str] = [f'{i:03}' for i in range(300)]
+        self.assertEqual(listings, [expected] * 12)
+
+
+class TestAccess(ExportTestCase):
+    def test_walks_stay_below_root(self) -> None:
+        client: Py9Client = self.connect()
+        os.symlink('/', os.path.join(self.root, 'escape'))
+        os.symlink('dir', os.path.join(self.root, 'inside'))
+
+        fid: int = client.get_fid()
+        data: dict = client._check(
+            client.walk(client.root_fid, fid, ['..', '..', 'dir']))
+        self.assertEqual(len(data['qids']), 3)
+        self.assertEqual(data['qids'][0].path, data['qids'][1].path)
+
+        data = client.walk(client.root_fid, client.get_fid(), ['escape'])
+        self.assertEqual(data['ename'].decode(), Errors.Eperm)
+        self.assertEqual(client.read_file('inside/007'), b'7')
+
+    def test_create_truncate_remove(self) -> None:
+        client: Py9Client = self.connect()
+        fid: int = client.walk_path('dir')
+        client._check(client.create(fid, 'sub', DMDIR | 0o755, OREAD))
+        self.assertTrue(os.path.isdir(os.path.join(self.root, 'dir', 'sub')))
+
+        fid = client.walk_path('dir/sub')
+        client._check(client.create(fid, 'file', 0o644, OWRITE))
+        client._check(client.write(fid, 0, b'contents'))
+        client._check(client.wstat(fid, renamed('', 4)))
+        self.assertEqual(client.read_file('dir/sub/file'), b'cont')
+
+        self.assertEqual(
+            client.remove(client.walk_path('dir/sub'))['operation'],
+            TRs.Rerror,
+        )
+        client._check(client.remove(client.walk_path('dir/sub/file')))
+        client._check(client.remove(client.walk_path('dir/sub')))
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'dir', 'sub')))
+
+        data: dict = client.remove(client.root_fid)
+        self.assertEqual(data['ename'].decode(), Errors.Enoremove)
+
+
+class TestReadonly(ExportTestCase):
+    options: dict = {'readonly': True}
+
+    def test_writes_are_refused(self) -> None:
+        client: Py9Client = self.connect()
+        self.assertEqual(client.read_file('dir/010'), b'10')
+
+        fid: int = client.walk_path('dir/010')
+        data: dict = client.open(fid, OWRITE)
+        self.assertEqual(data['ename'].decode(), Errors.Eperm)
+        data = client.wstat(fid, renamed('moved'))
+        self.assertEqual(data['ename'].decode(), Errors.Eperm)
+        data = client.create(client.walk_path('dir'), 'new', 0o644, OWRITE)
+        self.assertEqual(data['ename'].decode(), Errors.Eperm)
+        data = client.remove(fid)
+        self.assertEqual(data['ename'].decode(), Errors.Eperm)
+        self.assertTrue(os.path.exists(os.path.join(self.root, 'dir', '010')))
+
+
+class TestRename(ExportTestCase):
+    def test_rejects_dot_names(self) -> None:
+        client: Py9Client = self.connect()
+        fid: int = client.walk_path('dir/001')
+        for name in ('.', '..', 'a/b'):
+            data: dict = client.wstat(fid, renamed(name))
+            self.assertEqual(data['operation'], TRs.Rerror)
+            self.assertEqual(data['ename'].decode(), Errors.Eperm)
+        self.assertTrue(os.path.exists(os.path.join(self.root, 'dir', '001')))
+
+    def test_fids_of_other_clients_follow(self) -> None:
+        renamer: Py9Client = self.connect()
+        other: Py9Client = self.connect()
+        fid: int = other.walk_path('dir/002')
+
+        directory: int = renamer.walk_path('dir')
+        renamer._check(renamer.wstat(directory, renamed('moved')))
+        self.assertTrue(os.path.isdir(os.path.join(self.root, 'moved')))
+
+        other._check(other.open(fid, OREAD))
+        data: dict = other._check(other.read(fid, 0, 9))
+        self.assertEqual(bytes(data['data']), b'2')
+
+
+class TestSlowDisk(ExportTestCase):
+    server_class: type = SlowListing
+
+    def test_slow_listing_does_not_stall_others(self) -> None:
+        slow: Py9Client = self.connect()
+        other: Py9Client = self.connect()
+        fid: int = slow.walk_path('dir')
+        slow._check(slow.open(fid, OREAD))
+        listing = slow.read(fid, 0, 8000, wait=False)
+
+        start: float = time.perf_counter()
+        self.assertEqual(other.stat_path('dir/001').length, 1)
+        self.assertLess(time.perf_counter() - start, 0.4)
+        self.assertTrue(listing.result()['data'])
+
+
+if __name__ == '__main__':
+    unittest.main()
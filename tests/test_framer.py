@@ -0,0 +1,78 @@
+from codec import ENCODE, HEADER_LEN
+from framer import Framer
+
+import socket
+import struct
+import unittest
+
+
+class TestFramer(unittest.TestCase):
+    def setUp(self) -> None:
+        self.reader, self.writer = socket.socketpair()
+        self.reader.settimeout(5)
+
+    def tearDown(self) -> None:
+        self.reader.close()
+        self.writer.close()
+
+    def fill(self, framer: Framer, data: bytes) -> list[bytes]:
+        self.writer.sendall(data)
+        received: int = 0
+        while received < len(data):
+            received += framer.fill(self.reader)
+
+        return [bytes(frame) for frame in framer.frames()]
+
+    def test_many_frames_per_fill(self) -> None:
+        packets: list[bytes] = [ENCODE.Tclunk(tag, tag) for tag in range(50)]
+        framer = Framer()
+        self.assertEqual(self.fill(framer, b''.join(packets)), packets)
+        self.assertEqual(framer.pending(), 0)
+
+    def test_partial_frames(self) -> None:
+        first: bytes = ENCODE.Twrite(1, 2, 0, b'x' * 100)
+        second: bytes = ENCODE.Tclunk(2, 2)
+        data: bytes = first + second
+        framer = Framer()
+
+        # Not even the size field is complete yet.
+        self.assertEqual(self.fill(framer, data[:2]), [])
+        self.assertEqual(self.fill(framer, data[2:50]), [])
+        self.assertEqual(framer.pending(), 50)
+        self.assertEqual(
+            self.fill(framer, data[50:len(first) + 3]),
+            [first],
+        )
+        self.assertEqual(framer.pending(), 3)
+        self.assertEqual(self.fill(framer, data[len(first) + 3:]), [second])
+
+    def test_size_below_header(self) -> None:
+        framer = Framer()
+        with self.assertRaises(Exception):
+            self.fill(framer, struct.pack('<IBH', HEADER_LEN - 1, 120, 0))
+
+    def test_size_above_msize(self) -> None:
+        framer = Framer(msize=1024)
+        largest: bytes = ENCODE.Twrite(1, 2, 0, b'x' * (1024 - 23))
+        self.assertEqual(self.fill(framer, largest), [largest])
+        with self.assertRaises(Exception):
+            self.fill(framer, ENCODE.Twrite(1, 2, 0, b'x' * (1024 - 22)))
+
+    def test_frames_larger_than_chunk(self) -> None:
+        framer = Framer(msize=1 << 16, chunk=256)
+        small: bytes = ENCODE.Tclunk(1, 1)
+        large: bytes = ENCODE.Twrite(2, 2, 0, bytes(range(256)) * 64)
+
+        frames: list = []
+        self.writer.sendall(small + large + small)
+        while len(frames) < 3:
+            framer.fill(self.reader)
+            frames += list(framer.frames())
+
+        # Frames handed out before the buffer was renewed stay intact.
+        self.assertEqual([bytes(frame) for frame in frames],
+                         [small, large, small])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+from metrics import BUCKETS, Histogram, Metrics
+from py9client import Py9Client
+from py9server import blocking
+from ramfs import Py9RamServer
+from trs import TRs
+from utils import OREAD
+
+import threading
+import time
+import unittest
+
+
+class SlowRamServer(Py9RamServer):
+    @blocking
+    def handle_Tread(self, d: dict):
+        time.sleep(0.2)
+        return super().handle_Tread(d)
+
+
+class TestHistogram(unittest.TestCase):
+    def test_bounds_are_inclusive(self) -> None:
+        for index, bound in enumerate(BUCKETS):
+            histogram = Histogram()
+            histogram.observe(bound)
+            self.assertEqual(histogram.counts[index], 1, bound)
+
+    def test_value_above_bound_goes_to_next_bucket(self) -> None:
+        histogram = Histogram()
+        histogram.observe(BUCKETS[3] * 1.5)
+        self.assertEqual(histogram.counts[4], 1)
+        self.assertEqual(histogram.quantile(0.5), BUCKETS[4])
+
+    def test_out_of_range(self) -> None:
+        histogram = Histogram()
+        histogram.observe(0.0)
+        histogram.observe(BUCKETS[-1] * 4)
+        self.assertEqual(histogram.counts[0], 1)
+        self.assertEqual(histogram.counts[-1], 1)
+        self.assertEqual(histogram.quantile(1.0), float('inf'))
+
+
+class TestMetrics(unittest.TestCase):
+    def test_prometheus_buckets(self) -> None:
+        metrics = Metrics()
+        metrics.observe(TRs.Tread, BUCKETS[2])
+        text: str = metrics.to_prometheus()
+        self.assertIn(
+            f'py9_request_duration_seconds_bucket{{type="Tread",'
+            f'le="{BUCKETS[2]:g}"}} 1',
+            text,
+        )
+        self.assertIn(
+            f'py9_request_duration_seconds_bucket{{type="Tread",'
+            f'le="{BUCKETS[1]:g}"}} 0',
+            text,
+        )
+
+    def test_shared_between_threads(self) -> None:
+        metrics = Metrics()
+
+        def count() -> None:
+            for _ in range(20000):
+                metrics.count_in(TRs.Tread, 3)
+                metrics.count_out(TRs.Rread, 5)
+                metrics.observe(TRs.Tread, 1e-5)
+
+        threads: list[threading.Thread] = [
+            threading.Thread(target=count) for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(metrics.messages_in[TRs.Tread], 80000)
+        self.assertEqual(metrics.bytes_out, 400000)
+        self.assertEqual(metrics.latency[TRs.Tread].count, 80000)
+        self.assertEqual(metrics.in_flight, 0)
+
+
+class TestInFlight(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server_metrics = Metrics()
+        self.server = SlowRamServer(
+            '127.0.0.1',
+            0,
+            threads=2,
+            metrics=self.server_metrics,
+        )
+        self.server.add_file('file', b'hello')
+        self.running: bool = True
+        self.thread = threading.Thread(target=self._serve)
+        self.thread.start()
+
+        self.metrics = Metrics()
+        self.client = Py9Client(
+            '127.0.0.1',
+            self.server.socket.getsockname()[1],
+            metrics=self.metrics,
+        )
+        self.client.connect()
+        self.client.socket.settimeout(5)
+        self.client._check(self.client.attach())
+        self.fid: int = self.client.walk_path('file')
+        self.client._check(self.client.open(self.fid, OREAD))
+
+    def tearDown(self) -> None:
+        self.client.close()
+        self.running = False
+        self.thread.join()
+        self.server.stop_listening()
+
+    def _serve(self) -> None:
+        while self.running:
+            self.server.serve(0.05)
+
+    def test_flushed_request_is_not_in_flight(self) -> None:
+        read = self.client.read(self.fid, 0, 5, wait=False)
+        self.client._check(self.client.flush(read.tag))
+        self.assertEqual(read.result()['operation'], TRs.Rflush)
+        self.assertEqual(self.metrics.in_flight, 0)
+
+        time.sleep(0.3)
+        self.client._check(self.client.stat(self.fid))
+        self.assertEqual(self.server_metrics.in_flight, 0)
+
+    def test_flush_after_reply_is_not_counted_twice(self) -> None:
+        read = self.client.read(self.fid, 0, 5, wait=False)
+        self.assertEqual(bytes(read.result()['data']), b'hello')
+        self.client._check(self.client.flush(read.tag))
+        self.assertEqual(self.metrics.in_flight, 0)
+        self.assertEqual(self.server_metrics.in_flight, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
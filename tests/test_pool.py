@@ -0,0 +1,125 @@
+from cache import BlockCache
+from pool import Py9ClientPool
+from py9client import Py9Client
+from ramfs import Py9RamServer
+
+import socket
+import threading
+import time
+import unittest
+
+
+class TestPool(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server = Py9RamServer('127.0.0.1', 0)
+        self.server.add_file('file', b'hello')
+        self.running: bool = True
+        self.thread = threading.Thread(target=self._serve)
+        self.thread.start()
+        self.port: int = self.server.socket.getsockname()[1]
+        self.pools: list[Py9ClientPool] = []
+
+    def tearDown(self) -> None:
+        for pool in self.pools:
+            pool.close()
+        self.running = False
+        self.thread.join()
+        self.server.stop_listening()
+
+    def _serve(self) -> None:
+        while self.running:
+            self.server.serve(0.05)
+
+    def pool(self, **options) -> Py9ClientPool:
+        pool = Py9ClientPool(**options)
+        self.pools.append(pool)
+
+        return pool
+
+    def test_connections_are_reused(self) -> None:
+        pool: Py9ClientPool = self.pool()
+        with pool.lease('127.0.0.1', self.port) as client:
+            self.assertEqual(client.read_file('file'), b'hello')
+            self.assertEqual(
+                pool.stats(),
+                {'connections': 1, 'idle': 0, 'leased': 1},
+            )
+        with pool.lease('127.0.0.1', self.port) as again:
+            self.assertIs(again, client)
+        with pool.lease('127.0.0.1', self.port, aname='other') as other:
+            self.assertIsNot(other, client)
+        self.assertEqual(
+            pool.stats(),
+            {'connections': 2, 'idle': 2, 'leased': 0},
+        )
+
+    def test_waits_for_a_free_connection(self) -> None:
+        pool: Py9ClientPool = self.pool(max_size=2)
+        clients: list[Py9Client] = [
+            pool.acquire('127.0.0.1', self.port) for _ in range(2)
+        ]
+        with self.assertRaises(Exception):
+            pool.acquire('127.0.0.1', self.port, timeout=0.1)
+
+        threading.Timer(0.1, pool.release, (clients[0],)).start()
+        self.assertIs(
+            pool.acquire('127.0.0.1', self.port, timeout=5),
+            clients[0],
+        )
+        for client in clients:
+            pool.release(client)
+
+    def test_failed_lease_discards_connection(self) -> None:
+        pool: Py9ClientPool = self.pool()
+        with self.assertRaises(ValueError):
+            with pool.lease('127.0.0.1', self.port) as client:
+                raise ValueError()
+        self.assertFalse(client.is_connected)
+        self.assertEqual(pool.stats()['connections'], 0)
+
+    def test_dead_connection_is_replaced(self) -> None:
+        pool: Py9ClientPool = self.pool(check_after=0.0, check_timeout=1.0)
+        client: Py9Client = pool.acquire('127.0.0.1', self.port)
+        pool.release(client)
+        client.socket.shutdown(socket.SHUT_RDWR)
+
+        with pool.lease('127.0.0.1', self.port) as fresh:
+            self.assertIsNot(fresh, client)
+            self.assertEqual(fresh.read_file('file'), b'hello')
+        self.assertEqual(pool.stats()['connections'], 1)
+
+    def test_idle_connections_expire(self) -> None:
+        pool: Py9ClientPool = self.pool(idle_timeout=0.05)
+        client: Py9Client = pool.acquire('127.0.0.1', self.port)
+        pool.release(client)
+        time.sleep(0.1)
+
+        with pool.lease('127.0.0.1', self.port) as fresh:
+            self.assertIsNot(fresh, client)
+        self.assertFalse(client.is_connected)
+
+    def test_caches_are_per_connection(self) -> None:
+        template = BlockCache(block_size=4096)
+        pool: Py9ClientPool = self.pool(cache=template)
+        first: Py9Client = pool.acquire('127.0.0.1', self.port)
+        second: Py9Client = pool.acquire('127.0.0.1', self.port)
+        self.assertIsNot(first.cache, template)
+        self.assertIsNot(first.cache, second.cache)
+        self.assertEqual(first.cache.block_size, 4096)
+        pool.release(first)
+        pool.release(second)
+
+    def test_closed_pool(self) -> None:
+        pool: Py9ClientPool = self.pool()
+        client: Py9Client = pool.acquire('127.0.0.1', self.port)
+        pool.release(client)
+        pool.close()
+        self.assertFalse(client.is_connected)
+        with self.assertRaises(Exception):
+            pool.acquire('127.0.0.1', self.port)
+        with self.assertRaises(Exception):
+            pool.release(client)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+from prefork import PreforkServer
+from py9client import Py9Client
+from ramfs import Py9RamServer
+
+import os
+import signal
+import socket
+import threading
+import time
+import unittest
+
+
+class FileServer(Py9RamServer):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.add_file('pid', str(os.getpid()).encode())
+
+
+@unittest.skipUnless(hasattr(socket, 'SO_REUSEPORT'), 'needs SO_REUSEPORT')
+class TestPrefork(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server = PreforkServer(
+            FileServer,
+            '127.0.0.1',
+            0,
+            workers=2,
+            grace=1.0,
+            restart_delay=0.1,
+        )
+        self.server.start()
+        self.clients: list[Py9Client] = []
+
+    def tearDown(self) -> None:
+        for client in self.clients:
+            client.close()
+        self.server.stop()
+
+    def connect(self) -> Py9Client:
+        deadline: float = time.monotonic() + 5
+        while True:
+            client = Py9Client('127.0.0.1', self.server.port)
+            try:
+                client.connect()
+                break
+            except ConnectionRefusedError:
+                # The workers may not be listening yet.
+                client.socket.close()
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+        client.socket.settimeout(5)
+        client._check(client.attach())
+        self.clients.append(client)
+
+        return client
+
+    def test_workers_serve_clients(self) -> None:
+        self.assertEqual(len(self.server.pids), 2)
+        served: set[int] = set()
+        for _ in range(8):
+            served.add(int(self.connect().read_file('pid')))
+        self.assertLessEqual(served, set(self.server.pids))
+
+    def test_dead_worker_is_replaced(self) -> None:
+        self.connect()
+        original: set[int] = set(self.server.pids)
+        victim: int = next(iter(original))
+        os.kill(victim, signal.SIGKILL)
+        seen: list[set[int]] = []
+
+        def stop_after_restart() -> None:
+            deadline: float = time.monotonic() + 5
+            while time.monotonic() < deadline:
+                pids: set[int] = set(self.server.pids)
+                if len(pids) == 2 and victim not in pids:
+                    seen.append(pids)
+                    break
+                time.sleep(0.05)
+            for client in self.clients:
+                client.close()
+            self.server._on_signal(signal.SIGTERM, None)
+
+        thread = threading.Thread(target=stop_after_restart)
+        thread.start()
+        try:
+            self.server.supervise()
+        finally:
+            thread.join()
+
+        self.assertEqual(len(seen), 1)
+        self.assertEqual(len(seen[0] - original), 1)
+        self.assertTrue(self.server.stopping)
+
+
+if __name__ == '__main__':
+    unittest.main()
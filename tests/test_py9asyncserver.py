@@ -0,0 +1,64 @@
+from py9asyncclient import AsyncPy9Client
+from py9asyncserver import AsyncPy9Server
+from qid import Qid
+from trs import TRs
+
+import asyncio
+import unittest
+
+
+class FailingServer(AsyncPy9Server):
+    def handle_Tattach(self, d: dict):
+        client = self.clients[d['client_id']]
+        client.send(client._encode_Rattach(Qid(0x80, 0, 0), d['data']['tag']))
+
+    def handle_Tclunk(self, d: dict):
+        if d['data']['fid'] == 13:
+            raise ValueError('clunk failed')
+        client = self.clients[d['client_id']]
+        client.send(client._encode_Rclunk(d['data']['tag']))
+
+
+class TestHandlerError(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.unhandled: list[dict] = []
+        asyncio.get_running_loop().set_exception_handler(
+            lambda loop, context: self.unhandled.append(context))
+        self.server = FailingServer('127.0.0.1', 0)
+        await self.server.start()
+        self.port: int = self.server.server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self) -> None:
+        await self.server.close()
+
+    async def _check_other_client(self) -> None:
+        client = AsyncPy9Client('127.0.0.1', self.port)
+        await client.connect()
+        await client.attach()
+        data: dict = await client.clunk(11)
+        self.assertEqual(data['operation'], TRs.Rclunk)
+        await client.close()
+
+    async def test_failed_handler_only_drops_its_client(self) -> None:
+        failing = AsyncPy9Client('127.0.0.1', self.port)
+        await failing.connect()
+        await failing.attach()
+        with self.assertRaises(Exception):
+            await asyncio.wait_for(failing.clunk(13), 5)
+        await failing.close()
+
+        await self._check_other_client()
+        self.assertEqual(self.unhandled, [])
+
+    async def test_reply_from_peer_only_drops_that_peer(self) -> None:
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        writer.write(self.server._encode_Rclunk(1))
+        self.assertEqual(await asyncio.wait_for(reader.read(), 5), b'')
+        writer.close()
+
+        await self._check_other_client()
+        self.assertEqual(self.unhandled, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,309 @@
+from cache import BlockCache, StatCache, WalkCache
+from metrics import Metrics
+from py9client import Py9Client
+from qid import Qid
+from ramfs import Py9RamServer
+from stat9 import Stat
+from trs import TRs
+from utils import NOCHANGE32, NOCHANGE64, ORDWR, OREAD
+
+import io
+import os
+import threading
+import unittest
+
+
+def renamed(name: str) -> Stat:
+    return Stat(
+        0,
+        0xFFFF,
+        NOCHANGE32,
+        Qid(0xFF, NOCHANGE32, NOCHANGE64),
+        NOCHANGE32,
+        NOCHANGE32,
+        NOCHANGE32,
+        NOCHANGE64,
+        name,
+        '',
+        '',
+        '',
+    )
+
+
+class ShortRamServer(Py9RamServer):
+    # Like a pipe or a device, every read and write moves at most LIMIT
+    # bytes, whatever the client asked for.
+    LIMIT: int = 1000
+
+    def handle_Tread(self, d: dict):
+        d['data']['count'] = min(d['data']['count'], self.LIMIT)
+        return super().handle_Tread(d)
+
+    def handle_Twrite(self, d: dict):
+        data: dict = d['data']
+        data['count'] = min(data['count'], self.LIMIT)
+        data['data'] = data['data'][:data['count']]
+        return super().handle_Twrite(d)
+
+
+class FullRamServer(Py9RamServer):
+    def handle_Twrite(self, d: dict):
+        client = self.clients[d['client_id']]
+        client.send(client._encode_Rwrite(0, d['data']['tag']))
+
+
+class ClientTestCase(unittest.TestCase):
+    server_class: type = Py9RamServer
+
+    def setUp(self) -> None:
+        self.metrics = Metrics()
+        self.server = self.server_class(
+            '127.0.0.1',
+            0,
+            metrics=self.metrics,
+        )
+        for i in range(4):
+            self.server.add_file(f'a/b/c/f{i}', b'%d' % i)
+        self.running: bool = True
+        self.thread = threading.Thread(target=self._serve)
+        self.thread.start()
+        self.clients: list[Py9Client] = []
+
+    def tearDown(self) -> None:
+        for client in self.clients:
+            client.close()
+        self.running = False
+        self.thread.join()
+        self.server.stop_listening()
+
+    def _serve(self) -> None:
+        while self.running:
+            self.server.serve(0.05)
+
+    def connect(self, **kwargs) -> Py9Client:
+        client = Py9Client(
+            '127.0.0.1',
+            self.server.socket.getsockname()[1],
+            8192,
+            **kwargs,
+        )
+        client.connect()
+        client._check(client.attach())
+        client.socket.settimeout(5)
+        self.clients.append(client)
+
+        return client
+
+
+class TestWalkCache(ClientTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.cache = WalkCache()
+        self.client: Py9Client = self.connect(walk_cache=self.cache)
+        self.walks: list[tuple[int, list[str]]] = []
+        walk = self.client.walk
+
+        def counting(fid: int, newfid: int, names: list[str], **kwargs):
+            self.walks.append((fid, names))
+            return walk(fid, newfid, names, **kwargs)
+
+        self.client.walk = counting
+
+    def read(self, path: str) -> bytes:
+        fid: int = self.client.walk_path(path)
+        try:
+            self.client._check(self.client.open(fid, OREAD))
+            return bytes(self.client.read(fid, 0, 16)['data'])
+        finally:
+            self.client.clunk(fid)
+            self.client.release_fid(fid)
+
+    def test_sibling_walks_from_cached_parent(self) -> None:
+        self.assertEqual(self.read('a/b/c/f0'), b'0')
+        self.assertEqual(self.cache.stats()['misses'], 1)
+        self.assertEqual(len(self.cache.entries), 1)
+
+        self.walks.clear()
+        self.assertEqual(self.read('a/b/c/f1'), b'1')
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(len(self.walks), 1)
+        self.assertEqual(self.walks[0][1], ['f1'])
+
+    def test_error_from_cached_fid_evicts_it(self) -> None:
+        self.read('a/b/c/f0')
+        _, cached, _ = self.cache.lookup(('a', 'b', 'c'))
+        # The server forgets the cached fid behind the client's back.
+        self.client.clunk(cached)
+
+        with self.assertRaises(Exception):
+            self.read('a/b/c/f1')
+        self.assertEqual(self.cache.entries, {})
+
+        self.assertEqual(self.read('a/b/c/f1'), b'1')
+        self.assertEqual(len(self.cache.entries), 1)
+
+    def test_rename_of_ancestor_drops_cached_descendants(self) -> None:
+        self.read('a/b/c/f0')
+        fid: int = self.client.walk_path('a/b')
+        self.client._check(self.client.wstat(fid, renamed('x')))
+        self.client.clunk(fid)
+        self.client.release_fid(fid)
+
+        self.assertNotIn(('a', 'b', 'c'), self.cache.entries)
+        with self.assertRaises(Exception):
+            self.read('a/b/c/f1')
+        self.assertEqual(self.read('a/x/c/f1'), b'1')
+
+    def test_entries_keep_qids_of_their_path(self) -> None:
+        self.read('a/b/c/f0')
+        qids: tuple[Qid, ...] = self.cache.entries[('a', 'b', 'c')][0]
+        self.assertEqual(len(qids), 3)
+        self.assertEqual(
+            qids[-1].path,
+            self.client.stat_path('a/b/c').qid.path,
+        )
+
+
+class TestBlockCache(ClientTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.data: bytes = bytes(range(256)) * 64
+        self.server.add_file('file', self.data)
+        self.cache = BlockCache(block_size=4096)
+        self.client: Py9Client = self.connect(cache=self.cache)
+        self.fid: int = self.client.walk_path('file')
+        self.client._check(self.client.open(self.fid, ORDWR))
+
+    def reads(self) -> int:
+        return self.metrics.messages_in[TRs.Tread]
+
+    def test_repeated_reads_are_served_from_cache(self) -> None:
+        first: dict = self.client.read(self.fid, 1000, 5000)
+        self.assertEqual(bytes(first['data']), self.data[1000:6000])
+        self.assertEqual(self.reads(), 2)
+
+        again: dict = self.client.read(self.fid, 4000, 4000)
+        self.assertEqual(bytes(again['data']), self.data[4000:8000])
+        self.assertEqual(self.reads(), 2)
+        self.assertEqual(self.cache.stats()['hits'], 2)
+
+    def test_read_past_eof(self) -> None:
+        data: dict = self.client.read(self.fid, len(self.data) - 10, 4096)
+        self.assertEqual(bytes(data['data']), self.data[-10:])
+        self.assertEqual(
+            self.client.read(self.fid, len(self.data) + 10, 10)['count'],
+            0,
+        )
+
+    def test_write_invalidates(self) -> None:
+        self.client.read(self.fid, 0, 100)
+        self.client._check(self.client.write(self.fid, 10, b'new'))
+        data: dict = self.client.read(self.fid, 0, 100)
+        self.assertEqual(bytes(data['data'][10:13]), b'new')
+        self.assertEqual(self.reads(), 2)
+
+
+class TestStatCache(ClientTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.cache = StatCache()
+        self.client: Py9Client = self.connect(stat_cache=self.cache)
+
+    def stats(self) -> int:
+        return self.metrics.messages_in[TRs.Tstat]
+
+    def test_directory_read_feeds_stat_path(self) -> None:
+        fid: int = self.client.walk_path('a/b/c')
+        self.client._check(self.client.open(fid, OREAD))
+        names: list[str] = [
+            stat.name for stat in self.client.read_dir(fid, 0, 8192)
+        ]
+        self.assertEqual(sorted(names), [f'f{i}' for i in range(4)])
+
+        walks: int = self.metrics.messages_in[TRs.Twalk]
+        for i in range(4):
+            stat: Stat = self.client.stat_path(f'a/b/c/f{i}')
+            self.assertEqual(stat.length, 1)
+        self.assertEqual(self.metrics.messages_in[TRs.Twalk], walks)
+        self.assertEqual(self.stats(), 0)
+
+    def test_stat_fills_cache(self) -> None:
+        self.client.stat_path('a/b/c/f0')
+        self.client.stat_path('a/b/c/f0')
+        self.assertEqual(self.stats(), 1)
+
+    def test_write_invalidates(self) -> None:
+        self.client.stat_path('a/b/c/f0')
+        self.client.write_file('a/b/c/f0', b'longer')
+        self.assertEqual(self.client.stat_path('a/b/c/f0').length, 6)
+
+
+class TestShortCounts(ClientTestCase):
+    server_class: type = ShortRamServer
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.data: bytes = os.urandom(50000)
+        self.server.add_file('file', self.data)
+        self.server.add_file('empty')
+        self.client: Py9Client = self.connect()
+
+    def open(self, path: str) -> int:
+        fid: int = self.client.walk_path(path)
+        self.client._check(self.client.open(fid, OREAD))
+
+        return fid
+
+    def test_read_range_rerequests_the_rest(self) -> None:
+        fid: int = self.open('file')
+        data: memoryview = self.client.read_range(fid, 100, 30000, window=4)
+        self.assertEqual(bytes(data), self.data[100:30100])
+
+    def test_read_range_stops_at_eof(self) -> None:
+        fid: int = self.open('file')
+        into = bytearray(80000)
+        data: memoryview = self.client.read_range(fid, 0, len(into), into)
+        self.assertEqual(len(data), len(self.data))
+        self.assertIs(data.obj, into)
+        self.assertEqual(into[:len(self.data)], self.data)
+
+        self.assertEqual(len(self.client.read_range(fid, 60000, 10)), 0)
+
+    def test_read_stream(self) -> None:
+        fid: int = self.open('file')
+        out = io.BytesIO()
+        self.assertEqual(
+            self.client.read_stream(fid, out, 10, window=3),
+            len(self.data),
+        )
+        self.assertEqual(out.getvalue(), self.data[10:])
+
+    def test_read_file(self) -> None:
+        self.assertEqual(self.client.read_file('file'), self.data)
+        self.assertEqual(self.client.read_file('empty'), b'')
+
+    def test_write_stream_resends_the_rest(self) -> None:
+        progress: list[int] = []
+        written: int = self.client.write_file(
+            'new',
+            [self.data[:12345], self.data[12345:]],
+            window=4,
+            progress=progress.append,
+        )
+        self.assertEqual(written, len(self.data))
+        self.assertEqual(progress, sorted(progress))
+        self.assertEqual(progress[-1], len(self.data))
+        self.assertEqual(self.client.read_file('new'), self.data)
+
+
+class TestFullDevice(ClientTestCase):
+    server_class: type = FullRamServer
+
+    def test_zero_count_write_raises(self) -> None:
+        client: Py9Client = self.connect()
+        with self.assertRaises(Exception):
+            client.write_file('new', b'data')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,284 @@
+from codec import ENCODE
+from framer import Framer
+from py9client import Py9Client
+from py9server import Py9Server, blocking
+from qid import Qid
+from ramfs import Py9RamServer
+from trs import TRs
+from utils import NOFID, NOTAG, OREAD
+
+import socket
+import threading
+import time
+import unittest
+
+
+class SlowRamServer(Py9RamServer):
+    @blocking
+    def handle_Tread(self, d: dict):
+        time.sleep(0.2)
+        return super().handle_Tread(d)
+
+
+class FailingServer(Py9Server):
+    def handle_Tattach(self, d: dict):
+        client = self.clients[d['client_id']]
+        client.send(client._encode_Rattach(Qid(0x80, 0, 0), d['data']['tag']))
+
+    @blocking
+    def handle_Tclunk(self, d: dict):
+        if d['data']['fid'] == 13:
+            raise ValueError('clunk failed')
+        client = self.clients[d['client_id']]
+        client.send(client._encode_Rclunk(d['data']['tag']))
+
+
+class TestFlush(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server = SlowRamServer('127.0.0.1', 0, threads=2)
+        self.server.add_file('file', b'hello')
+        self.running: bool = True
+        self.thread = threading.Thread(target=self._serve)
+        self.thread.start()
+
+        port: int = self.server.socket.getsockname()[1]
+        self.client = Py9Client('127.0.0.1', port)
+        self.client.connect()
+        self.client._check(self.client.attach())
+        self.fid: int = self.client.walk_path('file')
+        self.client._check(self.client.open(self.fid, OREAD))
+
+    def tearDown(self) -> None:
+        self.client.close()
+        self.running = False
+        self.thread.join()
+        self.server.stop_listening()
+
+    def _serve(self) -> None:
+        while self.running:
+            self.server.serve(0.05)
+
+    def test_running_request_has_no_reply_after_rflush(self) -> None:
+        read = self.client.read(self.fid, 0, 5, wait=False)
+        self.client._check(self.client.flush(read.tag))
+        self.assertEqual(read.result()['operation'], TRs.Rflush)
+
+        # The read is still running on the pool. Its reply would arrive
+        # after the Rflush, with a tag the client no longer knows.
+        time.sleep(0.3)
+        for _ in range(2):
+            stat: dict = self.client._check(self.client.stat(self.fid))
+            self.assertEqual(stat['stat'].name, 'file')
+
+    def test_waiting_request_is_not_handled_after_rflush(self) -> None:
+        read = self.client.read(self.fid, 0, 5, wait=False)
+        clunk = self.client.clunk(self.fid, wait=False)
+        self.client._check(self.client.flush(clunk.tag))
+        self.assertEqual(clunk.result()['operation'], TRs.Rflush)
+        self.assertEqual(bytes(read.result()['data']), b'hello')
+
+        time.sleep(0.1)
+        stat: dict = self.client._check(self.client.stat(self.fid))
+        self.assertEqual(stat['stat'].name, 'file')
+
+
+class TestOffloadError(unittest.TestCase):
+    def test_error_only_drops_its_client(self) -> None:
+        server = FailingServer('127.0.0.1', 0, threads=2)
+        errors: list[Exception] = []
+        running: bool = True
+
+        def serve() -> None:
+            while running:
+                # All requests finish on the pool before the loop runs, so
+                # they are completed together.
+                time.sleep(0.2)
+                try:
+                    server.serve(0.05)
+                except Exception as e:
+                    errors.append(e)
+
+        thread = threading.Thread(target=serve)
+        thread.start()
+        port: int = server.socket.getsockname()[1]
+        failing = Py9Client('127.0.0.1', port)
+        client = Py9Client('127.0.0.1', port)
+        try:
+            for each in (failing, client):
+                each.connect()
+                each._check(each.attach())
+                each.socket.settimeout(5)
+            failing.clunk(13, wait=False)
+            requests: list = [
+                client.clunk(fid, wait=False) for fid in (11, 12, 14)
+            ]
+            for request in requests:
+                self.assertEqual(request.result()['operation'], TRs.Rclunk)
+            with self.assertRaises(Exception):
+                failing.stat(failing.root_fid)
+            self.assertEqual(errors, [])
+        finally:
+            failing.close()
+            client.close()
+            running = False
+            thread.join()
+            server.stop_listening()
+
+
+class TestUnknownMessage(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server = FailingServer('127.0.0.1', 0)
+        self.errors: list[Exception] = []
+        self.running: bool = True
+        self.thread = threading.Thread(target=self._serve)
+        self.thread.start()
+        self.port: int = self.server.socket.getsockname()[1]
+
+    def tearDown(self) -> None:
+        self.running = False
+        self.thread.join()
+        self.server.stop_listening()
+
+    def _serve(self) -> None:
+        while self.running:
+            try:
+                self.server.serve(0.05)
+            except Exception as e:
+                self.errors.append(e)
+
+    def test_reply_from_peer_only_drops_that_peer(self) -> None:
+        confused = Py9Client('127.0.0.1', self.port)
+        client = Py9Client('127.0.0.1', self.port)
+        try:
+            for each in (confused, client):
+                each.connect()
+                each._check(each.attach())
+                each.socket.settimeout(5)
+            confused.socket.sendall(confused._encode_Rclunk(1))
+            self.assertEqual(confused.socket.recv(1), b'')
+
+            data: dict = client._check(client.clunk(11))
+            self.assertEqual(data['operation'], TRs.Rclunk)
+            self.assertEqual(self.errors, [])
+        finally:
+            confused.close()
+            client.close()
+
+
+class TestBackpressure(unittest.TestCase):
+    # The test thread runs the server loop itself, so it decides exactly
+    # when replies are read.
+    READS: int = 400
+
+    def setUp(self) -> None:
+        self.server = Py9RamServer(
+            '127.0.0.1',
+            0,
+            high_water=1 << 16,
+            send_timeout=0.3,
+        )
+        self.server.add_file('file', bytes(range(256)) * 4096)
+        self.sockets: list[socket.socket] = []
+
+    def tearDown(self) -> None:
+        for sock in self.sockets:
+            sock.close()
+        self.server.stop_listening()
+
+    def connect(self) -> tuple[socket.socket, Py9Server.Client]:
+        sock = socket.socket()
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        sock.connect(self.server.socket.getsockname())
+        sock.setblocking(False)
+        self.sockets.append(sock)
+
+        known: set = set(self.server.clients.values())
+        while len(self.server.clients) == len(known):
+            self.server.serve(0.01)
+        client: Py9Server.Client = (
+            set(self.server.clients.values()) - known).pop()
+        client.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+
+        return sock, client
+
+    def flood(self, sock: socket.socket) -> None:
+        packets: list[bytes] = [
+            ENCODE.Tversion(NOTAG, 8192, '9P2000'),
+            ENCODE.Tattach(0, 0, NOFID, 'user', ''),
+            ENCODE.Twalk(1, 0, 1, ['file']),
+            ENCODE.Topen(2, 1, OREAD),
+        ]
+        for i in range(self.READS):
+            packets.append(ENCODE.Tread(3 + i, 1, i * 4096 % (1 << 20), 4096))
+        sock.setblocking(True)
+        sock.sendall(b''.join(packets))
+        sock.setblocking(False)
+
+    def serve(self, rounds: int) -> None:
+        for _ in range(rounds):
+            self.server.serve(0.01)
+
+    def test_pause_and_resume(self) -> None:
+        sock, client = self.connect()
+        self.flood(sock)
+        self.serve(20)
+
+        # Replies stop being produced once high_water is queued, and the
+        # remaining requests wait in the Framer.
+        self.assertTrue(client.paused)
+        self.assertGreater(client.framer.pending(), 0)
+        self.assertLessEqual(client.queued, self.server.high_water + 4200)
+
+        # Another client is still served meanwhile.
+        other, _ = self.connect()
+        other.send(ENCODE.Tversion(NOTAG, 8192, '9P2000'))
+        framer = Framer(8192)
+        replies: list[bytes] = []
+        deadline: float = time.monotonic() + 5
+        while not replies and time.monotonic() < deadline:
+            self.server.serve(0.01)
+            try:
+                framer.fill(other)
+            except BlockingIOError:
+                continue
+            replies += [bytes(frame) for frame in framer.frames()]
+        self.assertEqual(replies[0][4], TRs.Rversion)
+
+        framer = Framer(8192)
+        replies = []
+        deadline = time.monotonic() + 10
+        while (len(replies) < self.READS + 4 and
+               time.monotonic() < deadline):
+            self.server.serve(0.01)
+            try:
+                framer.fill(sock)
+            except BlockingIOError:
+                continue
+            replies += [bytes(frame) for frame in framer.frames()]
+
+        self.assertEqual(len(replies), self.READS + 4)
+        self.assertEqual(
+            [reply[4] for reply in replies[:4]],
+            [TRs.Rversion, TRs.Rattach, TRs.Rwalk, TRs.Ropen],
+        )
+        for i, reply in enumerate(replies[4:]):
+            self.assertEqual(reply[4], TRs.Rread)
+            self.assertEqual(int.from_bytes(reply[5:7], 'little'), 3 + i)
+            self.assertEqual(len(reply), 11 + 4096)
+        self.assertFalse(client.paused)
+        self.assertEqual(client.queued, 0)
+
+    def test_stalled_client_is_dropped(self) -> None:
+        sock, client = self.connect()
+        self.flood(sock)
+        started: float = time.monotonic()
+        while (client.socket.fileno() != -1 and
+               time.monotonic() - started < 5):
+            self.server.serve(0.05)
+
+        self.assertNotIn(client, self.server.clients.values())
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+
+
+if __name__ == '__main__':
+    unittest.main()
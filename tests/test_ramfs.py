@@ -0,0 +1,219 @@
+from py9client import Py9Client
+from qid import Qid
+from ramfs import InodeTable, Py9RamServer
+from stat9 import Stat
+from trs import TRs
+from utils import DMDIR, NOCHANGE32, NOCHANGE64, OREAD, ORDWR, QTDIR
+
+import threading
+import unittest
+
+
+def change(name: str = '', length: int = NOCHANGE64) -> Stat:
+    return Stat(
+        0,
+        0xFFFF,
+        NOCHANGE32,
+        Qid(0xFF, NOCHANGE32, NOCHANGE64),
+        NOCHANGE32,
+        NOCHANGE32,
+        NOCHANGE32,
+        length,
+        name,
+        '',
+        '',
+        '',
+    )
+
+
+class TestInodeTable(unittest.TestCase):
+    def test_released_inodes_are_reused_with_new_generation(self) -> None:
+        inodes = InodeTable()
+        root: int = inodes.alloc(0, '/', DMDIR | 0o755, {})
+        ino: int = inodes.alloc(root, 'a', 0o644, bytearray(b'abc'))
+        self.assertEqual(len(inodes), 2)
+        self.assertEqual(inodes.length(ino), 3)
+        self.assertFalse(inodes.is_dir(ino))
+        self.assertEqual(inodes.qid(root)._type, QTDIR)
+
+        inodes.release(ino)
+        self.assertEqual(len(inodes), 1)
+        again: int = inodes.alloc(root, 'b', 0o644, bytearray())
+        self.assertEqual(again, ino)
+        self.assertEqual(inodes.generations[again], 1)
+        self.assertEqual(inodes.versions[again], 0)
+
+    def test_generated_contents(self) -> None:
+        inodes = InodeTable()
+        ino: int = inodes.alloc(0, 'g', 0o444, None)
+        inodes.generators[ino] = (10, lambda offset, count: b'x' * count)
+        self.assertEqual(inodes.length(ino), 10)
+        self.assertEqual(inodes.read(ino, 8, 5), b'xx')
+        self.assertEqual(inodes.read(ino, 10, 5), b'')
+
+        inodes.truncate(ino, 4)
+        self.assertEqual(inodes.contents[ino], bytearray(b'xxxx'))
+        self.assertNotIn(ino, inodes.generators)
+
+
+class TestRamServer(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server = Py9RamServer('127.0.0.1', 0, msize=4096)
+        self.server.add_file('dir/file', b'hello')
+        self.server.add_generated(
+            'dir/generated',
+            100000,
+            lambda offset, count: bytes(
+                (offset + i) % 251 for i in range(count)),
+        )
+        self.server.mkdir('empty')
+        self.running: bool = True
+        self.thread = threading.Thread(target=self._serve)
+        self.thread.start()
+
+        self.client = Py9Client(
+            '127.0.0.1',
+            self.server.socket.getsockname()[1],
+            4096,
+        )
+        self.client.connect()
+        self.client.socket.settimeout(5)
+        self.client._check(self.client.attach())
+
+    def tearDown(self) -> None:
+        self.client.close()
+        self.running = False
+        self.thread.join()
+        self.server.stop_listening()
+
+    def _serve(self) -> None:
+        while self.running:
+            self.server.serve(0.05)
+
+    def walk(self, path: str, mode: int | None = OREAD) -> int:
+        fid: int = self.client.walk_path(path)
+        if mode is not None:
+            self.client._check(self.client.open(fid, mode))
+
+        return fid
+
+    def names(self, path: str) -> list[str]:
+        fid: int = self.walk(path)
+        return sorted(entry.name for entry in self.client.iter_dir(fid))
+
+    def test_tree(self) -> None:
+        self.assertEqual(self.names(''), ['dir', 'empty'])
+        self.assertEqual(self.names('dir'), ['file', 'generated'])
+        self.assertEqual(self.names('empty'), [])
+        self.assertEqual(self.client.stat_path('dir/file').length, 5)
+        self.assertTrue(self.client.stat_path('dir').mode & DMDIR)
+        with self.assertRaises(Exception):
+            self.server.add_file('dir/file')
+
+    def test_walk(self) -> None:
+        fid: int = self.client.get_fid()
+        data: dict = self.client.walk(self.client.root_fid, fid,
+                                      ['dir', '..', 'dir', 'file'])
+        self.assertEqual(len(data['qids']), 4)
+        self.assertEqual(data['qids'][1].path, 0)
+
+        # A walk that fails after the first name returns the qids so far
+        # and leaves the new fid unused.
+        other: int = self.client.get_fid()
+        data = self.client.walk(self.client.root_fid, other,
+                                ['dir', 'missing'])
+        self.assertEqual(len(data['qids']), 1)
+        self.assertEqual(
+            self.client.stat(other)['operation'],
+            TRs.Rerror,
+        )
+        data = self.client.walk(fid, other, ['below'])
+        self.assertEqual(data['operation'], TRs.Rerror)
+
+    def test_generated_file(self) -> None:
+        expected: bytes = bytes(i % 251 for i in range(100000))
+        self.assertEqual(self.client.read_file('dir/generated'), expected)
+
+        fid: int = self.walk('dir/generated', ORDWR)
+        self.client._check(self.client.write(fid, 10, b'new'))
+        data: bytes = bytes(self.client.read(fid, 0, 20)['data'])
+        self.assertEqual(data, expected[:10] + b'new' + expected[13:20])
+
+    def test_create_write_remove(self) -> None:
+        self.client.write_file('empty/new', b'data' * 3000)
+        self.assertEqual(self.client.read_file('empty/new'), b'data' * 3000)
+
+        fid: int = self.walk('empty', None)
+        self.client._check(
+            self.client.create(fid, 'sub', DMDIR | 0o755, OREAD))
+        self.assertEqual(self.names('empty'), ['new', 'sub'])
+
+        fid = self.walk('empty', None)
+        self.assertEqual(
+            self.client.remove(fid)['operation'],
+            TRs.Rerror,
+        )
+        for path in ('empty/new', 'empty/sub', 'empty'):
+            self.client._check(self.client.remove(self.walk(path, None)))
+        self.assertEqual(self.names(''), ['dir'])
+        self.assertEqual(self.client.remove(self.client.root_fid)[
+            'operation'], TRs.Rerror)
+
+    def test_fid_of_removed_file_is_stale(self) -> None:
+        stale: int = self.walk('dir/file', None)
+        self.client._check(self.client.remove(self.walk('dir/file', None)))
+        self.server.add_file('dir/other', b'reused')
+
+        # The inode is reused, but the old fid must not reach it.
+        self.assertEqual(
+            self.client.stat(stale)['operation'],
+            TRs.Rerror,
+        )
+        self.assertEqual(self.client.read_file('dir/other'), b'reused')
+
+    def test_wstat(self) -> None:
+        fid: int = self.walk('dir/file', None)
+        self.client._check(self.client.wstat(fid, change(length=2)))
+        self.client._check(self.client.wstat(fid, change('renamed')))
+        self.assertEqual(self.names('dir'), ['generated', 'renamed'])
+        self.assertEqual(self.client.read_file('dir/renamed'), b'he')
+
+        self.assertEqual(
+            self.client.wstat(fid, change('generated'))['operation'],
+            TRs.Rerror,
+        )
+        self.assertEqual(
+            self.client.wstat(self.client.root_fid, change('root'))[
+                'operation'],
+            TRs.Rerror,
+        )
+
+    def test_directory_read_spans_replies(self) -> None:
+        for i in range(300):
+            self.server.add_file(f'many/{i:03}', b'%d' % i)
+        self.assertEqual(self.names('many'), [f'{i:03}' for i in range(300)])
+
+        # Reading on from the end of the previous reply, a removed entry
+        # is skipped rather than repeated or breaking the listing.
+        fid: int = self.walk('many')
+        entries = self.client.iter_dir(fid, readahead=False)
+        first = next(entries)
+        self.client._check(
+            self.client.remove(self.walk('many/299', None)))
+        rest: list[str] = [entry.name for entry in entries]
+        self.assertEqual(len(rest) + 1, 299)
+        self.assertNotIn(first.name, rest)
+
+    def test_disconnect_forgets_fids(self) -> None:
+        self.walk('dir/file')
+        self.assertEqual(len(self.server.fids), 1)
+        self.client.close()
+        for _ in range(40):
+            if not self.server.fids:
+                break
+            self.thread.join(0.05)
+        self.assertEqual(self.server.fids, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
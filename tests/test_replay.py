@@ -0,0 +1,155 @@
+from capture import Capture, RECEIVED, SENT, read_capture
+from py9client import Py9Client
+from py9server import blocking
+from ramfs import Py9RamServer
+from replay import Replay
+from trs import TRs
+from utils import OREAD
+
+import io
+import threading
+import time
+import unittest
+
+
+class SlowRamServer(Py9RamServer):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.stats: list[float] = []
+
+    @blocking
+    def handle_Tread(self, d: dict):
+        time.sleep(0.5)
+        return super().handle_Tread(d)
+
+    def handle_Tstat(self, d: dict):
+        self.stats.append(time.monotonic())
+        return super().handle_Tstat(d)
+
+
+class ReplayTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.servers: list[Py9RamServer] = []
+        self.running: bool = True
+        self.threads: list[threading.Thread] = []
+        self.clients: list[Py9Client] = []
+
+    def tearDown(self) -> None:
+        for client in self.clients:
+            client.close()
+        self.running = False
+        for thread in self.threads:
+            thread.join()
+        for server in self.servers:
+            server.stop_listening()
+
+    def start(self, server: Py9RamServer) -> int:
+        server.add_file('file', b'hello')
+
+        def serve() -> None:
+            while self.running:
+                server.serve(0.05)
+
+        thread = threading.Thread(target=serve)
+        thread.start()
+        self.servers.append(server)
+        self.threads.append(thread)
+
+        return server.socket.getsockname()[1]
+
+    def connect(self, port: int, capture: Capture) -> Py9Client:
+        client = Py9Client('127.0.0.1', port, capture=capture)
+        client.connect()
+        client.socket.settimeout(5)
+        client._check(client.attach())
+        self.clients.append(client)
+
+        return client
+
+
+class TestCapture(ReplayTestCase):
+    def test_records_both_directions(self) -> None:
+        port: int = self.start(Py9RamServer('127.0.0.1', 0))
+        target = io.BytesIO()
+        capture = Capture(target)
+        client: Py9Client = self.connect(port, capture)
+        self.assertEqual(client.read_file('file'), b'hello')
+        capture.close()
+        target.seek(0)
+
+        records: list = list(read_capture(target))
+        sent: list = [frame for _, _, way, frame in records if way == SENT]
+        received: list = [
+            frame for _, _, way, frame in records if way == RECEIVED
+        ]
+        self.assertEqual(len(sent), len(received))
+        self.assertEqual(sent[0][4], TRs.Tversion)
+        self.assertEqual(received[0][4], TRs.Rversion)
+        self.assertTrue(all(frame[4] % 2 == 0 for frame in sent))
+        connections: set[int] = {record[1] for record in records}
+        self.assertEqual(len(connections), 1)
+
+    def test_rejects_other_files(self) -> None:
+        with self.assertRaises(Exception):
+            list(read_capture(io.BytesIO(b'not a capture')))
+
+
+class TestReplay(ReplayTestCase):
+    def record(self, port: int, sessions: list) -> io.BytesIO:
+        target = io.BytesIO()
+        capture = Capture(target)
+        for session in sessions:
+            session(self.connect(port, capture))
+        capture.close()
+        target.seek(0)
+
+        return target
+
+    def test_replays_every_request(self) -> None:
+        port: int = self.start(Py9RamServer('127.0.0.1', 0))
+
+        def session(client: Py9Client) -> None:
+            client.read_file('file')
+            with self.assertRaises(Exception):
+                client.stat_path('missing')
+
+        source: io.BytesIO = self.record(port, [session, session])
+        report: dict = Replay(source, '127.0.0.1', port, speed=0).run()
+        self.assertEqual(report['lost'], 0)
+        self.assertEqual(report['sent'], report['received'])
+        self.assertEqual(report['errors'], {'Twalk': 2})
+
+    def test_blocked_connection_does_not_hold_back_others(self) -> None:
+        port: int = self.start(Py9RamServer('127.0.0.1', 0))
+
+        def reads(client: Py9Client) -> None:
+            fid: int = client.walk_path('file')
+            client._check(client.open(fid, OREAD))
+            for _ in range(2):
+                client._check(client.read(fid, 0, 5))
+
+        def stats(client: Py9Client) -> None:
+            for _ in range(5):
+                client._check(client.stat(client.root_fid))
+
+        source: io.BytesIO = self.record(port, [reads, stats])
+        server = SlowRamServer('127.0.0.1', 0, threads=2)
+        slow: int = self.start(server)
+
+        started: float = time.monotonic()
+        report: dict = Replay(
+            source,
+            '127.0.0.1',
+            slow,
+            speed=0,
+            window=1,
+        ).run()
+        self.assertEqual(report['lost'], 0)
+        self.assertEqual(len(server.stats), 5)
+        # The stats go out while the first connection waits on its reads,
+        # rather than after them.
+        self.assertLess(max(server.stats) - started, 0.4)
+
+
+if __name__ == '__main__':
+    unittest.main()
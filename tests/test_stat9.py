@@ -0,0 +1,92 @@
+from qid import Qid
+from stat9 import DirEntry, Stat
+
+import struct
+import unittest
+
+
+def sample(index: int) -> Stat:
+    return Stat(
+        0,
+        1,
+        2,
+        Qid(0x80 if index % 2 else 0, index, 1 << 40 | index),
+        0o644,
+        1000 + index,
+        2000 + index,
+        index * 512,
+        f'entry{index}',
+        'user',
+        'group',
+        'user' if index % 3 else 'other',
+    )
+
+
+class TestStat(unittest.TestCase):
+    def assertSame(self, decoded, expected: Stat) -> None:
+        for name in (
+                '_type',
+                'dev',
+                'mode',
+                'atime',
+                'mtime',
+                'length',
+                'name',
+                'uid',
+                'gid',
+                'muid',
+        ):
+            self.assertEqual(getattr(decoded, name), getattr(expected, name))
+        self.assertEqual(dict(decoded.qid), dict(expected.qid))
+
+    def test_round_trip(self) -> None:
+        stat: Stat = sample(7)
+        data: bytes = stat.to_bytes()
+        decoded: Stat = Stat.from_bytes(data)
+        self.assertSame(decoded, stat)
+        self.assertEqual(decoded.size, len(data) - 2)
+        self.assertEqual(decoded.to_bytes(), data)
+
+    def test_decode_many(self) -> None:
+        stats: list[Stat] = [sample(i) for i in range(50)]
+        data: bytes = b''.join(stat.to_bytes() for stat in stats)
+        decoded: list[Stat] = Stat.decode_many(data)
+        self.assertEqual(len(decoded), 50)
+        for one, expected in zip(decoded, stats):
+            self.assertSame(one, expected)
+        self.assertEqual(len(Stat.decode_many(memoryview(data), 3)), 3)
+
+    def test_truncated_data_raises_decode_errors(self) -> None:
+        data: bytes = sample(1).to_bytes()
+        for broken in (b'', data[:10], data[:45], data[:-1]):
+            with self.assertRaises((struct.error, IndexError)):
+                Stat.from_bytes(broken)
+
+    def test_dir_entries(self) -> None:
+        stats: list[Stat] = [sample(i) for i in range(5)]
+        data: bytes = b''.join(stat.to_bytes() for stat in stats)
+        entries: list[DirEntry] = list(DirEntry.iter_bytes(data))
+        self.assertEqual([entry.name for entry in entries],
+                         [stat.name for stat in stats])
+        for entry, expected in zip(entries, stats):
+            self.assertEqual(entry.length, expected.length)
+            self.assertSame(entry.to_stat(), expected)
+
+    def test_dir_entries_share_the_chunk(self) -> None:
+        stats: list[Stat] = [sample(i) for i in range(3)]
+        data = memoryview(bytearray(
+            b''.join(stat.to_bytes() for stat in stats)))
+        entries: list[DirEntry] = list(DirEntry.iter_bytes(data))
+        self.assertTrue(all(entry.data is data for entry in entries))
+        self.assertEqual(entries[0].offset, 0)
+        self.assertEqual(entries[1].offset, len(stats[0].to_bytes()))
+        for entry, expected in zip(entries, stats):
+            self.assertEqual(
+                (entry.name, entry.uid, entry.gid, entry.muid),
+                (expected.name, expected.uid, expected.gid, expected.muid),
+            )
+            self.assertSame(entry.to_stat(), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()